@@ -0,0 +1,181 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batch prompt mode: run every prompt of a JSONL file on the selected images.
+
+Each line of the prompt file is a JSON object with a "prompt" and optional
+per-prompt overrides ("seed", "steps", "temperature", "top_p",
+"system_prompt") of the run flags; a line may also be a plain JSON string.
+Prompts run in warm containers (see pool.py), so a batch starts one
+container per image instead of one per prompt; the reference and native
+pseudo-images run on the host. Results are appended to the
+output JSONL as soon as each run finishes, and (prompt index, image) pairs
+that already succeeded in the output file are skipped, so an interrupted
+batch resumes where it stopped and retries the runs that failed.
+"""
+
+import json
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .native import is_native, run_native
+from .pool import get_warm_container, run_warm
+from .reference import is_reference, run_reference
+
+# Prompt record key -> inference flag
+OVERRIDE_FLAGS = {
+    "prompt": "-i",
+    "seed": "-s",
+    "steps": "-n",
+    "temperature": "-t",
+    "top_p": "-p",
+    "system_prompt": "-y",
+}
+
+
+def read_prompts(path, offset=0):
+    """Yield (index, record) of every prompt in a JSONL file, from line `offset`."""
+    with open(path, encoding="utf-8") as f:
+        index = -1
+        for line in f:
+            if not line.strip():
+                continue
+            index += 1
+            if index < offset:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"prompt": record}
+            yield index, record
+
+
+def completed_runs(output_path):
+    """Get the (prompt index, image) pairs that succeeded in an output file."""
+    done = set()
+    try:
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record.get("error") is None and record.get("exit_code") == 0:
+                        done.add((record["index"], record["image"]))
+                except (ValueError, KeyError, AttributeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def prompt_run_flags(base_flags, record):
+    """Apply the overrides of a prompt record to the base run flags."""
+    tokens = shlex.split(base_flags)
+    options = dict(zip(tokens[::2], tokens[1::2]))
+
+    for key, flag in OVERRIDE_FLAGS.items():
+        if record.get(key) is not None:
+            options[flag] = str(record[key])
+
+    return " ".join(f"{flag} {shlex.quote(value)}" for flag, value in options.items()) + " "
+
+
+def run_batch(client, images, model_path, base_flags, prompts_path, output_path,
+              jobs=1, offset=0, idle_timeout=600, on_result=None, resources_path=None,
+              telemetry_interval=None, token_counter=None):
+    """Run every prompt of a prompt file on every image.
+
+    Args:
+        client (docker.DockerClient): Docker client to use.
+        images (list): Image tags to run.
+        model_path (str): Absolute path of the model.
+        base_flags (str): Run flags shared by all prompts.
+        prompts_path (str): JSONL prompt file.
+        output_path (str): JSONL file results are appended to.
+        jobs (int): Max number of prompts running at the same time.
+        offset (int): Index of the first prompt to run.
+        idle_timeout (int): Idle timeout of the warm containers.
+        on_result (callable): Called with the result dict of every finished run.
+        resources_path (str): Resources directory of the reference and native
+            pseudo-images.
+        telemetry_interval (float): Sample the resources of each run every this
+            many seconds (see run_warm), None to not sample.
+        token_counter (TokenCounter): Counts the generated tokens of each run
+            (see runner.TokenTimer), None to count output chunks.
+    Returns:
+        tuple: (number of runs finished, number of runs failed).
+    """
+    done = completed_runs(output_path)
+    # Start the warm containers first, so concurrent runs don't each start one.
+    for tag in images:
+        if not is_reference(tag) and not is_native(tag):
+            get_warm_container(client, tag, model_path, idle_timeout)
+
+    write_lock = threading.Lock()
+    finished = 0
+    failed = 0
+
+    def run_one(index, record, tag):
+        run_flags = prompt_run_flags(base_flags, record)
+        try:
+            if is_reference(tag):
+                result = run_reference(tag, model_path, run_flags, echo=False, resources_path=resources_path)
+            elif is_native(tag):
+                result = run_native(tag, model_path, run_flags, echo=False, telemetry_interval=telemetry_interval,
+                                    token_counter=token_counter, resources_path=resources_path)
+            else:
+                result = run_warm(client, tag, model_path, run_flags, echo=False, idle_timeout=idle_timeout,
+                                  telemetry_interval=telemetry_interval, token_counter=token_counter)
+        except Exception as e:
+            result = {"image": tag, "exit_code": None, "error": str(e) or type(e).__name__}
+        if on_result is not None:
+            try:
+                on_result(result)
+            except Exception as e:
+                # the row is written as failed, so running the batch again retries it
+                result["error"] = f"on_result: {str(e) or type(e).__name__}"
+        result.pop("output", None)
+        result.pop("model", None)
+        result.update({"index": index, "id": record.get("id"), "image": tag, "prompt": record.get("prompt")})
+
+        with write_lock:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+        return result["exit_code"] == 0 and result.get("error") is None
+
+    def pending_runs():
+        for index, record in read_prompts(prompts_path, offset):
+            for tag in images:
+                if (index, tag) not in done:
+                    yield index, record, tag
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        # Keep a bounded number of runs in flight, the prompt file is read lazily.
+        in_flight = set()
+        for run in pending_runs():
+            if len(in_flight) >= 2 * max(1, jobs):
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finished += 1
+                    failed += not future.result()
+                print(f"Running prompts...[{finished} finished, {failed} failed]", end="\r")
+            in_flight.add(executor.submit(run_one, *run))
+
+        for future in in_flight:
+            finished += 1
+            failed += not future.result()
+    print(f"Running prompts...[{finished} finished, {failed} failed]")
+
+    return finished, failed
@@ -0,0 +1,146 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Aggregate benchmark runs into comparison tables and JSON reports."""
+
+import json
+import os
+import platform
+import statistics
+import time
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def _stdev(values):
+    values = [v for v in values if v is not None]
+    return statistics.stdev(values) if len(values) > 1 else 0.0
+
+
+def _fmt(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def _ms(value):
+    return None if value is None else value * 1000
+
+
+def _ms_pair(a, b):
+    return f"{_fmt(_ms(a), 1)}/{_fmt(_ms(b), 1)}"
+
+
+def _weights_bandwidth(tok_s, size):
+    return None if tok_s is None or size is None else tok_s * size / 1e9
+
+
+def _tokens(runs):
+    # runs of a group share their prompt, but may stop after different numbers of tokens
+    counts = [(r["prompt_tokens"], r["generated_tokens"]) for r in runs if r.get("generated_tokens") is not None]
+    return f"{counts[0][0]}/{round(_mean([gen for _, gen in counts]))}" if counts else "-"
+
+
+def _memory_columns(runs, tok_s):
+    peak = _mean([r.get("peak_memory") for r in runs])
+    return {"CPU (cores)": _mean([r.get("cpu_util") for r in runs]),
+            "Peak RSS (MiB)": None if peak is None else peak / 1024 ** 2,
+            "tok/s per GiB": None if peak is None or tok_s is None else tok_s / (peak / 1024 ** 3)}
+
+
+def summarize_results(results, model_bytes=None):
+    """Group runs by image, model and flags and rank the groups by throughput.
+
+    Model and flag columns are only shown if runs used more than one of them,
+    the profile and threads columns if runs used resource profiles or thread
+    counts, and the OOM column if runs were OOM-killed.
+
+    Args:
+        results (list): Result dicts returned by runner.run_container.
+        model_bytes (dict): Weight bytes of each model (see modelinfo.weight_bytes).
+            If given, the memory bandwidth used by decoding (weights read per
+            token times tok/s) is shown, which compares runs across models.
+    Returns:
+        list: One table row (dict) per group, fastest first.
+    """
+    groups = {}
+    for result in results:
+        key = (result["image"], result["model"], result["flags"], result.get("profile"), result.get("threads"))
+        groups.setdefault(key, []).append(result)
+
+    show_model = len({key[1] for key in groups}) > 1
+    show_flags = len({key[2] for key in groups}) > 1
+    show_profile = any(key[3] for key in groups)
+    show_threads = any(key[4] for key in groups)
+    show_oom = any(r.get("oom_killed") for r in results)
+    show_tokens = any("generated_tokens" in r for r in results)
+    show_memory = any(r.get("peak_memory") is not None for r in results)
+
+    rows = []
+    for (image, model, flags, profile, threads), runs in groups.items():
+        ok_runs = [r for r in runs if r["exit_code"] == 0]
+        reported = _mean([r["reported_tok_s"] for r in ok_runs])
+        derived = _mean([r["tok_s"] for r in ok_runs])
+        row = {"Image": image}
+        if show_model:
+            row["Model"] = os.path.basename(model)
+        if show_flags:
+            row["Flags"] = flags
+        if show_profile:
+            row["Profile"] = profile or "-"
+        if show_threads:
+            row["Threads"] = threads or "-"
+        rows.append({**row,
+                     "Runs": f"{len(ok_runs)}/{len(runs)}",
+                     **({"OOM": sum(1 for r in runs if r.get("oom_killed"))} if show_oom else {}),
+                     "tok/s (reported)": reported,
+                     "tok/s (derived)": derived,
+                     "tok/s stdev": _stdev([r["tok_s"] for r in ok_runs]),
+                     "decode tok/s": _mean([r.get("decode_tok_s") for r in ok_runs]),
+                     **({"Tokens (prompt/gen)": _tokens(ok_runs)} if show_tokens else {}),
+                     **({"Weights GB/s": _weights_bandwidth(reported or derived, model_bytes.get(model))}
+                        if model_bytes else {}),
+                     **(_memory_columns(ok_runs, reported or derived) if show_memory else {}),
+                     "TTFT (ms)": _ms(_mean([r.get("ttft") for r in ok_runs])),
+                     "ITL p50/p99 (ms)": _ms_pair(_mean([r.get("itl_p50") for r in ok_runs]),
+                                                  _mean([r.get("itl_p99") for r in ok_runs])),
+                     "Wall time (s)": _mean([r["wall_time"] for r in ok_runs]),
+                     "Start overhead (s)": _mean([r["start_overhead"] for r in ok_runs])})
+
+    def throughput(row):
+        value = row["tok/s (reported)"] or row["tok/s (derived)"]
+        return value if value is not None else -1.0
+
+    rows.sort(key=throughput, reverse=True)
+    return [{k: _fmt(v) if v is None or isinstance(v, float) else v for k, v in row.items()}
+            for row in rows]
+
+
+def save_json(path, results):
+    """Write all runs and the host they ran on as JSON.
+
+    Args:
+        path (str): Output file.
+        results (list): Result dicts returned by runner.run_container.
+    """
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "host": {"platform": platform.platform(),
+                       "machine": platform.machine(),
+                       "processor": platform.processor()},
+              "runs": results}
+
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,293 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Build images from installed repositories.
+
+Each repository is built with the template of its language (see
+config.build_templates): a build stage that compiles the repository into
+/out, and a runtime stage with python3, the cli_run.py shim, the tokenizer
+and the built executables in /app/bin. The shim runs an executable with the
+model and the llama2.c-style flags of build_run_flags, like the cli_run.py
+of the prebuilt images.
+
+Builds run with BuildKit (`docker buildx build`). The executables are the
+last layer of the runtime stage, so the layers before it are shared by all
+images, and toolchain caches (cargo registry and target, Go modules and
+build cache) are cache mounts, so a change to one repository only recompiles
+that repository and rebuilds the last layer of its image.
+
+A template can be replaced by `<resources path>/llamaTemplates/<template>.Dockerfile`.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from . import config
+
+# Run the implementation built into the image: python3 cli_run.py run <model> [flags]
+CLI_RUN_SHIM = '''import glob
+import os
+import shlex
+import sys
+
+if len(sys.argv) < 3 or sys.argv[1] != "run":
+    sys.exit("usage: python3 cli_run.py run <model path> [-t <float>] [-p <float>] [-s <int>] [-n <int>] "
+             "[-i <string>] [-z <string>] [-m <string>] [-y <string>]")
+
+command = shlex.split(os.environ.get("LLAMADECK_RUN", ""))
+if not command:
+    command = sorted(path for path in glob.glob("/app/bin/*") if os.access(path, os.X_OK))
+    if len(command) != 1:
+        sys.exit("No single executable in /app/bin, set the run command of the repository: " + " ".join(command))
+command += sys.argv[2:]
+
+print("==> RUN COMMAND: " + " ".join(shlex.quote(arg) for arg in command), flush=True)
+os.execvp(command[0], command)
+'''
+
+RUNTIME_STAGE = """
+FROM debian:bookworm-slim
+RUN apt-get update && apt-get install -y --no-install-recommends python3 libgomp1 libgfortran5 \\
+    && rm -rf /var/lib/apt/lists/*
+WORKDIR /app
+COPY --from=llamadeck cli_run.py tokenizer.bin ./
+ENV PATH="/app/bin:$PATH"
+ARG RUN_COMMAND=""
+ENV LLAMADECK_RUN="$RUN_COMMAND"
+COPY --from=build /out/ /app/bin/
+"""
+
+# Build stages: compile the repository (the build context) into /out.
+BUILD_STAGES = {
+    "make": """# syntax=docker/dockerfile:1
+FROM debian:bookworm AS build
+RUN apt-get update && apt-get install -y --no-install-recommends build-essential gfortran \\
+    && rm -rf /var/lib/apt/lists/*
+WORKDIR /src
+COPY . .
+ARG BUILD_COMMAND
+ARG ARTIFACTS
+ARG OUT=/out
+RUN sh -c "$BUILD_COMMAND" && mkdir -p /out && cp $ARTIFACTS /out/
+""",
+    "cargo": """# syntax=docker/dockerfile:1
+FROM rust:1-bookworm AS build
+WORKDIR /src
+COPY . .
+ARG BUILD_COMMAND
+ARG REPO_ID
+ARG OUT=/out
+RUN --mount=type=cache,target=/usr/local/cargo/registry \\
+    --mount=type=cache,target=/cache/target \\
+    export CARGO_TARGET_DIR=/cache/target/$REPO_ID && sh -c "$BUILD_COMMAND" && mkdir -p /out \\
+    && find $CARGO_TARGET_DIR/release -maxdepth 1 -type f -perm -u+x -exec cp {} /out/ \\;
+""",
+    "go": """# syntax=docker/dockerfile:1
+FROM golang:1.22-bookworm AS build
+WORKDIR /src
+COPY . .
+ARG BUILD_COMMAND
+ARG OUT=/out
+RUN --mount=type=cache,target=/go/pkg/mod \\
+    --mount=type=cache,target=/root/.cache/go-build \\
+    mkdir -p /out && sh -c "$BUILD_COMMAND"
+""",
+}
+
+# Default build command and built executables of each template. Build
+# commands run in the repository, with $OUT set to the directory of the
+# executables (/out in images, see native.py for native builds).
+TEMPLATE_DEFAULTS = {
+    "make": {"command": "make runomp || make runfast || make run", "artifacts": "run"},
+    "cargo": {"command": "cargo build --release"},
+    "go": {"command": 'go build -o "$OUT"/ ./...'},
+}
+
+# Files of the repositories left out of the build context
+DOCKERIGNORE = ".git\n"
+
+
+def installed_repos(resources_path):
+    """Repositories installed by install_repo: `llamaRepos/<language>/<author>/<name>`.
+
+    Returns:
+        list: Rows (dicts) with language, name, author and path, plus the
+            "build" entry of the repository in the catalog, if any.
+    """
+    from .catalog import repo_catalog
+
+    catalog = repo_catalog(resources_path)
+    root = os.path.join(resources_path, "llamaRepos")
+    repos = []
+    for language in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        for author in sorted(os.listdir(os.path.join(root, language))):
+            for name in sorted(os.listdir(os.path.join(root, language, author))):
+                path = os.path.join(root, language, author, name)
+                if not os.path.isdir(path):
+                    continue
+                row = {"language": language, "name": name, "author": author, "path": path}
+                entry = catalog.get(name=name, author=author)
+                if entry and entry.get("build"):
+                    row["build"] = entry["build"]
+                repos.append(row)
+    return repos
+
+
+def repo_commit(path):
+    """Commit checked out in a repository, None if it is not a git repository."""
+    try:
+        return subprocess.run(["git", "-C", path, "rev-parse", "HEAD"], check=True, text=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def repo_id(repo):
+    """Name of a repository usable in image tags and paths, e.g. llama2.c_karpathy."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "-", f"{repo['name']}_{repo['author'].lstrip('@')}")
+
+
+def image_tag(repo):
+    """Tag of the image built from a repository."""
+    return f"{config.local_image_repo}:{repo_id(repo)}"
+
+
+def build_settings(repo):
+    """Template, build command, artifacts and run command of a repository.
+
+    Taken from the "build" entry of the repository in the catalog, else
+    the defaults of the template of its language.
+
+    Raises:
+        ValueError: If there is no template for the repository.
+    """
+    build = repo.get("build") or {}
+    template = build.get("template") or config.build_templates.get(repo["language"])
+    if not template:
+        raise ValueError(f"No build template for {repo['language']}")
+    defaults = TEMPLATE_DEFAULTS.get(template, {})
+    return {"template": template,
+            "command": build.get("command") or defaults.get("command", ""),
+            "artifacts": build.get("artifacts") or defaults.get("artifacts", ""),
+            "run": build.get("run", "")}
+
+
+def build_spec(repo, resources_path):
+    """Template, Dockerfile and build arguments of a repository.
+
+    Raises:
+        ValueError: If there is no template for the repository.
+    """
+    settings = build_settings(repo)
+    template = settings["template"]
+
+    custom_path = os.path.join(resources_path, "llamaTemplates", f"{template}.Dockerfile")
+    if os.path.exists(custom_path):
+        with open(custom_path) as f:
+            dockerfile = f.read()
+    elif template in BUILD_STAGES:
+        dockerfile = BUILD_STAGES[template] + RUNTIME_STAGE
+    else:
+        raise ValueError(f"No template {template}, add it as {custom_path}")
+
+    return {"template": template,
+            "dockerfile": dockerfile,
+            "build_args": {"BUILD_COMMAND": settings["command"],
+                           "ARTIFACTS": settings["artifacts"],
+                           "RUN_COMMAND": settings["run"],
+                           "REPO_ID": repo_id(repo)}}
+
+
+def build_image(repo, resources_path, tokenizer_path, no_cache=False):
+    """Build the image of an installed repository.
+
+    The Dockerfile, the shim and the tokenizer are written to
+    `<resources path>/llamaCache/build/<repo id>/`, which the Dockerfile
+    reads as the "llamadeck" build context, and the build output to its
+    build.log.
+
+    Args:
+        repo (dict): Installed repository (see installed_repos).
+        resources_path (str): Resources directory.
+        tokenizer_path (str): Tokenizer copied into the image.
+        no_cache (bool): Build without the layer cache.
+    Returns:
+        dict: Summary row of the build.
+    """
+    row = {"Name": repo["name"], "Author": repo["author"], "Image": image_tag(repo)}
+    try:
+        spec = build_spec(repo, resources_path)
+    except ValueError as e:
+        return dict(row, Status="no template", **{"Time (s)": None, "Log / Error": str(e)})
+
+    build_dir = os.path.join(resources_path, "llamaCache", "build", repo_id(repo))
+    os.makedirs(build_dir, exist_ok=True)
+    dockerfile = os.path.join(build_dir, "Dockerfile")
+    with open(dockerfile, "w") as f:
+        f.write(spec["dockerfile"])
+    with open(dockerfile + ".dockerignore", "w") as f:
+        f.write(DOCKERIGNORE)
+    with open(os.path.join(build_dir, "cli_run.py"), "w") as f:
+        f.write(CLI_RUN_SHIM)
+    shutil.copyfile(tokenizer_path, os.path.join(build_dir, "tokenizer.bin"))
+
+    command = ["docker", "buildx", "build", "--load", "-t", row["Image"], "-f", dockerfile,
+               "--build-context", f"llamadeck={build_dir}",
+               "--label", f"{config.image_support_label}=true",
+               "--label", f"org.llamadeck.repo={repo['language']}/{repo['author']}/{repo['name']}"]
+    commit = repo_commit(repo["path"])
+    if commit:
+        command += ["--label", f"org.opencontainers.image.revision={commit}"]
+    for name, value in spec["build_args"].items():
+        command += ["--build-arg", f"{name}={value}"]
+    if no_cache:
+        command.append("--no-cache")
+    command.append(repo["path"])
+
+    log_path = os.path.join(build_dir, "build.log")
+    t_begin = time.perf_counter()
+    try:
+        with open(log_path, "w") as log:
+            returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+    except OSError as e:
+        return dict(row, Status="failed", **{"Time (s)": None, "Log / Error": str(e)})
+    return dict(row, Status="built" if returncode == 0 else "failed",
+                **{"Time (s)": f"{time.perf_counter() - t_begin:.1f}", "Log / Error": log_path})
+
+
+def build_images(repos, resources_path, tokenizer_path, jobs=None, no_cache=False):
+    """Build the images of several repositories, `jobs` at a time.
+
+    Returns:
+        list: Summary rows (see build_image) in the order of `repos`.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    jobs = max(1, min(jobs or config.image_build_workers, len(repos)))
+    summary = [None] * len(repos)
+    finished = failed = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(build_image, repo, resources_path, tokenizer_path, no_cache): i
+                   for i, repo in enumerate(repos)}
+        for future in as_completed(futures):
+            summary[futures[future]] = future.result()
+            finished += 1
+            failed += summary[futures[future]]["Status"] != "built"
+            print(f"Building images...[{finished}/{len(repos)}] failed: {failed}", end="\r")
+    print()
+    return summary
@@ -0,0 +1,159 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Indexed catalogs of repositories, models and images.
+
+A Catalog keeps its rows (dicts) and, for each indexed field, a hash index
+from the normalized value (lower case, without a leading "@") to the rows
+that have it. Queries AND-combine constraints on several fields; each
+constraint is an exact value, a prefix ("llama2*") or a fuzzy value
+("~lama2"), and is answered from the index instead of scanning the rows.
+
+Besides config.repo_options and config.model_options, repositories and
+models are loaded from every JSON file in `<resources path>/llamaCatalog/`,
+e.g. {"repos": [{"language": ..., "name": ..., "url": ..., "author": ...}],
+"models": [{"Model": ..., "url": ...}]}.
+"""
+
+import bisect
+import difflib
+import glob
+import json
+import os
+from functools import lru_cache
+
+from . import config
+
+REPO_FIELDS = ["language", "name", "author"]
+MODEL_FIELDS = ["Model"]
+IMAGE_FIELDS = ["Tag", "Language", "Author"]
+
+
+def normalize(value):
+    """Key of a value in the indexes."""
+    return str(value).strip().lower().lstrip("@")
+
+
+class Catalog:
+    """Rows with hash indexes over some of their fields."""
+
+    def __init__(self, rows, fields):
+        self.rows = []
+        self.fields = list(fields)
+        self.indexes = {field: {} for field in self.fields}
+        self._sorted_keys = {}
+        for row in rows:
+            self.add(row)
+
+    @property
+    def columns(self):
+        """Keys of the rows, in the order they first appear."""
+        columns = {}
+        for row in self.rows:
+            columns.update(dict.fromkeys(row))
+        return list(columns)
+
+    def add(self, row):
+        """Add a row and index its fields."""
+        position = len(self.rows)
+        self.rows.append(row)
+        for field in self.fields:
+            if row.get(field) is not None:
+                self.indexes[field].setdefault(normalize(row[field]), []).append(position)
+        self._sorted_keys.clear()
+
+    def _matching_keys(self, field, value):
+        index = self.indexes[field]
+        value = str(value).strip()
+
+        if value.startswith("~"):
+            value = normalize(value[1:])
+            close = difflib.get_close_matches(value, list(index), n=len(index), cutoff=0.6)
+            return close + [key for key in index if value in key and key not in close]
+
+        if value.endswith("*"):
+            prefix = normalize(value[:-1])
+            if field not in self._sorted_keys:
+                self._sorted_keys[field] = sorted(index)
+            keys = self._sorted_keys[field]
+            start = bisect.bisect_left(keys, prefix)
+            end = start
+            while end < len(keys) and keys[end].startswith(prefix):
+                end += 1
+            return keys[start:end]
+
+        value = normalize(value)
+        return [value] if value in index else []
+
+    def query(self, **constraints):
+        """Get the rows matching all constraints.
+
+        Args:
+            **constraints: field=value, where value is an exact value, a
+                "prefix*" or a "~fuzzy" value (case-insensitive). None values
+                are ignored.
+        Returns:
+            list: Matching rows, in catalog order.
+        """
+        positions = None
+        for field, value in constraints.items():
+            if value is None:
+                continue
+            if field not in self.indexes:
+                raise ValueError(f"Field {field} is not indexed")
+
+            index = self.indexes[field]
+            matched = {position for key in self._matching_keys(field, value) for position in index[key]}
+            positions = matched if positions is None else positions & matched
+            if not positions:
+                return []
+
+        if positions is None:
+            return list(self.rows)
+        return [self.rows[position] for position in sorted(positions)]
+
+    def get(self, **constraints):
+        """Get the first row matching all constraints, None if no row matches."""
+        rows = self.query(**constraints)
+        return rows[0] if rows else None
+
+
+def load_catalog_files(resources_path, key):
+    """Get the rows under `key` ("repos" or "models") of the extra catalog files."""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(resources_path, "llamaCatalog", "*.json"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                rows.extend(json.load(f).get(key, []))
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Skipping catalog file {path}: {e}")
+    return rows
+
+
+@lru_cache(maxsize=None)
+def repo_catalog(resources_path):
+    """Catalog of repositories, indexed by language, name and author."""
+    return Catalog(config.repo_options + load_catalog_files(resources_path, "repos"), REPO_FIELDS)
+
+
+@lru_cache(maxsize=None)
+def model_catalog(resources_path):
+    """Catalog of models, indexed by name."""
+    return Catalog(config.model_options + load_catalog_files(resources_path, "models"), MODEL_FIELDS)
+
+
+def image_catalog(images):
+    """Catalog of image rows (see main.fetch_remote_image_info), indexed by tag, language and author."""
+    return Catalog(images, IMAGE_FIELDS)
@@ -19,8 +19,96 @@ default_tokenizer = "https://github.com/karpathy/llama2.c/raw/master/tokenizer.b
 
 image_repo = "https://registry.hub.docker.com/v2/repositories/bufan0222/ll_implements/tags"
 
+# Seconds the cached image list is used before it is revalidated with the registry.
+image_catalog_ttl = 3600
+
+# Images with this label are checked by the label instead of looking for
+# cli_run.py in the image ("true" if the image can be run by llama-deck).
+image_support_label = "org.llamadeck.supported"
+
+# Number of local images checked for llama-deck support at the same time.
+image_check_workers = 8
+
+# Number of images pulled at the same time by install_img.
+image_pull_workers = 3
+
+# Images built by build_img from installed repositories are tagged
+# <local_image_repo>:<name>_<author>.
+local_image_repo = "llamadeck/local"
+
+# Number of images built at the same time by build_img.
+image_build_workers = 2
+
+# Build template of each repository language (see build.py). Repositories of
+# other languages have no template unless they set their own template, build
+# and run commands with a "build" entry in the catalog, e.g.
+# {"template": "make", "command": "make runfast", "artifacts": "run"}.
+build_templates = {
+    "C": "make",
+    "C++": "make",
+    "Fortran": "make",
+    "Rust": "cargo",
+    "Go": "go",
+}
+
+# Seconds a warm container (run_img/bench --warm) keeps running without runs.
+warm_idle_timeout = 600
+
+# Seconds between resource samples (CPU, RSS, page faults, block I/O) of
+# running containers, 0 to not sample.
+telemetry_interval = 0.5
+
+# Where samples are read from: "cgroup" (the container's cgroup v2 files),
+# "docker" (Docker stats, about once a second) or "auto" (cgroup v2 if possible).
+telemetry_source = "auto"
+
+# Max points of the CPU/RSS time series saved with each run.
+telemetry_max_points = 120
+
+# Named resource limits for run_img/bench --profile, to emulate smaller devices:
+# CPUs (cpuset and CFS quota) and memory (without swap, e.g. "512m", "4g").
+resource_profiles = {
+    "1c-512m": {"cpus": 1, "memory": "512m"},
+    "2c-1g": {"cpus": 2, "memory": "1g"},
+    "4c-4g": {"cpus": 4, "memory": "4g"},
+    "8c-8g": {"cpus": 8, "memory": "8g"},
+}
+
+# Environment of runs with run_img/bench --threads: variables that set the
+# thread count of common runtimes ({threads} is replaced by the count).
+thread_environment = {
+    "OMP_NUM_THREADS": "{threads}",
+    "RAYON_NUM_THREADS": "{threads}",
+    "GOMAXPROCS": "{threads}",
+    "OPENBLAS_NUM_THREADS": "{threads}",
+    "MKL_NUM_THREADS": "{threads}",
+    "JULIA_NUM_THREADS": "{threads}",
+    "NUMBA_NUM_THREADS": "{threads}",
+    "DOTNET_PROCESSOR_COUNT": "{threads}",
+    "JAVA_TOOL_OPTIONS": "-XX:ActiveProcessorCount={threads} "
+                         "-Djava.util.concurrent.ForkJoinPool.common.parallelism={threads}",
+}
+
+# Parallel efficiency below which a thread count is reported as not scaling.
+scaling_min_efficiency = 0.5
+
 user_defined_resources_path = ""
 
+# Number of repositories cloned at the same time by install_repo.
+repo_install_workers = 8
+
+# Shallow/partial clone defaults for install_repo. Set depth to 0 to always
+# clone the full history. The partial clone filter (e.g. "blob:none") is only
+# used without depth: a shallow clone already fetches only the blobs of the
+# tip, and a filter would fetch them lazily in a second round trip.
+repo_clone_depth = 1
+repo_clone_filter = None
+
+# Number of models downloaded at the same time by install_model, and number of
+# parallel range requests used for each of them.
+download_workers = 4
+download_connections = 4
+
 repo_options = [
 
 {'language': 'C', 'name': 'llama2.c', 'url': 'https://github.com/karpathy/llama2.c', 'author': '@karpathy'} ,
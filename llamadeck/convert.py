@@ -0,0 +1,278 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Convert Meta-Llama checkpoints to llama2.c .bin models.
+
+Meta's download.sh gives a directory with params.json and model-parallel
+shards consolidated.00.pth, consolidated.01.pth, ... Each shard is a
+torch.save zip archive: a pickled state dict whose tensors point to raw,
+uncompressed storages in the archive. The pickle is read without torch and
+every storage is memory mapped, so tensors are only read when they are
+written out, a few rows at a time.
+
+The output is the legacy llama2.c format (what run.c and the images read),
+merging the shards like llama2.c's export.py: the token embedding, wo and
+w2 are split by columns across shards, the other matrices by rows, and the
+norm weights are replicated. The output file is allocated up front and
+every shard's part of a tensor is written at its own offset, so shards can
+be read in parallel.
+"""
+
+import glob
+import json
+import os
+import pickle
+import struct
+import zipfile
+
+# fp32 values converted at a time by a worker
+CHUNK_VALUES = 4 * 1024 * 1024
+DEFAULT_SEQ_LEN = 2048
+
+STORAGE_DTYPES = {"FloatStorage": "<f4", "HalfStorage": "<f2", "BFloat16Storage": "<u2"}
+
+# zip local file header: signature ... file name length, extra field length
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+
+class LazyTensor:
+    """A tensor of a torch.save archive, read from a memory map on demand."""
+
+    def __init__(self, storage, storage_offset, shape, stride):
+        self.storage = storage
+        self.storage_offset = storage_offset
+        self.shape = tuple(shape)
+        self.stride = tuple(stride)
+
+    def array(self):
+        """Memory mapped array of the tensor, in its stored dtype (bf16 as uint16)."""
+        import numpy as np
+
+        path, data_offset, dtype, numel = self.storage
+        data = np.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=(numel,))
+        return np.lib.stride_tricks.as_strided(data[self.storage_offset:], shape=self.shape,
+                                               strides=[s * data.itemsize for s in self.stride],
+                                               writeable=False)
+
+
+def to_fp32(values):
+    """Convert an array of fp32, fp16 or bf16 (as uint16) values to fp32."""
+    import numpy as np
+
+    if values.dtype == np.uint16:
+        return (values.astype(np.uint32) << 16).view(np.float32)
+    return values.astype(np.float32)
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """Unpickler of torch.save state dicts that maps storages instead of loading them."""
+
+    def __init__(self, file, path, archive, prefix):
+        super().__init__(file)
+        self.path = path
+        self.archive = archive
+        self.prefix = prefix
+
+    def find_class(self, module, name):
+        if (module, name) == ("collections", "OrderedDict"):
+            import collections
+            return collections.OrderedDict
+        if (module, name) == ("torch._utils", "_rebuild_tensor_v2"):
+            return lambda storage, offset, shape, stride, *args: LazyTensor(storage, offset, shape, stride)
+        if (module, name) == ("torch._utils", "_rebuild_parameter"):
+            return lambda tensor, *args: tensor
+        if module == "torch" and name in STORAGE_DTYPES:
+            return STORAGE_DTYPES[name]
+        raise pickle.UnpicklingError(f"Unsupported object in checkpoint: {module}.{name}")
+
+    def persistent_load(self, pid):
+        # ("storage", storage type, key, location, number of elements)
+        _, dtype, key, _, numel = pid
+        try:
+            info = self.archive.getinfo(f"{self.prefix}/data/{key}")
+        except KeyError:
+            raise ValueError(f"{self.path}: storage {key} is missing")
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{self.path}: storage {key} is compressed")
+        with open(self.path, "rb") as f:
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+        data_offset = info.header_offset + LOCAL_HEADER.size + header[-2] + header[-1]
+        return (self.path, data_offset, dtype, numel)
+
+
+def load_checkpoint(path):
+    """Read the state dict of a torch.save zip archive as LazyTensors.
+
+    Raises:
+        ValueError: If the file is not a zip checkpoint of fp32/fp16/bf16 tensors.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            pickle_name = next((name for name in archive.namelist() if name.endswith("/data.pkl")), None)
+            if pickle_name is None:
+                raise ValueError(f"{path} has no data.pkl")
+            with archive.open(pickle_name) as f:
+                return _CheckpointUnpickler(f, path, archive, pickle_name[:-len("/data.pkl")]).load()
+    except (zipfile.BadZipFile, pickle.UnpicklingError) as e:
+        raise ValueError(f"{path} is not a supported torch checkpoint: {e}")
+
+
+def find_shards(checkpoint_dir):
+    """consolidated.*.pth files of a checkpoint directory, in shard order."""
+    return sorted(glob.glob(os.path.join(checkpoint_dir, "consolidated.*.pth")))
+
+
+def _split_axis(name):
+    if name.startswith("tok_embeddings.") or name.endswith((".attention.wo.weight", ".feed_forward.w2.weight")):
+        return 1
+    return 0
+
+
+def _tensor_names(n_layers):
+    """State dict names of the legacy llama2.c weights, in file order (freq_cis excluded)."""
+    names = ["tok_embeddings.weight"]
+    for template in ("attention_norm", "attention.wq", "attention.wk", "attention.wv", "attention.wo",
+                     "ffn_norm", "feed_forward.w1", "feed_forward.w2", "feed_forward.w3"):
+        names += [f"layers.{layer}.{template}.weight" for layer in range(n_layers)]
+    return names + ["norm.weight"]
+
+
+def freq_cis(head_size, seq_len, theta=10000.0):
+    """cos and sin tables of the rotary embeddings, as written by llama2.c's export.py."""
+    import numpy as np
+
+    freqs = 1.0 / (theta ** (np.arange(0, head_size, 2)[:head_size // 2].astype(np.float32) / head_size))
+    angles = np.outer(np.arange(seq_len), freqs).astype(np.float32)
+    return np.cos(angles), np.sin(angles)
+
+
+def _write_part(out, part, row_offset, col_offset):
+    """Copy a shard's part of a tensor into its place in the output, a few rows at a time."""
+    values = part.array()
+    if values.ndim == 1:
+        out[:] = to_fp32(values)
+        return
+    rows, cols = values.shape
+    chunk_rows = max(1, CHUNK_VALUES // cols)
+    for start in range(0, rows, chunk_rows):
+        end = min(start + chunk_rows, rows)
+        out[row_offset + start:row_offset + end, col_offset:col_offset + cols] = to_fp32(values[start:end])
+
+
+def convert_meta_checkpoint(checkpoint_dir, output_path, seq_len=DEFAULT_SEQ_LEN, jobs=1, progress=None):
+    """Convert a Meta-Llama checkpoint directory to a legacy llama2.c model.
+
+    Args:
+        checkpoint_dir (str): Directory with params.json and consolidated.*.pth.
+        output_path (str): Model file to write.
+        seq_len (int): Max sequence length of the model header.
+        jobs (int): Shard parts read and converted at the same time.
+        progress (callable): Called with (done, total) parts.
+    Returns:
+        dict: Header of the written model.
+    Raises:
+        ImportError: If NumPy is not installed.
+        ValueError: If the directory is not a supported checkpoint.
+    """
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+
+    with open(os.path.join(checkpoint_dir, "params.json")) as f:
+        params = json.load(f)
+    shard_paths = find_shards(checkpoint_dir)
+    if not shard_paths:
+        raise ValueError(f"No consolidated.*.pth shard in {checkpoint_dir}")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        shards = list(pool.map(load_checkpoint, shard_paths))
+
+    n_layers, n_heads = params["n_layers"], params["n_heads"]
+    names = _tensor_names(n_layers)
+    if "output.weight" in shards[0]:
+        names.append("output.weight")
+    missing = [name for name in names if name not in shards[0]]
+    if missing:
+        raise ValueError(f"{shard_paths[0]} has no tensor {missing[0]}")
+
+    def merged_shape(name):
+        shape = list(shards[0][name].shape)
+        if len(shape) == 2 and len(shards) > 1:
+            shape[_split_axis(name)] = sum(shard[name].shape[_split_axis(name)] for shard in shards)
+        return tuple(shape)
+
+    vocab_size, dim = merged_shape("tok_embeddings.weight")
+    model_config = {"dim": dim,
+                    "hidden_dim": merged_shape("layers.0.feed_forward.w1.weight")[0],
+                    "n_layers": n_layers,
+                    "n_heads": n_heads,
+                    "n_kv_heads": params.get("n_kv_heads") or n_heads,
+                    "vocab_size": vocab_size,
+                    "seq_len": seq_len}
+    head_size = dim // n_heads
+    freq_cis_size = seq_len * (head_size // 2)
+
+    # output offsets (in fp32 values after the header) of every tensor
+    offsets = {}
+    total = 0
+    for name in names:
+        if name == "output.weight":
+            total += 2 * freq_cis_size
+        offsets[name] = total
+        total += int(np.prod(merged_shape(name)))
+    if "output.weight" not in offsets:
+        total += 2 * freq_cis_size
+
+    header = struct.pack("<7i", dim, model_config["hidden_dim"], n_layers, n_heads, model_config["n_kv_heads"],
+                         vocab_size if "output.weight" not in offsets else -vocab_size, seq_len)
+    tmp_path = output_path + ".part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.truncate(len(header) + 4 * total)
+        out = np.memmap(tmp_path, dtype="<f4", mode="r+", offset=len(header), shape=(total,))
+
+        freq_offset = offsets["norm.weight"] + dim
+        cos, sin = freq_cis(head_size, seq_len, params.get("rope_theta", 10000.0))
+        out[freq_offset:freq_offset + freq_cis_size] = cos.ravel()
+        out[freq_offset + freq_cis_size:freq_offset + 2 * freq_cis_size] = sin.ravel()
+
+        tasks = []
+        for name in names:
+            shape = merged_shape(name)
+            destination = out[offsets[name]:offsets[name] + int(np.prod(shape))].reshape(shape)
+            if len(shape) == 1:
+                tasks.append((destination, shards[0][name], 0, 0))
+                continue
+            position = 0
+            for shard in shards:
+                part = shard[name]
+                axis = _split_axis(name)
+                tasks.append((destination, part, position if axis == 0 else 0, position if axis == 1 else 0))
+                position += part.shape[axis]
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_write_part, *task) for task in tasks]
+            for done, future in enumerate(futures, 1):
+                future.result()
+                if progress:
+                    progress(done, len(futures))
+
+        out.flush()
+        del out
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return model_config
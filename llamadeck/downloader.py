@@ -0,0 +1,319 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resumable, multi-connection HTTP downloads.
+
+A file is downloaded into `<destination>.part`, split into byte ranges that
+are fetched in parallel. Finished bytes of every range are recorded in the
+sidecar `<destination>.part.json`, so an interrupted download continues from
+where it stopped. Bytes are recorded only once they are written out, and
+the `.part` file is synced before every save of the sidecar, so the sidecar
+never claims bytes that are not on disk. The `.part` file is renamed to `<destination>` only after
+all ranges are complete, so a file at `destination` is always complete.
+
+The SHA-256 of every file is computed while it is downloaded: bytes that
+continue the already hashed prefix are hashed as they arrive, and only the
+part of the file fetched out of order is read back from disk at the end.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+# Ranges smaller than this are not worth an extra connection.
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+# Write the sidecar state at most once per this many seconds per file.
+STATE_SAVE_INTERVAL = 1.0
+TIMEOUT = 30
+
+
+def remote_file_info(url):
+    """Get size and range support of a remote file.
+
+    Args:
+        url (str): URL of the file.
+    Returns:
+        tuple: (size in bytes or None, True if byte ranges are supported, ETag or None).
+    """
+    response = requests.head(url, allow_redirects=True, timeout=TIMEOUT)
+    response.raise_for_status()
+
+    size = response.headers.get("Content-Length")
+    size = int(size) if size is not None and response.headers.get("Content-Encoding") is None else None
+    accept_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    etag = response.headers.get("ETag")
+
+    return size, accept_ranges, etag
+
+
+def split_segments(size, connections):
+    """Split [0, size) into at most `connections` byte ranges.
+
+    Returns:
+        list: [start, end, done] for every range, `end` is inclusive.
+    """
+    count = max(1, min(connections, size // MIN_SEGMENT_SIZE or 1))
+    step = -(-size // count)
+
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+
+class _DownloadState:
+    """Progress of one file, shared by the threads downloading its ranges."""
+
+    def __init__(self, state_path, part_path, state):
+        self.state_path = state_path
+        self.part_path = part_path
+        self.state = state
+        self.lock = threading.Lock()
+        self.last_save = 0.0
+
+    def advance(self, segment, num_bytes):
+        with self.lock:
+            segment[2] += num_bytes
+            if time.monotonic() - self.last_save >= STATE_SAVE_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        # the ranges recorded below must be on disk before the sidecar says so
+        fd = os.open(self.part_path, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+        self.last_save = time.monotonic()
+
+
+class _PrefixHasher:
+    """Streaming SHA-256 of a file whose ranges arrive out of order."""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def update(self, offset, chunk):
+        with self.lock:
+            if offset == self.offset:
+                self.sha256.update(chunk)
+                self.offset += len(chunk)
+
+    def finish(self, path):
+        """Hash the rest of the downloaded file and return the hex digest."""
+        with open(path, "rb") as f:
+            f.seek(self.offset)
+            for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                self.sha256.update(block)
+        return self.sha256.hexdigest()
+
+
+def _load_state(state_path, part_path, url, size, etag):
+    """Load the sidecar state if it belongs to the same remote file."""
+    if not (os.path.exists(state_path) and os.path.exists(part_path)):
+        return None
+
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if state.get("url") != url or state.get("size") != size or state.get("etag") != etag:
+        return None
+
+    return state
+
+
+def _fetch_segment(url, part_path, segment, download_state, hasher, progress):
+    start, end, done = segment
+    if start + done > end:
+        return
+
+    headers = {"Range": f"bytes={start + done}-{end}"}
+    with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError(f"server ignored range request for {url}")
+
+        with open(part_path, "r+b") as f:
+            f.seek(start + done)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                f.flush()
+                hasher.update(start + segment[2], chunk)
+                download_state.advance(segment, len(chunk))
+                if progress:
+                    progress(len(chunk))
+
+    if segment[0] + segment[2] - 1 != end:
+        raise IOError(f"incomplete range {start}-{end} for {url}")
+
+
+def _fetch_whole(url, part_path, hasher, progress):
+    with requests.get(url, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        with open(part_path, "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                hasher.update(hasher.offset, chunk)
+                if progress:
+                    progress(len(chunk))
+
+
+def download_file(url, destination, connections=4, progress=None, on_size=None):
+    """Download a file with parallel range requests, resuming a previous attempt.
+
+    Args:
+        url (str): URL of the file.
+        destination (str): Path of the downloaded file.
+        connections (int): Max number of parallel range requests.
+        progress (callable): Called with the number of newly written bytes.
+        on_size (callable): Called once with (total size or None, bytes already downloaded).
+    Returns:
+        str: SHA-256 hex digest of the downloaded file.
+    """
+    part_path = destination + ".part"
+    state_path = destination + ".part.json"
+    hasher = _PrefixHasher()
+
+    size, accept_ranges, etag = remote_file_info(url)
+
+    if size is None or not accept_ranges or size == 0:
+        # No way to split or resume, fetch the file in one stream.
+        if on_size:
+            on_size(size, 0)
+        _fetch_whole(url, part_path, hasher, progress)
+    else:
+        state = _load_state(state_path, part_path, url, size, etag)
+        if state is None:
+            state = {"url": url, "size": size, "etag": etag,
+                     "segments": split_segments(size, connections)}
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+
+        download_state = _DownloadState(state_path, part_path, state)
+        download_state.save()
+
+        if on_size:
+            on_size(size, sum(segment[2] for segment in state["segments"]))
+
+        segments = state["segments"]
+        try:
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                futures = [executor.submit(_fetch_segment, url, part_path, segment, download_state, hasher, progress)
+                           for segment in segments]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            # Record the progress of every range, including the ones that failed.
+            download_state.save()
+
+    if size is not None and os.path.getsize(part_path) != size:
+        raise IOError(f"size mismatch for {url}")
+
+    sha256 = hasher.finish(part_path)
+    os.replace(part_path, destination)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+    return sha256
+
+
+class DownloadProgress:
+    """Aggregated single-line progress of several downloads."""
+
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.finished_files = 0
+        self.total_bytes = 0
+        self.done_bytes = 0
+        self.unknown_size = False
+        self.lock = threading.Lock()
+        self.last_print = 0.0
+
+    def add_size(self, size, already_done):
+        with self.lock:
+            if size is None:
+                self.unknown_size = True
+            else:
+                self.total_bytes += size
+            self.done_bytes += already_done
+
+    def advance(self, num_bytes):
+        with self.lock:
+            self.done_bytes += num_bytes
+            if time.monotonic() - self.last_print >= 0.2:
+                self._print()
+
+    def finish_file(self):
+        with self.lock:
+            self.finished_files += 1
+            self._print()
+
+    def _print(self):
+        done_mb = self.done_bytes / 1024 / 1024
+        if self.total_bytes and not self.unknown_size:
+            total = f"{done_mb:.1f}/{self.total_bytes / 1024 / 1024:.1f} MB"
+        else:
+            total = f"{done_mb:.1f} MB"
+        print(f"Downloading...[{self.finished_files}/{self.total_files} files] {total}   ", end="\r", flush=True)
+        self.last_print = time.monotonic()
+
+
+def download_files(jobs, max_workers=4, connections=4):
+    """Download several files at the same time.
+
+    Args:
+        jobs (list): (name, url, destination) of each file.
+        max_workers (int): Max number of files downloaded at the same time.
+        connections (int): Max number of range requests per file.
+    Returns:
+        dict: name -> (SHA-256 of the file or None, error message or None).
+    """
+    results = {}
+    if not jobs:
+        return results
+
+    progress = DownloadProgress(len(jobs))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = {executor.submit(download_file, url, destination, connections,
+                                   progress.advance, progress.add_size): name
+                   for name, url, destination in jobs}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = (future.result(), None)
+            except Exception as e:
+                results[name] = (None, str(e) or type(e).__name__)
+            progress.finish_file()
+
+    print()
+    return results
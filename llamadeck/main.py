@@ -15,44 +15,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
 import os
 import sys
 import subprocess
 import argparse
-import wget
-import docker
-from tabulate import tabulate
+import shutil
+import json
+import posixpath
+import struct
 from . import config
-from shlex import split as shlexSplit
+from .catalog import repo_catalog, model_catalog, image_catalog
+from shlex import split as shlexSplit, quote as shlexQuote
 
-# Access the 'options' dictionary from the config module
-repos = config.repo_options
-models = config.model_options
 default_tokenizer_url = config.default_tokenizer
 images_url = config.image_repo
 
-if config.user_defined_resources_path:
-    default_resources_path = config.user_defined_resources_path
-else:
-    default_resources_path = os.path.join(os.path.expanduser('~'),"LlamaDeckResources")
-
-def create_table_data(config,constrains=None):
-    table_data = [list(config[0].keys())]
-    row = 1
-    for c_row in config:
-        if constrains:
-            for k,i in constrains.items():
-                if c_row[k].lower() == i:
-                    table_data.append([row]+list(c_row.values()))
-                    row += 1
-        else:
-            table_data.append([row]+list(c_row.values()))
-            row += 1
+def get_resources_path():
+    """Get the resources directory, config.user_defined_resources_path or ~/LlamaDeckResources."""
+    if config.user_defined_resources_path:
+        return config.user_defined_resources_path
+    return os.path.join(os.path.expanduser('~'),"LlamaDeckResources")
+
+def create_table_data(rows,columns=None):
+    """Build table data: the header, then the values of each row numbered from 1.
+
+    Args:
+        rows (list): Rows (dicts) of the table.
+        columns (list): Header of the table, default the keys of the first row.
+    """
+    columns = columns or (list(rows[0].keys()) if rows else [])
+    table_data = [columns]
+    for row_number,row in enumerate(rows,1):
+        table_data.append([row_number]+[row.get(column) for column in columns])
 
     return table_data
 
 def show_table(table_data):
+    from tabulate import tabulate
 
     table = tabulate(table_data[1:],headers=table_data[0],tablefmt="pipe")
 
@@ -81,38 +80,60 @@ def run_sh(command):
     
     process.wait()
 
-def clone_repository(url, destination):
+def clone_repository(url, destination, depth=None, blob_filter=None):
     """Clone a Git repository.
 
     Args:
         url (str): URL of the Git repository.
         destination (str): Destination directory for cloning.
+        depth (int): Clone only the latest `depth` commits, None or 0 for full history.
+        blob_filter (str): Partial clone filter spec (e.g. "blob:none"), None to disable.
+    Returns:
+        tuple: (success, error message) of the clone.
     """
-    try:
-        subprocess.run(["git", "clone", url, destination], check=True)
-        print(f"Repository cloned successfully to {destination}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error cloning repository: {e}")
+    command = ["git", "clone", "--quiet"]
+    if depth:
+        command += ["--depth", str(depth)]
+    if blob_filter:
+        command += ["--filter=" + blob_filter]
+    command += [url, destination]
 
-def fetch_remote_image_info():
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return True, ""
+    except (subprocess.CalledProcessError, OSError) as e:
+        error_lines = (getattr(e, "stderr", None) or str(e)).strip().splitlines() or [str(e)]
+        fatal_lines = [line for line in error_lines if line.startswith("fatal:")]
+        return False, (fatal_lines or error_lines)[0]
+
+def fetch_remote_image_info(refresh=False):
     """Fetch image information from bufan0222/ll_implements.
 
+    The tag list is cached in the resources directory and revalidated
+    after config.image_catalog_ttl seconds.
+
+    Args:
+        refresh (bool): Revalidate the cached tag list now.
     Returns:
         list: A list of dictionaries containing image information.
     """
-    
-    response = requests.get(images_url)
-    data = response.json()  
+    from .registry import fetch_image_catalog
+
+    cache_path = os.path.join(get_resources_path(),"llamaCache","image_catalog.json")
+    results = fetch_image_catalog(images_url,
+                                  cache_path,
+                                  ttl=config.image_catalog_ttl,
+                                  refresh=refresh)
 
     images = []
 
-    for img_data in data["results"]:
+    for img_data in results:
         repo_name = img_data["name"].split("_")[0]
         author = img_data["name"].split("_")[1]
         
         row = {
             "Tag": img_data["name"],
-            "Language":get_img_language(repo_name),
+            "Language":get_img_language(repo_name,author),
             "Size": str(img_data["full_size"]/1024//1024)+" MB",
             "Author":"@"+author,
             "Repository": "https://github.com/"+author+"/"+repo_name,
@@ -167,20 +188,34 @@ def choose_options(max_option_num):
             print("Invalid input: ", c)
 
 
-def list_repos(language = None):
+def repo_table(language = None,name = None,author = None):
+    """Build the table data of the repositories matching all given fields.
+
+    Each field is an exact value, a "prefix*" or a "~fuzzy" value.
+    """
+    catalog = repo_catalog(get_resources_path())
+    return create_table_data(catalog.query(language=language,name=name,author=author),catalog.columns)
+
+def model_table(model_name = None):
+    """Build the table data of the models matching a name ("prefix*" and "~fuzzy" allowed)."""
+    catalog = model_catalog(get_resources_path())
+    return create_table_data(catalog.query(Model=model_name),catalog.columns)
+
+def image_table(images,image_tag = None,language = None,author = None):
+    """Build the table data of the images matching all given fields."""
+    catalog = image_catalog(images)
+    return create_table_data(catalog.query(Tag=image_tag,Language=language,Author=author),catalog.columns)
+
+def list_repos(language = None,name = None,author = None):
     """List repositories implemented in a given language.
 
     Args:
         language (str): The programming language to list repositories for.
+        name (str): The name of the repositories to list.
+        author (str): The author of the repositories to list.
     """
 
-    if language:
-        constrains = {"language":language.lower()}
-        repo_table_data = create_table_data(repos,constrains)
-    else:
-        repo_table_data = create_table_data(repos)
-
-    show_table(repo_table_data)
+    show_table(repo_table(language,name,author))
 
 def list_models(model_name = None):
     """List available models to install.
@@ -188,44 +223,33 @@ def list_models(model_name = None):
     Args:
         model_name (str): The name of the model to list.
     """
-    
 
-    if model_name:
-        constrains = {"Model":model_name.lower()}
-        model_table_data = create_table_data(models,constrains)
-    else:
-        model_table_data = create_table_data(models)
-        
-    show_table(model_table_data)
+    show_table(model_table(model_name))
 
-def list_images(image_tag = None,language = None):
+def list_images(image_tag = None,language = None,refresh = False,author = None):
     """List available images.
 
     Args:
         image_tag (str): The tag of the image to list.
+        refresh (bool): Revalidate the cached image list now.
+        author (str): The author of the repository inside image.
     """
-    images = fetch_remote_image_info()
+    images = fetch_remote_image_info(refresh)
 
-    constrains = {}
-    if image_tag != None:
-        constrains["Tag"] = image_tag.lower()
-    if language != None:
-        constrains["Language"] = language.lower()
-    
-    if len(constrains) != 0:
-        images_table_data = create_table_data(images,constrains)
-    else:
-        images_table_data = create_table_data(images)
-        
-    show_table(images_table_data)
+    show_table(image_table(images,image_tag,language,author))
 
-def install_repos(default_resources_path,language = None):
+def install_repos(default_resources_path,language = None,jobs = None,full_clone = False,name = None,author = None):
     """Install repositories for a given language.
 
     Args:
         path (str): The path where repositories should be installed.
         language (str): The programming language to list repositories for.
+        name (str): The name of the repositories to list.
+        author (str): The author of the repositories to list.
+        jobs (int): Max number of repositories cloned at the same time.
+        full_clone (bool): Clone full history instead of a shallow/partial clone.
     """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
     resources_path = (
         input(f"Enter the destination directory \n(press enter to using default: {default_resources_path}): "
@@ -233,16 +257,11 @@ def install_repos(default_resources_path,language = None):
             or default_resources_path
         )
     
-    if language:
-        constrains = {"language":language.lower()}
-        repo_table_data = create_table_data(repos,constrains)
-    else:
-        repo_table_data = create_table_data(repos)
-    
+    repo_table_data = repo_table(language,name,author)
     show_table(repo_table_data)
 
     if len(repo_table_data) == 1:
-        print("No repository implemented in:",language)
+        print("No repository found.")
         return
 
     all_selected_idx = choose_options(len(repo_table_data))
@@ -250,7 +269,13 @@ def install_repos(default_resources_path,language = None):
         print("Exit repo install.")
         return
 
-    for idx in all_selected_idx:
+    depth = None if full_clone else config.repo_clone_depth
+    blob_filter = None if full_clone or depth else config.repo_clone_filter
+    jobs = jobs or config.repo_install_workers
+
+    summary = {}
+    to_clone = {}
+    for idx in dict.fromkeys(all_selected_idx):
         selected_repo = repo_table_data[idx]
 
         lang, name, url, author = selected_repo[1], selected_repo[2], selected_repo[3], selected_repo[4]
@@ -259,21 +284,53 @@ def install_repos(default_resources_path,language = None):
             resources_path, "llamaRepos", lang, author, name
         )
 
-        print("==>installing repo from row",str(idx))
-        print("destination:",destination)
-
         try:
             """check if repo is exist"""
             os.makedirs(destination, exist_ok=False)
-            clone_repository(url, destination)
-            print("Finished. \n")
+            to_clone[idx] = (url, destination)
         except OSError as e:
             if e.errno == 17:
-                print(destination,"already exist.\n")
+                summary[idx] = ("already exist", destination)
+            else:
+                summary[idx] = ("failed", str(e))
+
+    total = len(to_clone)
+    finished = 0
+    failed = 0
+    if total:
+        print(f"==>installing {total} repositories with {min(jobs, total)} workers")
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, total or 1))) as executor:
+        futures = {executor.submit(clone_repository, url, destination, depth, blob_filter): idx
+                   for idx, (url, destination) in to_clone.items()}
+
+        for future in as_completed(futures):
+            idx = futures[future]
+            destination = to_clone[idx][1]
+            ok, error = future.result()
+            finished += 1
+            if ok:
+                summary[idx] = ("installed", destination)
             else:
-                print(e)
+                failed += 1
+                shutil.rmtree(destination, ignore_errors=True)
+                summary[idx] = ("failed", error)
+            print(f"Cloning repositories...[{finished}/{total}] failed: {failed}",end="\r")
 
-    print("All selected repositories installed.")
+    print()
+    summary_data = []
+    for idx in dict.fromkeys(all_selected_idx):
+        status, detail = summary[idx]
+        summary_data.append({"Row":idx,
+                             "Name":repo_table_data[idx][2],
+                             "Author":repo_table_data[idx][4],
+                             "Status":status,
+                             "Destination / Error":detail})
+    show_table(create_table_data(summary_data))
+
+    if failed:
+        print(f"{failed} of {len(summary_data)} selected repositories failed to install.")
+    else:
+        print("All selected repositories installed.")
     
 
 def install_models(default_resources_path,model_name=None):
@@ -294,12 +351,7 @@ def install_models(default_resources_path,model_name=None):
     if not os.path.exists(destination):
         os.makedirs(destination)
 
-    if model_name:
-        constrains = {"Model":model_name.lower()}
-        model_table_data = create_table_data(models,constrains)
-    else:
-        model_table_data = create_table_data(models)
-
+    model_table_data = model_table(model_name)
     show_table(model_table_data)
 
     if len(model_table_data) == 1:
@@ -312,8 +364,9 @@ def install_models(default_resources_path,model_name=None):
         return
 
     meta_model_needed = False
+    download_jobs = []
 
-    for idx in all_selected_idx:
+    for idx in dict.fromkeys(all_selected_idx):
         selected_model = model_table_data[idx]
 
         model_name,url = selected_model[1],selected_model[2]
@@ -322,73 +375,191 @@ def install_models(default_resources_path,model_name=None):
             meta_model_needed = True
             continue
 
+        model_path = os.path.join(destination,model_name+".bin")
         print("==>installing model from row",str(idx))
-        print("destination:",os.path.join(destination,model_name+".bin"))
+        print("destination:",model_path)
 
-        
         """check if model is exist"""
-        if not os.path.exists(os.path.join(destination,model_name+".bin")):
-            download_and_configure_model(model_name,
-                                         url,
-                                         destination,
-                                         )
+        if not install_from_store(model_path,url):
+            download_jobs.append((model_name,url,model_path))
 
-        else:
-            print(os.path.join(destination,model_name+".bin"),"already exist.\n")
+    tokenizer_job = ask_tokenizer_install(resources_path)
+    if tokenizer_job:
+        download_jobs.append(tokenizer_job)
+
+    download_all(download_jobs)
 
     if meta_model_needed:
         install_meta_llama()
 
     print("All selected models installed.")
 
-    check_and_install_tokenizer(resources_path)
+def is_download_complete(path,url):
+    """Check if a downloaded file exists and has the same size as the remote one.
 
-def check_and_install_tokenizer(resources_path):
+    Files written by older versions may be partial, their size is compared with
+    the remote size. If the remote size cannot be fetched, the file is trusted.
+
+    Args:
+        path (str): Local path of the file.
+        url (str): URL the file was downloaded from.
+    """
+    from .downloader import remote_file_info
+
+    if not os.path.exists(path):
+        return False
+
+    try:
+        size = remote_file_info(url)[0]
+    except Exception:
+        return True
+
+    if size is not None and os.path.getsize(path) != size:
+        print(path,"is incomplete, it will be downloaded again.")
+        return False
+    return True
+
+def install_from_store(path,url):
+    """Install a model/tokenizer without downloading it, if possible.
+
+    The file is already installed if it is linked to its blob in the model
+    store. A URL downloaded before (into any resources path) is linked from
+    the store. Files installed by older versions are added to the store.
+
+    Args:
+        path (str): Destination file.
+        url (str): URL of the file.
+    Returns:
+        bool: True if the file is installed, False if it has to be downloaded.
+    """
+    from .store import ModelStore
+
+    store = ModelStore(get_resources_path())
+    sha256 = store.lookup_url(url)
+
+    if store.is_installed(path,sha256):
+        print(path,"already exist.\n")
+        return True
+
+    if sha256:
+        kind = store.link(sha256,path)
+        store.save()
+        print(f"{path} installed from model store ({kind}).\n")
+        return True
+
+    if is_download_complete(path,url):
+        store.adopt(path,url)
+        store.save()
+        print(path,"already exist.\n")
+        return True
+
+    return False
+
+def download_all(download_jobs):
+    """Download several models/tokenizers at the same time and report failures.
+
+    Downloaded files are added to the model store.
+
+    Args:
+        download_jobs (list): (name, url, destination file) of each download.
+    """
+    from .downloader import download_files
+    from .store import ModelStore
+
+    if not download_jobs:
+        return
+
+    print(f"\n==>downloading {len(download_jobs)} files")
+    results = download_files(download_jobs,
+                             max_workers=config.download_workers,
+                             connections=config.download_connections)
+
+    store = ModelStore(get_resources_path())
+    for name,url,path in download_jobs:
+        sha256,error = results[name]
+        if error is None:
+            store.add(path,sha256,url)
+            print(f"{name} downloaded successfully to {path}")
+        else:
+            print(f"Error downloading {name}: {error} (run again to resume)")
+    store.save()
+    print()
+
+def verify_models(full=False):
+    """Check installed models and tokenizers against the model store.
+
+    Args:
+        full (bool): Re-hash every file instead of only checking links and sizes.
+    """
+    from .store import ModelStore
+
+    store = ModelStore(get_resources_path())
+    results = store.verify(full)
+
+    if len(results) == 0:
+        print("No model installed in the model store:",store.root)
+        return
+
+    show_table(create_table_data(results))
+
+    bad = [r for r in results if r["Status"] != "ok"]
+    if bad:
+        print(f"{len(bad)} of {len(results)} entries failed verification. Run install_model to reinstall them.")
+    else:
+        print(f"All {len(results)} entries verified.")
+
+def ask_tokenizer_install(resources_path):
     """Ask user to download default tokenizer if no tokenizer exists.
 
     Args:
-        default_resources_path (str): specified resources path
+        resources_path (str): specified resources path
+    Returns:
+        tuple or None: download job of the tokenizer if user confirmed.
     """
     default_tokenizer_path = os.path.join(resources_path,"llamaTokenizers")
 
     if not os.path.exists(default_tokenizer_path):
-        os.mkdir(default_tokenizer_path)
+        os.makedirs(default_tokenizer_path)
 
-    if not os.path.exists(os.path.join(default_tokenizer_path,"tokenizer.bin")):
+    tokenizer_path = os.path.join(default_tokenizer_path,"tokenizer.bin")
+    if not install_from_store(tokenizer_path,default_tokenizer_url):
         print("\nNo tokenizer is detected in the default resources directory.")
         choice = input("Do you want to install the default tokenizer? [y to confirm]")
         if choice == 'y' or choice == "Y":
-            download_and_configure_model("tokenizer",
-                                         default_tokenizer_url,
-                                         default_tokenizer_path,
-                                         )
+            return ("tokenizer",default_tokenizer_url,tokenizer_path)
+    return None
 
-def install_images(image_tag = None,language = None):
+def check_and_install_tokenizer(resources_path):
+    """Ask user to download default tokenizer if no tokenizer exists.
+
+    Args:
+        default_resources_path (str): specified resources path
+    """
+    tokenizer_job = ask_tokenizer_install(resources_path)
+    if tokenizer_job:
+        download_all([tokenizer_job])
+
+def install_images(image_tag = None,language = None,refresh = False,jobs = None,author = None):
     """Install images.
 
     Args:
         image_tag (str): The tag of the image to install.
+        refresh (bool): Revalidate the cached image list now.
+        jobs (int): Max number of images pulled at the same time.
+        author (str): The author of the repository inside image.
     """
+    import docker
+    from .pull import pull_images
 
-    images = fetch_remote_image_info()
+    images = fetch_remote_image_info(refresh)
     img_repo = "bufan0222/ll_implements"
     client = docker.from_env()
 
-    constrains = {}
-    if image_tag != None:
-        constrains["Tag"] = image_tag.lower()
-    if language != None:
-        constrains["Language"] = language.lower()
-    
-    if len(constrains) != 0:
-        images_table_data = create_table_data(images,constrains)
-    else:
-        images_table_data = create_table_data(images)
-        
+    images_table_data = image_table(images,image_tag,language,author)
     show_table(images_table_data)
 
     if len(images_table_data) == 1:
-        print("Image tag not found:",image_tag)
+        print("No image found.")
         return
 
     all_selected_idx = choose_options(len(images_table_data))
@@ -396,50 +567,134 @@ def install_images(image_tag = None,language = None):
         print("Exit image install.")
         return
     
-    for idx in all_selected_idx:
+    local_tags = {tag for img in client.images.list() for tag in img.tags}
+
+    tags_to_pull = []
+    for idx in dict.fromkeys(all_selected_idx):
         selected_row = images_table_data[idx]
 
         selected_tag= img_repo+":"+selected_row[1]
 
-        print("\n==>installing image from row",str(idx))
+        if selected_tag in local_tags:
+            print("Image",selected_row[1],"already exist.")
+        else:
+            tags_to_pull.append(selected_tag)
 
-        local_images = client.images.list()
-        img_exist = False
-        for img in local_images:
-            if selected_tag in img.tags:
-                img_exist = True
-                break
+    if tags_to_pull:
+        jobs = jobs or config.image_pull_workers
+        print(f"\n==>installing {len(tags_to_pull)} images, {min(jobs, len(tags_to_pull))} at a time")
+        summary = pull_images(client, tags_to_pull, jobs)
+        show_table(create_table_data(summary))
 
-        if img_exist:
-            print("Image",selected_row[1],"already exist.\n")
-        else:
-            run_sh("docker pull "+selected_tag)
-                
+        failed = [row for row in summary if row["Status"] != "installed"]
+        if failed:
+            print(f"{len(failed)} of {len(summary)} images failed to install.")
+            return
 
     print("\n\nAll selected images installed.")
 
 
 
-def download_and_configure_model(model_name, model_url, destination):
-    """Download and configure a llama model.
+def build_images(language = None,name = None,author = None,jobs = None,no_cache = False,native = False):
+    """Build images from installed repositories (see build.py).
 
     Args:
-        model_name (str): Name of the llama model.
-        model_url (str): URL of the llama model.
-        destination_directory (str): Destination directory for the llama model.
+        language (str): The language of the repositories to build.
+        name (str): The name of the repositories to build.
+        author (str): The author of the repositories to build.
+        jobs (int): Max number of images built at the same time.
+        no_cache (bool): Build without the layer cache.
+        native (bool): Build the native pseudo-images instead (see native.py).
     """
+    from .build import installed_repos, build_spec, image_tag, build_images as run_builds
+    from .catalog import Catalog, REPO_FIELDS
+    from .native import native_tag
 
-    try:
-        # Download the model using wget
-        wget.download(model_url, out=destination)
-        print(f"\n{model_name} model downloaded successfully to {destination} \n")
+    if not native and shutil.which("docker") is None:
+        print("build_img needs the docker CLI with BuildKit (docker buildx).")
+        return
+
+    resources_path = get_resources_path()
+    repos = Catalog(installed_repos(resources_path),REPO_FIELDS).query(language=language,name=name,author=author)
+    if not repos:
+        print("No installed repository found, install repositories with install_repo first.")
+        return
+
+    rows = []
+    for repo in repos:
+        try:
+            template = build_spec(repo,resources_path)["template"]
+        except ValueError:
+            template = "-"
+        rows.append({"Language":repo["language"],"Name":repo["name"],"Author":repo["author"],
+                     "Template":template,"Image":native_tag(repo) if native else image_tag(repo)})
+    show_table(create_table_data(rows))
+
+    all_selected_idx = choose_options(len(rows) + 1)
+    if not all_selected_idx:
+        print("Exit image build.")
+        return
+
+    selected = [repos[idx - 1] for idx in dict.fromkeys(all_selected_idx)]
+    if native:
+        build_native_images([native_tag(repo) for repo in selected],rebuild=no_cache)
+        return
+
+    check_and_install_tokenizer(resources_path)
+    tokenizer_path = os.path.join(resources_path,"llamaTokenizers","tokenizer.bin")
+    if not os.path.exists(tokenizer_path):
+        print("Images need the tokenizer, build_img stopped.")
+        return
+
+    jobs = jobs or config.image_build_workers
+    print(f"\n==>building {len(selected)} images, {min(jobs, len(selected))} at a time")
+    summary = run_builds(selected,resources_path,tokenizer_path,jobs,no_cache)
+    show_table(create_table_data(summary))
+
+    failed = [row for row in summary if row["Status"] != "built"]
+    if failed:
+        print(f"{len(failed)} of {len(summary)} images failed to build, see their build logs.")
+    else:
+        print("All selected images built, run them with run_img or bench.")
+
+
+def build_native_images(images,rebuild=False):
+    """Build the native pseudo-images among `images` whose current version is not built yet.
+
+    Args:
+        images (list): Image tags that will run.
+        rebuild (bool): Build even if the current version is already built.
+    Returns:
+        bool: True if all of them are built.
+    """
+    from .native import is_native, find_repo, build_native
+
+    tags = [tag for tag in images if is_native(tag)]
+    if not tags:
+        return True
+
+    resources_path = get_resources_path()
+    check_and_install_tokenizer(resources_path)
+    tokenizer_path = os.path.join(resources_path,"llamaTokenizers","tokenizer.bin")
+    if not os.path.exists(tokenizer_path):
+        print("Native runs need the tokenizer.")
+        return False
 
-        # Add logic to configure the model if needed
+    ok = True
+    for tag in tags:
+        try:
+            print(f"Building {tag}...",end="\r")
+            directory,built = build_native(find_repo(tag,resources_path),resources_path,tokenizer_path,rebuild)
+            print(f"{tag} {'built' if built else 'is up to date'}: {directory}")
+        except ValueError as e:
+            print(e)
+            ok = False
+    return ok
 
-    except Exception as e:
-        print(f"Error downloading {model_name} model: {e}")
 
 def install_meta_llama():
+    import wget
+
     print("==> installing Meta-Llama")
     wget.download("https://raw.githubusercontent.com/meta-llama/llama/main/download.sh",out = ".")
     file_path = os.getcwd()+"/download.sh"
@@ -454,53 +709,165 @@ def install_meta_llama():
 
     os.remove("download.sh")
 
+    print("\nTo run a downloaded model, convert its directory to llama2.c format with:")
+    print("llama-deck convert_model <checkpoint_dir>")
     print("\n")
 
+def convert_models(checkpoint_dir,output_path=None,seq_len=None,jobs=None):
+    """Convert a Meta-Llama checkpoint (params.json + consolidated.*.pth) to a llama2.c model.
 
-def is_img_supported(tag):
-    """Check if an image supports this tool.
+    The converted model is added to the model store and its SHA-256 is printed.
 
     Args:
-        tag (str): The tag of the image.
+        checkpoint_dir (str): Checkpoint directory, e.g. llama-2-7b from download.sh.
+        output_path (str): Model file, default `<checkpoint_dir name>.bin` in llamaModels.
+        seq_len (int): Max sequence length of the model, default 2048.
+        jobs (int): Shard parts read at the same time, default 1.
     """
+    from .convert import convert_meta_checkpoint, DEFAULT_SEQ_LEN
+    from .modelinfo import format_bytes
+    from .store import ModelStore, sha256_file
 
-    client = docker.from_env()
+    if not output_path:
+        models_dir = os.path.join(get_resources_path(),"llamaModels")
+        os.makedirs(models_dir,exist_ok=True)
+        output_path = os.path.join(models_dir,os.path.basename(os.path.normpath(checkpoint_dir)) + ".bin")
+
+    def progress(done,total):
+        print(f"\rConverting...[{done}/{total}]",end="",flush=True)
 
+    print(f"Converting {checkpoint_dir} to {output_path}")
     try:
-        container = client.containers.run(tag, 
-                                        command="sh -c 'test -f cli_run.py && echo llama-deck supported. || echo not supported.'", 
-                                            remove=True, stdout=True)
-        output = container.decode('utf-8').strip()
-            
-        return "llama-deck supported." in output
-    
+        model_config = convert_meta_checkpoint(checkpoint_dir,output_path,seq_len or DEFAULT_SEQ_LEN,
+                                               jobs or 1,progress)
+    except ImportError:
+        print("convert_model needs NumPy, install it with: pip install llama-deck[models]")
+        return
+    except (OSError, ValueError, KeyError) as e:
+        print(f"\nCan't convert {checkpoint_dir}: {e}")
+        return
+    print()
+
+    sha256 = sha256_file(output_path)
+    store = ModelStore(get_resources_path())
+    store.add(output_path,sha256)
+    store.save()
+
+    print(", ".join(f"{key}: {value}" for key,value in model_config.items()))
+    print(f"Size: {format_bytes(os.path.getsize(output_path))}")
+    print("SHA-256:",sha256)
+    print("Converted model saved to:",os.path.abspath(output_path))
+
+
+def is_img_supported(image, client=None):
+    """Check if an image supports this tool, without running it.
+
+    Images labelled with config.image_support_label are checked by the label.
+    Otherwise the container filesystem is inspected for cli_run.py in the
+    image working directory; the container is created but never started.
+
+    Args:
+        image (docker.models.images.Image or str): The image or its tag.
+        client (docker.DockerClient): Docker client to use.
+    Returns:
+        bool or None: Whether the image is supported, None if it could not be checked.
+    """
+    import docker
+
+    client = client or docker.from_env()
+
+    try:
+        if isinstance(image, str):
+            image = client.images.get(image)
+
+        label = (image.labels or {}).get(config.image_support_label)
+        if label is not None:
+            return label.lower() in ("1", "true", "yes")
+
+        workdir = image.attrs["Config"].get("WorkingDir") or "/"
+        container = client.containers.create(image.id, command="true")
+        try:
+            container.get_archive(posixpath.join(workdir, "cli_run.py"))
+            return True
+        except docker.errors.NotFound:
+            return False
+        finally:
+            container.remove(force=True)
+
     except Exception:
-        return False
+        return None
 
-def get_img_language(repo_name):
-    for repo in repos:
-        if repo["name"] == repo_name:
-            return repo["language"]
-    return "Unknown"
+def find_supported_images(client, local_img):
+    """Check which local images support this tool.
+
+    Results are cached by image ID, which changes whenever the image content
+    changes, so every image is only checked once. Unchecked images are
+    checked in parallel.
+
+    Args:
+        client (docker.DockerClient): Docker client to use.
+        local_img (list): Local images to check.
+    Returns:
+        set: IDs of supported images.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    cache_path = os.path.join(get_resources_path(),"llamaCache","supported_images.json")
+    try:
+        with open(cache_path) as f:
+            supported = json.load(f)
+    except (OSError, ValueError):
+        supported = {}
+
+    unchecked = [image for image in local_img if image.id not in supported]
+    total_img = len(unchecked)
+    num = 0
+    if unchecked:
+        with ThreadPoolExecutor(max_workers=config.image_check_workers) as executor:
+            futures = {executor.submit(is_img_supported, image, client): image for image in unchecked}
+            for future in as_completed(futures):
+                num += 1
+                print(f"Finding supported images...[{num}/{total_img}]",end="\r")
+                result = future.result()
+                if result is not None:
+                    supported[futures[future].id] = result
+        print()
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump(supported, f)
+
+    return {image.id for image in local_img if supported.get(image.id)}
+
+def get_img_language(repo_name,author=None):
+    """Get the language of the repository an image is based on.
+
+    Args:
+        repo_name (str): Name of the repository.
+        author (str): Author of the repository, None to match any author.
+    """
+    catalog = repo_catalog(get_resources_path())
+    repo = catalog.get(name=repo_name,author=author) or catalog.get(name=repo_name)
+    return repo["language"] if repo else "Unknown"
 
 def select_img_to_run():
+    import docker
+    from .reference import REFERENCE_IMAGE, reference_available
+    from .build import installed_repos
+    from .native import native_tag, native_available
+
     client = docker.from_env()
-    local_img = client.images.list()
+    local_img = [image for image in client.images.list() if image.tags]
 
     local_img_data = []
 
-    total_img = len(local_img)
-    num = 0
+    supported_ids = find_supported_images(client, local_img)
     for image in local_img:
-        num += 1
-        print(f"Finding supported images...[{num}/{total_img}]",end="\r")
-        try:
-            repo,tag = image.tags[0].split(":")
-
-        except Exception:
-            continue
+        repo,tag = image.tags[0].rsplit(":",1)
 
-        if is_img_supported(image.tags[0]):
+        if image.id in supported_ids:
+            repo_name = tag
+            author = None
             try:
                 repo_name = tag.split("_")[0]
                 author = tag.split("_")[1]
@@ -508,9 +875,20 @@ def select_img_to_run():
             except Exception:
                 repo_url = "Unknown"
             local_img_data.append({"Installed images":f"{repo}:{tag}",
-                                   "Language":get_img_language(repo_name),
+                                   "Language":get_img_language(repo_name,author),
                                    "Based repository":repo_url})
 
+    if reference_available():
+        local_img_data.append({"Installed images":REFERENCE_IMAGE,
+                               "Language":"Python (NumPy)",
+                               "Based repository":"built-in reference of https://github.com/karpathy/llama2.c"})
+
+    for repo in installed_repos(get_resources_path()):
+        if native_available(repo):
+            local_img_data.append({"Installed images":native_tag(repo),
+                                   "Language":repo["language"],
+                                   "Based repository":f"native build of {repo['path']}"})
+
     if len(local_img_data) == 0:
         print("Please install images before run.")
         return None
@@ -534,7 +912,9 @@ def select_img_to_run():
     return selected_img
 
 def select_model_to_run():
-    model_path = os.path.join(default_resources_path,"llamaModels")
+    from .modelinfo import read_model_config, param_count, kv_cache_bytes, flops_per_token, format_count, format_bytes
+
+    model_path = os.path.join(get_resources_path(),"llamaModels")
 
     print(f"\nYou can simply choose installed model from default path: {model_path}")
     print("or specify the path to your own model.")
@@ -546,7 +926,8 @@ def select_model_to_run():
     no_model = False
     local_models = []
     try:
-        local_models = os.listdir(model_path)
+        local_models = [f for f in os.listdir(model_path)
+                        if not f.endswith((".part", ".part.json"))]
     except FileNotFoundError:
         no_model = True
     
@@ -564,7 +945,17 @@ def select_model_to_run():
     for model in local_models:
         dest = os.path.abspath(os.path.join(model_path,model))
         size = str(os.path.getsize(dest)/1024//1024) + " MB"
-        local_model_data.append({"Model":model,"Size":size,"From":dest})
+        row = {"Model":model,"Size":size,"From":dest}
+        try:
+            model_config = read_model_config(dest)
+            row.update({"Params":format_count(param_count(model_config)),
+                        "Layers":model_config["n_layers"],
+                        "dim":model_config["dim"],
+                        "KV cache":format_bytes(kv_cache_bytes(model_config)),
+                        "FLOPs/token":format_count(flops_per_token(model_config))})
+        except (OSError, ValueError):
+            row.update({"Params":"-","Layers":"-","dim":"-","KV cache":"-","FLOPs/token":"-"})
+        local_model_data.append(row)
     local_model_table = create_table_data(local_model_data)
     show_table(local_model_table)
 
@@ -582,6 +973,120 @@ def select_model_to_run():
         else:
             print("Only one model can be selected at a time!\n")
 
+def inspect_models(model_paths=None,seq_len=None,bandwidth=None):
+    """Show the architecture, memory and compute cost of llama2.c models.
+
+    Only the header of each model is read (memory mapped), not its weights.
+
+    Args:
+        model_paths (list): Model files, default all models in llamaModels.
+        seq_len (int): Sequence length of the KV-cache and FLOPs estimates,
+            default the model's.
+        bandwidth (float): Memory bandwidth in GB/s to estimate the max tok/s with.
+    """
+    from .modelinfo import read_model_config, model_summary, expected_tok_s
+
+    if not model_paths:
+        models_dir = os.path.join(get_resources_path(),"llamaModels")
+        try:
+            model_paths = sorted(os.path.join(models_dir,f) for f in os.listdir(models_dir)
+                                 if not f.endswith((".part", ".part.json")))
+        except FileNotFoundError:
+            model_paths = []
+        if len(model_paths) == 0:
+            print("No model found in:",models_dir)
+            return
+
+    rows = []
+    for path in model_paths:
+        row = {"Model":os.path.basename(path)}
+        try:
+            model_config = read_model_config(path)
+        except (OSError, ValueError) as e:
+            print(f"Can't inspect {path}: {e}")
+            continue
+        row.update(model_summary(model_config,seq_len))
+        if bandwidth:
+            row[f"Max tok/s @{bandwidth:g} GB/s"] = f"{expected_tok_s(model_config,bandwidth*1e9,seq_len=seq_len):.1f}"
+        rows.append(row)
+
+    if rows:
+        show_table(create_table_data(rows,list(rows[-1].keys())))
+
+def quantize_models(model_path,output_path=None,group_size=None):
+    """Quantize an fp32 model to group-wise int8 (llama2.c version 2 format).
+
+    Args:
+        model_path (str): Model file, or the name of an installed model.
+        output_path (str): Quantized model, default `<model>_q80.bin` in llamaModels.
+        group_size (int): Values per scale, default 64.
+    """
+    from .modelinfo import read_model_config, format_bytes
+    from .quantize import quantize_model, DEFAULT_GROUP_SIZE
+
+    models_dir = os.path.join(get_resources_path(),"llamaModels")
+    if not os.path.exists(model_path) and os.path.exists(os.path.join(models_dir,model_path)):
+        model_path = os.path.join(models_dir,model_path)
+    if not output_path:
+        os.makedirs(models_dir,exist_ok=True)
+        output_path = os.path.join(models_dir,os.path.splitext(os.path.basename(model_path))[0] + "_q80.bin")
+
+    print(f"Quantizing {model_path} to {output_path}")
+    try:
+        errors = quantize_model(model_path,output_path,group_size or DEFAULT_GROUP_SIZE)
+    except ImportError:
+        print("quantize_model needs NumPy, install it with: pip install llama-deck[models]")
+        return
+    except (OSError, ValueError) as e:
+        print(f"Can't quantize {model_path}: {e}")
+        return
+
+    show_table(create_table_data(errors))
+    source_size = os.path.getsize(model_path)
+    output_size = os.path.getsize(output_path)
+    print(f"\nGroup size: {read_model_config(output_path)['group_size']}")
+    print(f"Size: {format_bytes(source_size)} -> {format_bytes(output_size)} "
+          f"({source_size / output_size:.2f}x smaller)")
+    print("Quantized model saved to:",os.path.abspath(output_path))
+
+def generate_models(args):
+    """Write random-weight models of every combination of the given shapes into llamaModels.
+
+    Models that already exist are not written again: the same shape and
+    seed always give the same weights.
+    """
+    from .synthetic import model_configs, model_name, generate_model
+
+    try:
+        configs = model_configs(args.dim,args.n_layers,args.n_heads,args.n_kv_heads,args.hidden_dim,
+                                args.vocab_size,args.seq_len)
+    except ValueError as e:
+        print("Invalid model shape:",e)
+        return
+
+    models_dir = args.output_dir or os.path.join(get_resources_path(),"llamaModels")
+    os.makedirs(models_dir,exist_ok=True)
+    model_paths = []
+    for idx,model_config in enumerate(configs,1):
+        model_path = os.path.join(models_dir,model_name(model_config,args.seed))
+        model_paths.append(model_path)
+        if os.path.exists(model_path):
+            print(f"[{idx}/{len(configs)}] {model_path} exists")
+            continue
+        print(f"[{idx}/{len(configs)}] Generating {model_path}")
+        try:
+            generate_model(model_config,model_path,args.seed)
+        except ImportError:
+            print("gen_model needs NumPy, install it with: pip install llama-deck[models]")
+            return
+        except (OSError, ValueError) as e:
+            print(f"Can't generate {model_path}: {e}")
+            return
+
+    inspect_models(model_paths)
+    print("\nTo benchmark them, run:")
+    print("llama-deck bench --model_paths " + " ".join(model_paths))
+
 def ask_run_flags(parser):
     print("\n==> Set runnning parameters (Some implementations may not support all of them.)")
     while True:
@@ -616,41 +1121,46 @@ def ask_run_flags(parser):
             continue
 
             
-def build_run_flags(namespace):
+run_flag_options = {
+    "temperature": "-t",
+    "p_value": "-p",
+    "seed": "-s",
+    "steps": "-n",
+    "input_prompt": "-i",
+    "tokenizer_path": "-z",
+    "mode": "-m",
+    "system_prompt": "-y"
+}
 
-    flag_dict = {
-        "temperature": "-t",
-        "p_value": "-p",
-        "seed": "-s",
-        "steps": "-n",
-        "input_prompt": "-i",
-        "tokenizer_path": "-z",
-        "mode": "-m",
-        "system_prompt": "-y"
-    }
+def build_run_flags(namespace):
 
     flags = ""
     print("\n==> Selected run arguments:")
     for k,v in vars(namespace).items():
-        if v and k != "action":
+        if v and (k in run_flag_options or k in ("image_tag","model_path")):
             print(f"{k}: {v}")
 
             if "prompt" in k:
                 v = f"'{v}'"
-            if k in flag_dict:
-                flags += (f"{flag_dict[k]} {v} ")
+            if k in run_flag_options:
+                flags += (f"{run_flag_options[k]} {v} ")
 
     return flags
 
 
-def run_images(args,run_flag_parser):
-    """Run images with specified arguments.
+def select_run_config(args,run_flag_parser,ask_model=True,ask_flags=True):
+    """Select images, model and inference flags for a run.
+
+    Anything not given on the command line is asked interactively.
 
     Args:
         args: The arguments for running images.
         parser: The parser to handle arguments.
+        ask_model (bool): Select a model, otherwise the returned model path is None.
+        ask_flags (bool): Ask run flags if none is given on the command line.
+    Returns:
+        tuple or None: (image tags, model path, run flags), None if user exits.
     """
-    
 
     if args.image_tag is None:
         img_to_run = select_img_to_run()
@@ -658,45 +1168,639 @@ def run_images(args,run_flag_parser):
         img_to_run = [args.image_tag]
     
     if img_to_run == None:
-        print("Exit run images.")
-        return
-    
-    if args.model_path is None:
-        model_path = select_model_to_run()
-    else:
-        model_path = args.model_path
+        return None
+
+    model_path = None
+    if ask_model:
+        if args.model_path is None:
+            model_path = select_model_to_run()
+        else:
+            model_path = args.model_path
     
-    if model_path == None:
-        print("Exit run images.")
-        return
+        if model_path == None:
+            return None
+        model_path = os.path.abspath(model_path)
 
     run_flags = ""
     for k,v in vars(args).items():
-        if v and k != "action":
+        if v and (k in run_flag_options or k in ("image_tag","model_path")):
             run_flags = build_run_flags(args)
             break
     
-    if run_flags == "":
+    if run_flags == "" and ask_flags:
         run_flags = ask_run_flags(run_flag_parser)
+
+    return img_to_run, model_path, run_flags
+
+
+def run_images(args,run_flag_parser):
+    """Run images with specified arguments.
+
+    Args:
+        args: The arguments for running images.
+        parser: The parser to handle arguments.
+    """
+    from .runner import run_container, format_latency
+    from .pool import run_warm
+    from .reference import is_reference, run_reference
+    from .telemetry import format_telemetry
+    from .native import is_native, native_command, run_native
+    from . import profiles, scaling
+
+    if args.prompts and args.profile:
+        print("--prompts runs in warm containers, one per image and model, it can't be combined with --profile.")
+        return
+    if args.prompts and args.threads is not None:
+        print("--prompts runs in warm containers, one per image and model, it can't be combined with --threads.")
+        return
+    thread_counts = check_threads(args.threads,args.profile,args.warm)
+    if not check_profiles(args.profile,args.warm) or thread_counts is None:
+        return
+    run_config = select_run_config(args,run_flag_parser,ask_flags=not args.prompts)
+    if run_config == None:
+        print("Exit run images.")
+        return
+    img_to_run, model_path, run_flags = run_config
+
+    if not build_native_images(img_to_run):
+        return
+
+    if args.prompts:
+        run_prompt_file(args,img_to_run,model_path,run_flags)
+        return
     
-    for tag in img_to_run:
-        inside_command = "python3 cli_run.py run /models/model.bin " + run_flags
-        run_img_command = f'''docker run -it --rm -v {model_path}:/models/model.bin {tag} /bin/sh -c "{inside_command}"'''
-        
-        print(f"\n\nRunning {tag}...")
+    # Chat mode needs the terminal for input, other runs are streamed and timed.
+    interactive = "-m chat" in run_flags
+    client = None if interactive else docker_client(img_to_run)
+    if interactive and args.warm:
+        print("Chat mode is interactive, warm containers are not used.")
+
+    if not interactive:
+        token_counter = get_token_counter()
+        if token_counter:
+            check_run_steps(token_counter,[model_path],[run_flags])
+        record = start_results_session(client,img_to_run,[model_path],token_counter)
+
+    results = []
+    for tag,profile,threads in [(tag,profile,threads) for tag in img_to_run
+                                for profile in (args.profile or [None])
+                                for threads in ([None] if is_reference(tag) else thread_counts)]:
+        try:
+            options = {}
+            if profile and is_native(tag):
+                raise ValueError(f"Resource profiles need containers, {tag} runs without profile {profile}.")
+            if profile and not is_reference(tag):
+                options = profiles.container_options(profile)
+            elif threads:
+                options = scaling.container_options(threads)
+        except ValueError as e:
+            print(e)
+            continue
+        print(f"\n\nRunning {tag}{f' with resource profile {profile}' if profile else ''}"
+              f"{f' with {threads} threads' if threads else ''}...")
         print(f"\n##################stdout from {tag} ####################")
-        run_sh(run_img_command)
+        if interactive and is_reference(tag):
+            print("The reference implementation does not support chat mode.")
+        elif interactive and is_native(tag):
+            command,directory = native_command(tag,get_resources_path(),model_path,run_flags)
+            subprocess.run(command,cwd=directory,env=dict(os.environ,**options.get("environment",{})))
+        elif interactive:
+            inside_command = "python3 cli_run.py run /models/model.bin " + run_flags
+            limits = ""
+            if profile and options:
+                limits = (f"--cpuset-cpus {options['cpuset_cpus']} --cpus {options['nano_cpus'] / 1e9:g} "
+                          f"--memory {options['mem_limit']} --memory-swap {options['memswap_limit']} ")
+            elif threads and options:
+                limits = f"--cpuset-cpus {options['cpuset_cpus']} " + "".join(
+                    f"-e {shlexQuote(f'{name}={value}')} " for name,value in options["environment"].items())
+            run_img_command = f'''docker run -it --rm {limits}-v {model_path}:/models/model.bin {tag} /bin/sh -c "{inside_command}"'''
+            run_sh(run_img_command)
+        elif is_reference(tag):
+            result = run_reference(tag,model_path,run_flags,resources_path=get_resources_path())
+            record(result)
+            print(f"\n==> {tag}: {format_latency(result)}")
+        elif is_native(tag):
+            result = run_native(tag,model_path,run_flags,telemetry_interval=args.telemetry_interval,
+                                token_counter=token_counter,resources_path=get_resources_path(),**options)
+            result["threads"] = threads
+            record(result)
+            print(f"\n==> {tag} (native): {format_latency(result)}")
+        elif args.warm:
+            result = run_warm(client,tag,model_path,run_flags,idle_timeout=config.warm_idle_timeout,
+                              telemetry_interval=args.telemetry_interval,token_counter=token_counter)
+            record(result)
+            print(f"\n==> {tag} ({'warm' if result['warm'] else 'new'} container): {format_latency(result)}")
+        else:
+            result = run_container(client,tag,model_path,run_flags,telemetry_interval=args.telemetry_interval,
+                                   token_counter=token_counter,**options)
+            result["profile"] = profile
+            result["threads"] = threads
+            record(result)
+            print(f"\n==> {tag}: {format_latency(result)}")
+        if not interactive:
+            results.append(result)
+        if not interactive and format_telemetry(result):
+            print(f"==> {tag}: {format_telemetry(result)}")
+        if not interactive and result.get("oom_killed"):
+            print(f"==> {tag} was OOM-killed{f' under resource profile {profile}' if profile else ''}.")
         print("#####################################################################\n")
-    
+
+    if not interactive and len(thread_counts) > 1:
+        print("\n==> Thread scaling:")
+        show_table(create_table_data(scaling.scaling_rows(results)))
     print("All images finished.")
 
 
-def main():
-    """Main function to handle Llama Deck operations."""
+def run_prompt_file(args,img_to_run,model_path,run_flags):
+    """Run every prompt of a JSONL prompt file on the selected images.
 
-    parser = argparse.ArgumentParser(
-        description="Llama Deck: Manage and run multi llama implementations.",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,  # Show default values in the help menu
+    Args:
+        args: The arguments for running images, with prompts, output, jobs and offset.
+        img_to_run (list): Image tags to run.
+        model_path (str): Absolute path of the model.
+        run_flags (str): Run flags shared by all prompts.
+    """
+    import threading
+    from .batch import run_batch
+
+    if "-m chat" in run_flags:
+        print("Chat mode is interactive and can't be used with a prompt file.")
+        return
+
+    output_path = args.output or os.path.splitext(args.prompts)[0] + ".results.jsonl"
+    print(f"\n==> Running prompts from {args.prompts} on {len(img_to_run)} images")
+    print("Results are appended to:",os.path.abspath(output_path))
+
+    # Prompts are tokenized as the batch reaches them, the prompt file is never loaded whole
+    token_counter = get_token_counter()
+    client = docker_client(img_to_run)
+    record = start_results_session(client,img_to_run,[model_path],token_counter)
+    total_tokens = [0]
+    count_lock = threading.Lock()
+
+    def on_result(result):
+        record(result)
+        with count_lock:
+            total_tokens[0] += result.get("prompt_tokens") or 0
+
+    finished, failed = run_batch(client,img_to_run,model_path,run_flags,
+                                 args.prompts,output_path,
+                                 jobs=args.jobs or 1,
+                                 offset=args.offset or 0,
+                                 idle_timeout=config.warm_idle_timeout,
+                                 on_result=on_result,
+                                 resources_path=get_resources_path(),
+                                 telemetry_interval=args.telemetry_interval,
+                                 token_counter=token_counter)
+    if token_counter:
+        print(f"{total_tokens[0]} prompt tokens in {finished} runs")
+
+    if failed:
+        print(f"{failed} of {finished} runs failed, see the exit_code/error fields in the results.")
+    else:
+        print(f"All {finished} runs finished.")
+
+
+def bench_images(args,run_flag_parser):
+    """Benchmark images: run each of them and compare their throughput.
+
+    Every combination of the selected images, models (--model_paths) and
+    flag sets (--flag_sets) is run --repeat times. With --jobs > 1, runs
+    are executed concurrently, each pinned to its own CPUs.
+
+    Args:
+        args: The arguments for running images, plus the bench options.
+        parser: The parser to handle arguments.
+    """
+    from .scheduler import make_slots, run_matrix
+    from .bench import summarize_results, save_json
+    from .modelinfo import read_model_config, weight_bytes
+    from .profiles import profile_cpus
+    from .scaling import scaling_rows
+    from .reference import is_reference
+
+    thread_counts = check_threads(args.threads,args.profile,args.warm)
+    if not check_profiles(args.profile,args.warm) or thread_counts is None:
+        return
+    run_config = select_run_config(args,run_flag_parser,
+                                   ask_model=not args.model_paths,
+                                   ask_flags=not args.flag_sets)
+    if run_config == None:
+        print("Exit bench.")
+        return
+    img_to_run, model_path, run_flags = run_config
+
+    model_paths = [os.path.abspath(p) for p in args.model_paths] if args.model_paths else [model_path]
+
+    flag_sets = [run_flags]
+    if args.flag_sets:
+        flag_sets = []
+        for flag_str in args.flag_sets:
+            try:
+                flag_sets.append(build_run_flags(run_flag_parser.parse_args(shlexSplit(flag_str))))
+            except SystemExit:
+                print("Invalid flag set:",flag_str)
+                return
+
+    if any("-m chat" in flags for flags in flag_sets):
+        print("Chat mode is interactive and can't be benchmarked.")
+        return
+
+    if not build_native_images(img_to_run):
+        return
+
+    repeat = args.repeat or 1
+    profiles = args.profile or [None]
+    runs = [(tag,model,flags,profile,threads)
+            for tag in img_to_run
+            for model in model_paths
+            for flags in flag_sets
+            for profile in profiles
+            for threads in ([None] if is_reference(tag) else thread_counts)
+            for _ in range(repeat)]
+
+    jobs = args.jobs or 1
+    if args.warm and (jobs > 1 or args.cpus_per_run or args.timeout):
+        print("--warm runs share one container per image and model, "
+              "it can't be combined with --jobs, --cpus_per_run or --timeout.")
+        return
+
+    if jobs > 1 or args.cpus_per_run or args.profile or args.threads is not None:
+        # with resource profiles or threads, each slot holds the CPUs of the largest profile or thread count
+        cpus_per_run = args.cpus_per_run
+        if not cpus_per_run and args.profile:
+            cpus_per_run = max(profile_cpus(p) for p in args.profile)
+        elif not cpus_per_run and args.threads is not None:
+            cpus_per_run = max(thread_counts)
+        try:
+            slots = make_slots(jobs,cpus_per_run)
+        except ValueError as e:
+            print(e)
+            return
+        print(f"\n==> Running {len(runs)} runs, {jobs} at a time on CPUs:",
+              " | ".join(slot["cpuset_cpus"] for slot in slots))
+    else:
+        slots = [{}]
+        print(f"\n==> Running {len(runs)} runs")
+
+    token_counter = get_token_counter()
+    if token_counter:
+        check_run_steps(token_counter,model_paths,flag_sets)
+
+    client = docker_client(img_to_run)
+    record = start_results_session(client,img_to_run,model_paths,token_counter)
+    results = run_matrix(client,runs,slots,args.timeout,
+                         config.warm_idle_timeout if args.warm else None,
+                         args.telemetry_interval,get_resources_path(),token_counter)
+    for result in results:
+        record(result)
+
+    for result in results:
+        if result["exit_code"] != 0:
+            if result.get("timed_out"):
+                reason = f"timed out after {args.timeout}s"
+            elif result.get("oom_killed"):
+                reason = "was OOM-killed"
+                if result.get("profile"):
+                    reason += f" under resource profile {result['profile']}"
+            else:
+                reason = result.get("error") or f"exited with code {result['exit_code']}"
+            print(f"\n{result['image']} ({result['flags']}) {reason}")
+            if result.get("output"):
+                print(result["output"][-1000:])
+
+    model_bytes = {}
+    for model in model_paths:
+        try:
+            model_bytes[model] = weight_bytes(read_model_config(model))
+        except (OSError, ValueError):
+            pass
+
+    print("\n==> Benchmark results:")
+    show_table(create_table_data(summarize_results(results,model_bytes)))
+
+    if len(thread_counts) > 1:
+        print("\n==> Thread scaling:")
+        show_table(create_table_data(scaling_rows(results)))
+
+    if args.json:
+        save_json(args.json,results)
+        print("Results saved to:",os.path.abspath(args.json))
+
+
+def check_profiles(profiles,warm=False):
+    """Check the resource profiles of run_img/bench, showing the available ones if a name is unknown."""
+    from .profiles import get_profile, profile_rows
+
+    if not profiles:
+        return True
+    if warm:
+        print("--warm runs share one container per image and model, it can't be combined with --profile.")
+        return False
+    try:
+        for name in profiles:
+            get_profile(name)
+    except ValueError as e:
+        print(e)
+        show_table(create_table_data(profile_rows()))
+        return False
+    return True
+
+def check_threads(threads,profiles=None,warm=False):
+    """Thread counts of run_img/bench --threads.
+
+    Returns:
+        list or None: The thread counts to run, 1, 2, 4, ... up to the CPUs
+            of a NUMA node if --threads has no value, [None] without --threads,
+            None if --threads can't be used with the other options.
+    """
+    from .scaling import thread_counts, max_threads
+
+    if threads is None:
+        return [None]
+    if warm:
+        print("--warm runs share one container per image and model, it can't be combined with --threads.")
+        return None
+    if profiles:
+        print("--threads sets the CPUs of each run, it can't be combined with --profile.")
+        return None
+    if any(count < 1 for count in threads):
+        print("Thread counts must be at least 1.")
+        return None
+    return sorted(set(threads)) or thread_counts(max_threads())
+
+def docker_client(images):
+    """Get a Docker client to run images, None if only the reference or native images run."""
+    import docker
+    from .reference import is_reference
+    from .native import is_native
+
+    if all(is_reference(tag) or is_native(tag) for tag in images):
+        return None
+    return docker.from_env()
+
+
+def get_token_counter():
+    """Get a token counter with the default tokenizer, None if it is not installed."""
+    from .tokenizer import load_tokenizer, TokenCounter
+
+    tokenizer_path = os.path.join(get_resources_path(),"llamaTokenizers","tokenizer.bin")
+    if not os.path.exists(tokenizer_path):
+        return None
+    try:
+        tokenizer = load_tokenizer(tokenizer_path,
+                                   cache_dir=os.path.join(get_resources_path(),"llamaCache","tokenizers"))
+    except (OSError, ValueError, struct.error) as e:
+        print("Can't load tokenizer, tokens are not counted:",e)
+        return None
+    return TokenCounter(tokenizer)
+
+
+def check_run_steps(token_counter,model_paths,flag_sets):
+    """Warn about runs whose -n exceeds seq_len or leaves no step to generate after the prompt."""
+    from .runner import requested_steps, parse_run_flags
+
+    for model_path in model_paths:
+        seq_len = token_counter.seq_len(model_path)
+        for run_flags in flag_sets:
+            steps = requested_steps(run_flags)
+            if seq_len and steps > seq_len:
+                print(f"Warning: -n {steps} is larger than seq_len {seq_len} of "
+                      f"{os.path.basename(model_path)}, runs stop after {seq_len} tokens.")
+            prompt_tokens = token_counter.count_prompt(parse_run_flags(run_flags).get("-i"))
+            if prompt_tokens >= token_counter.positions(model_path,steps):
+                print(f"Warning: the prompt has {prompt_tokens} tokens, -n {steps} leaves no token to generate.")
+
+
+def start_results_session(client,images,model_paths,token_counter=None):
+    """Start a session of the results database for this command.
+
+    Args:
+        client (docker.DockerClient): Docker client to use.
+        images (list): Image tags that will run.
+        model_paths (list): Models that will be used.
+        token_counter (TokenCounter): Adds prompt and generated token counts to results.
+    Returns:
+        callable: Records the result dict of a run, with the image ID and
+            model SHA-256 it ran with.
+    """
+    import docker
+    from .results import ResultsDB
+    from .store import ModelStore
+    from .reference import is_reference, reference_digest
+    from .native import is_native, native_digest
+    from .runner import parse_run_flags
+
+    results_db = ResultsDB(get_resources_path())
+    session_id = results_db.start_session(" ".join(["llama-deck"] + sys.argv[1:]))
+    print(f"Results are recorded as session {session_id} in:",results_db.path)
+
+    digests = {}
+    for tag in images:
+        try:
+            if is_reference(tag):
+                digests[tag] = reference_digest()
+            elif is_native(tag):
+                digests[tag] = native_digest(tag,get_resources_path())
+            else:
+                digests[tag] = client.images.get(tag).id
+        except (docker.errors.DockerException,OSError,ValueError):
+            digests[tag] = None
+
+    store = ModelStore(get_resources_path())
+    model_hashes = {path: results_db.model_sha256(path,store) for path in model_paths}
+
+    def record(result):
+        if token_counter and result.get("flags") is not None:
+            token_counter.count(result,parse_run_flags(result["flags"]).get("-i"))
+        results_db.record(result,digests.get(result.get("image")),model_hashes.get(result.get("model")))
+
+    return record
+
+
+def compare_results(baseline=None,candidate=None,threshold=5.0,alpha=0.05):
+    """Compare the throughput of two sessions or two image versions.
+
+    Without arguments, the latest sessions are listed. Exits with status 1
+    if a significant regression is found.
+
+    Args:
+        baseline (str): Session id, image tag or "tag@image ID" to compare against.
+        candidate (str): Session id, image tag or "tag@image ID" to compare.
+        threshold (float): Throughput drop in percent counted as a regression.
+        alpha (float): Significance level of the t-test.
+    """
+    from .results import ResultsDB, compare_runs
+
+    results_db = ResultsDB(get_resources_path())
+
+    if baseline is None:
+        sessions = results_db.sessions()
+        if len(sessions) == 0:
+            print("No results recorded yet, run run_img or bench first.")
+            return
+        show_table(create_table_data([{"Session": row["id"],
+                                       "Date": row["created_at"],
+                                       "Command": row["command"],
+                                       "CPU": row["host_cpu"],
+                                       "Runs": row["runs"]} for row in sessions]))
+        return
+
+    if candidate is None:
+        print("Specify the session or image version to compare with the baseline.")
+        return
+
+    runs_a = results_db.select_runs(baseline)
+    runs_b = results_db.select_runs(candidate)
+    for selector, runs in ((baseline,runs_a),(candidate,runs_b)):
+        if len(runs) == 0:
+            print("No successful runs found for:",selector)
+            return
+
+    if {r["host_cpu"] for r in runs_a} != {r["host_cpu"] for r in runs_b}:
+        print("Warning: the runs were recorded on different CPUs.")
+
+    rows = compare_runs(runs_a,runs_b,threshold/100,alpha)
+    if len(rows) == 0:
+        print("No runs with the same model and flags to compare.")
+        return
+
+    print(f"\n==> {baseline} (A) vs {candidate} (B):")
+    show_table(create_table_data(rows))
+
+    regressions = [row for row in rows if row["Verdict"] == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} significant throughput regressions (> {threshold}%, p < {alpha}).")
+        sys.exit(1)
+
+
+def stop_containers(image_tag=None):
+    """Stop warm containers.
+
+    Args:
+        image_tag (str): Only stop the warm containers of this image.
+    """
+    import docker
+    from .pool import stop_warm_containers
+
+    client = docker.from_env()
+    stopped = stop_warm_containers(client,image_tag)
+
+    if len(stopped) == 0:
+        print("No warm container is running.")
+        return
+
+    for tag in stopped:
+        print("Stopped warm container of",tag)
+
+
+def add_run_arguments(run_parser):
+    """Add the image, model and inference arguments shared by run_img and bench."""
+    run_parser.add_argument(
+        "image_tag",
+        type=str,
+        nargs="?",
+        help="specify image to run",
+    )
+    run_parser.add_argument(
+        "model_path",
+        type=str,
+        nargs="?",
+        help="path to the model",
+    )
+
+    run_parser.add_argument(
+        "-t", "--temperature",
+        type=float,
+        help="Temperature in [0, inf], default 1.0",
+    )
+    run_parser.add_argument(
+        "-p", "--p_value",
+        type=float,
+        help="p value in top-p (nucleus) sampling in [0,1], default 0.9",
+    )
+    run_parser.add_argument(
+        "-s", "--seed",
+        type=int,
+        help="Random seed, default time(NULL)",
+    )
+    run_parser.add_argument(
+        "-n", "--steps",
+        type=int,
+        help="Number of steps to run for, default 256. 0 = max_seq_len",
+    )
+    run_parser.add_argument(
+        "-i", "--input_prompt",
+        type=str,
+        help="Input prompt",
+    )
+    run_parser.add_argument(
+        "-z", "--tokenizer_path",
+        type=str,
+        help="Optional path to custom tokenizer",
+    )
+    run_parser.add_argument(
+        "-m", "--mode",
+        type=str,
+        choices=["generate", "chat"],
+        help="Mode: generate|chat, default: generate",
+    )
+    run_parser.add_argument(
+        "-y", "--system_prompt",
+        type=str,
+        help="(optional) system prompt in chat mode",
+    )
+    run_parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Run in a long-lived container per image and model, reused by later runs",
+    )
+    run_parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Resource profile(s) limiting the CPUs and memory of the containers (see config.resource_profiles); "
+             "with several profiles, every image runs under each of them",
+    )
+    run_parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="*",
+        default=None,
+        help="Run with each of these thread counts (see config.thread_environment), each pinned to as many CPUs; "
+             "without a value, 1, 2, 4, ... up to the CPUs of a NUMA node",
+    )
+    run_parser.add_argument(
+        "--telemetry_interval",
+        type=float,
+        default=config.telemetry_interval,
+        help=f"Seconds between resource samples of the containers, 0 to not sample, default {config.telemetry_interval}",
+    )
+
+
+def add_repo_query_arguments(repo_parser):
+    """Add the name and author filters shared by list_repo and install_repo."""
+    repo_parser.add_argument(
+        "--name", "-n",
+        nargs="?",
+        default=None,
+        help='Specify the name of repos, "prefix*" or "~fuzzy" also match similar names',
+    )
+    repo_parser.add_argument(
+        "--author", "-a",
+        nargs="?",
+        default=None,
+        help="Specify the author of repos",
+    )
+
+
+def main():
+    """Main function to handle Llama Deck operations."""
+
+    parser = argparse.ArgumentParser(
+        description="Llama Deck: Manage and run multi llama implementations.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,  # Show default values in the help menu
     )
     subparsers = parser.add_subparsers(dest="action", help="Action to perform")
 
@@ -707,6 +1811,7 @@ def main():
         default=None,
         help="Specify the language of repos to show in table",
     )
+    add_repo_query_arguments(list_repo_parser)
 
     # subparser: install_repo
     install_repo_parser = subparsers.add_parser("install_repo", help="Install repositories")
@@ -716,6 +1821,18 @@ def main():
         default=None,
         help="Specify the language of repos to install",
     )
+    add_repo_query_arguments(install_repo_parser)
+    install_repo_parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        help=f"Max number of repositories cloned at the same time, default {config.repo_install_workers}",
+    )
+    install_repo_parser.add_argument(
+        "--full_clone",
+        action="store_true",
+        help="Clone the full git history instead of a shallow/partial clone",
+    )
 
     # subparser: list_model
     list_model_parser = subparsers.add_parser("list_model", help="List models")
@@ -735,6 +1852,116 @@ def main():
         help="Specify the model name",
     )
 
+    # subparser: verify_model
+    verify_model_parser = subparsers.add_parser("verify_model", help="Verify installed models against the model store")
+    verify_model_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-hash every file instead of only checking links and sizes",
+    )
+
+    # subparser: inspect_model
+    inspect_model_parser = subparsers.add_parser("inspect_model", help="Show architecture, memory and FLOPs of models")
+    inspect_model_parser.add_argument(
+        "model_paths",
+        type=str,
+        nargs="*",
+        help="model files to inspect, default all installed models",
+    )
+    inspect_model_parser.add_argument(
+        "--seq_len",
+        type=int,
+        default=None,
+        help="Sequence length of the KV cache and FLOPs estimates, default the model's",
+    )
+    inspect_model_parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=None,
+        help="Memory bandwidth in GB/s, to estimate the max decode tok/s",
+    )
+
+    # subparser: convert_model
+    convert_model_parser = subparsers.add_parser("convert_model", help="Convert a Meta-Llama checkpoint to llama2.c format")
+    convert_model_parser.add_argument(
+        "checkpoint_dir",
+        type=str,
+        help="directory with params.json and consolidated.*.pth",
+    )
+    convert_model_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="Model file, default <checkpoint_dir name>.bin in llamaModels",
+    )
+    convert_model_parser.add_argument(
+        "--seq_len",
+        type=int,
+        default=None,
+        help="Max sequence length of the model, default 2048",
+    )
+    convert_model_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of shard parts to read at the same time, default 1",
+    )
+
+    # subparser: gen_model
+    gen_model_parser = subparsers.add_parser("gen_model", help="Generate random-weight models of any shape")
+    for flag,default,help_text in [("--dim",[288],"Model dimension, default 288"),
+                                   ("--n_layers",[6],"Number of layers, default 6"),
+                                   ("--n_heads",None,"Number of heads, default dim / 64 (or dim / 48)"),
+                                   ("--n_kv_heads",None,"Number of key/value heads, default n_heads"),
+                                   ("--hidden_dim",None,"FFN dimension, default as llama2.c's model.py"),
+                                   ("--vocab_size",[32000],"Vocabulary size, default 32000 (tokenizer.bin)"),
+                                   ("--seq_len",[256],"Max sequence length, default 256")]:
+        gen_model_parser.add_argument(
+            flag,
+            type=int,
+            nargs="+",
+            default=default,
+            help=help_text + "; several values generate every combination",
+        )
+    gen_model_parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the weights, default 0",
+    )
+    gen_model_parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Directory of the models, default llamaModels",
+    )
+
+    # subparser: quantize_model
+    quantize_model_parser = subparsers.add_parser("quantize_model", help="Quantize a model to group-wise int8 (Q8_0)")
+    quantize_model_parser.add_argument(
+        "model_path",
+        type=str,
+        help="fp32 model file, or the name of an installed model",
+    )
+    quantize_model_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="Quantized model file, default <model>_q80.bin in llamaModels",
+    )
+    quantize_model_parser.add_argument(
+        "-g",
+        "--group_size",
+        type=int,
+        default=None,
+        help="Values per scale, default 64",
+    )
+
     # subparser: list_img
     list_img_parser = subparsers.add_parser("list_img", help="List images")
     list_img_parser.add_argument(
@@ -749,6 +1976,17 @@ def main():
         default=None,
         help="Specify the language of the repository inside image",
     )
+    list_img_parser.add_argument(
+        "--author", "-a",
+        nargs="?",
+        default=None,
+        help="Specify the author of the repository inside image",
+    )
+    list_img_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Revalidate the cached image list with the registry",
+    )
 
     # subparser: install_img
     install_img_parser = subparsers.add_parser("install_img", help="Install images")
@@ -764,87 +2002,212 @@ def main():
         default=None,
         help="Specify the language of the repository inside image",
     )
+    install_img_parser.add_argument(
+        "--author", "-a",
+        nargs="?",
+        default=None,
+        help="Specify the author of the repository inside image",
+    )
+    install_img_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Revalidate the cached image list with the registry",
+    )
+    install_img_parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        help=f"Max number of images pulled at the same time, default {config.image_pull_workers}",
+    )
+
+    # subparser: build_img
+    build_img_parser = subparsers.add_parser("build_img", help="Build images from installed repositories")
+    build_img_parser.add_argument(
+        "--language", "-l",
+        nargs="?",
+        default=None,
+        help="Specify the language of repos to build",
+    )
+    add_repo_query_arguments(build_img_parser)
+    build_img_parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        help=f"Max number of images built at the same time, default {config.image_build_workers}",
+    )
+    build_img_parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Build without the layer cache, or rebuild native builds",
+    )
+    build_img_parser.add_argument(
+        "--native",
+        action="store_true",
+        help="Build the repositories in place with the host's toolchains, to run them as native:<name>_<author>",
+    )
 
     # subparser: run_img
     run_img_parser = subparsers.add_parser("run_img", help="Run image with specified options")
+    add_run_arguments(run_img_parser)
     run_img_parser.add_argument(
-        "image_tag",
+        "--prompts",
         type=str,
-        nargs="?",
-        help="specify image to run",
+        default=None,
+        help="JSONL prompt file to run in batch (one prompt, with optional seed/steps/temperature/top_p, per line)",
     )
     run_img_parser.add_argument(
-        "model_path",
+        "--output",
         type=str,
-        nargs="?",
-        help="path to the model",
-    )
-
-    run_img_parser.add_argument(
-        "-t", "--temperature",
-        type=float,
-        help="Temperature in [0, inf], default 1.0",
+        default=None,
+        help="JSONL file batch results are appended to, default <prompts>.results.jsonl",
     )
     run_img_parser.add_argument(
-        "-p", "--p_value",
-        type=float,
-        help="p value in top-p (nucleus) sampling in [0,1], default 0.9",
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Number of prompts running at the same time in batch mode, default 1",
     )
     run_img_parser.add_argument(
-        "-s", "--seed",
+        "--offset",
         type=int,
-        help="Random seed, default time(NULL)",
+        default=None,
+        help="Index of the first prompt to run in batch mode",
     )
-    run_img_parser.add_argument(
-        "-n", "--steps",
+
+    # subparser: bench
+    bench_parser = subparsers.add_parser("bench", help="Benchmark images and compare their throughput")
+    add_run_arguments(bench_parser)
+    bench_parser.add_argument(
+        "-r", "--repeat",
         type=int,
-        help="Number of steps to run for, default 256. 0 = max_seq_len",
+        default=None,
+        help="Number of runs of each image, default 1",
     )
-    run_img_parser.add_argument(
-        "-i", "--input_prompt",
+    bench_parser.add_argument(
+        "-o", "--json",
         type=str,
-        help="Input prompt",
+        default=None,
+        help="Save all runs as JSON to this file",
     )
-    run_img_parser.add_argument(
-        "-z", "--tokenizer_path",
+    bench_parser.add_argument(
+        "--model_paths",
         type=str,
-        help="Optional path to custom tokenizer",
+        nargs="+",
+        default=None,
+        help="Run every image on each of these models",
     )
-    run_img_parser.add_argument(
-        "-m", "--mode",
+    bench_parser.add_argument(
+        "--flag_sets",
         type=str,
-        choices=["generate", "chat"],
-        help="Mode: generate|chat, default: generate",
+        nargs="+",
+        default=None,
+        help='Run every image with each of these flag strings, e.g. "-n 64" "-n 256 -t 0"',
     )
-    run_img_parser.add_argument(
-        "-y", "--system_prompt",
+    bench_parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Number of runs at the same time, each pinned to its own CPUs, default 1",
+    )
+    bench_parser.add_argument(
+        "--cpus_per_run",
+        type=int,
+        default=None,
+        help="CPUs pinned to each run, default all CPUs divided by --jobs",
+    )
+    bench_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Kill a run after this many seconds",
+    )
+
+    # subparser: compare
+    compare_parser = subparsers.add_parser("compare", help="Compare recorded results of two sessions or image versions")
+    compare_parser.add_argument(
+        "baseline",
         type=str,
-        help="(optional) system prompt in chat mode",
+        nargs="?",
+        help='session id, image tag or "tag@image ID" to compare against, omit to list sessions',
+    )
+    compare_parser.add_argument(
+        "candidate",
+        type=str,
+        nargs="?",
+        help='session id, image tag or "tag@image ID" to compare',
+    )
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=5.0,
+        help="Throughput drop in percent counted as a regression, default 5",
+    )
+    compare_parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Significance level of the t-test, default 0.05",
+    )
+
+    # subparser: stop
+    stop_parser = subparsers.add_parser("stop", help="Stop warm containers")
+    stop_parser.add_argument(
+        "image_tag",
+        type=str,
+        nargs="?",
+        help="only stop warm containers of this image",
     )
 
     args = parser.parse_args()
 
     if args.action == "list_repo":
-        list_repos(args.language)
+        list_repos(args.language,args.name,args.author)
 
     elif args.action == "install_repo":
-        install_repos(default_resources_path,args.language)
+        install_repos(get_resources_path(),args.language,args.jobs,args.full_clone,args.name,args.author)
 
     elif args.action == "list_model":
         list_models(args.model_name)
 
     elif args.action == "install_model":
-        install_models(default_resources_path,args.model_name)
+        install_models(get_resources_path(),args.model_name)
+
+    elif args.action == "verify_model":
+        verify_models(args.full)
+
+    elif args.action == "inspect_model":
+        inspect_models(args.model_paths,args.seq_len,args.bandwidth)
+
+    elif args.action == "convert_model":
+        convert_models(args.checkpoint_dir,args.output,args.seq_len,args.jobs)
+
+    elif args.action == "gen_model":
+        generate_models(args)
+
+    elif args.action == "quantize_model":
+        quantize_models(args.model_path,args.output,args.group_size)
 
     elif args.action == "list_img":
-        list_images(args.image_tag,args.language)
+        list_images(args.image_tag,args.language,args.refresh,args.author)
 
     elif args.action == "install_img":
-        install_images(args.image_tag,args.language)
+        install_images(args.image_tag,args.language,args.refresh,args.jobs,args.author)
+
+    elif args.action == "build_img":
+        build_images(args.language,args.name,args.author,args.jobs,args.no_cache,args.native)
 
     elif args.action == "run_img":
         run_images(args,run_img_parser)
 
+    elif args.action == "bench":
+        bench_images(args,bench_parser)
+
+    elif args.action == "compare":
+        compare_results(args.baseline,args.candidate,args.threshold,args.alpha)
+
+    elif args.action == "stop":
+        stop_containers(args.image_tag)
+
     else:
         parser.print_help()
 
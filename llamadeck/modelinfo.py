@@ -0,0 +1,291 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read the header of llama2.c model files and estimate their cost.
+
+The header is read from a memory map of the file, so inspecting a model
+never reads its weights. Supported formats:
+
+- legacy (llama2.c run.c): 7 int32 (dim, hidden_dim, n_layers, n_heads,
+  n_kv_heads, vocab_size, seq_len), then fp32 weights. A negative
+  vocab_size means the classifier is not shared with the token embedding.
+- version 1/2 (llama2.c export.py): magic "ak42", int32 version, the 7
+  int32, a shared-classifier byte (and int32 group size for the int8
+  version 2), padded to a 256 byte header.
+"""
+
+import mmap
+import os
+import struct
+
+HEADER_FIELDS = ["dim", "hidden_dim", "n_layers", "n_heads", "n_kv_heads", "vocab_size", "seq_len"]
+MAGIC = 0x616b3432
+VERSIONED_HEADER_SIZE = 256
+
+
+def read_model_config(path):
+    """Read the config header of a llama2.c model file.
+
+    Returns:
+        dict: The header fields, plus version (0 for legacy), shared_classifier,
+            group_size (version 2 only), header_size and file_size.
+    Raises:
+        ValueError: If the file is not a llama2.c model.
+    """
+    file_size = os.path.getsize(path)
+    if file_size < 4 * len(HEADER_FIELDS):
+        raise ValueError(f"{path} is too small to be a llama2.c model")
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        model_config = {"version": 0, "group_size": None, "header_size": 4 * len(HEADER_FIELDS)}
+        if struct.unpack_from("<I", mm, 0)[0] == MAGIC:
+            model_config["version"] = struct.unpack_from("<i", mm, 4)[0]
+            model_config.update(zip(HEADER_FIELDS, struct.unpack_from("<7i", mm, 8)))
+            model_config["shared_classifier"] = bool(mm[36])
+            if model_config["version"] == 2:
+                model_config["group_size"] = struct.unpack_from("<i", mm, 37)[0]
+            model_config["header_size"] = VERSIONED_HEADER_SIZE
+        else:
+            model_config.update(zip(HEADER_FIELDS, struct.unpack_from("<7i", mm, 0)))
+            model_config["shared_classifier"] = model_config["vocab_size"] > 0
+            model_config["vocab_size"] = abs(model_config["vocab_size"])
+
+    model_config["file_size"] = file_size
+    _check_config(path, model_config)
+    return model_config
+
+
+def _check_config(path, model_config):
+    if model_config["version"] not in (0, 1, 2):
+        raise ValueError(f"{path} has unsupported model version {model_config['version']}")
+    if any(model_config[field] <= 0 for field in HEADER_FIELDS):
+        raise ValueError(f"{path} is not a llama2.c model (invalid header)")
+    if (model_config["dim"] % model_config["n_heads"]
+            or model_config["n_heads"] % model_config["n_kv_heads"]):
+        raise ValueError(f"{path} is not a llama2.c model (invalid head counts)")
+
+    if model_config["version"] == 2 and (model_config["group_size"] or 0) <= 0:
+        raise ValueError(f"{path} has invalid group size {model_config['group_size']}")
+    expected_size = model_config["header_size"] + weight_bytes(model_config)
+    if model_config["file_size"] < expected_size:
+        raise ValueError(f"{path} is truncated: {model_config['file_size']} bytes, "
+                         f"{expected_size} expected")
+
+
+def tensor_shapes(model_config):
+    """Shapes of the weight tensors, in file order (legacy freq_cis tables excluded)."""
+    dim, hidden_dim = model_config["dim"], model_config["hidden_dim"]
+    n_layers, vocab_size = model_config["n_layers"], model_config["vocab_size"]
+    kv_dim = dim * model_config["n_kv_heads"] // model_config["n_heads"]
+
+    shapes = {"token_embedding": (vocab_size, dim),
+              "rms_att": (n_layers, dim),
+              "wq": (n_layers, dim, dim),
+              "wk": (n_layers, kv_dim, dim),
+              "wv": (n_layers, kv_dim, dim),
+              "wo": (n_layers, dim, dim),
+              "rms_ffn": (n_layers, dim),
+              "w1": (n_layers, hidden_dim, dim),
+              "w2": (n_layers, dim, hidden_dim),
+              "w3": (n_layers, hidden_dim, dim),
+              "rms_final": (dim,)}
+    if not model_config["shared_classifier"]:
+        shapes["wcls"] = (vocab_size, dim)
+    return shapes
+
+
+def weight_layout(model_config):
+    """(name, shape) of every fp32 tensor of a version 0 or 1 file, in file order."""
+    shapes = tensor_shapes(model_config)
+    if model_config["version"] == 1:
+        names = ["rms_att", "rms_ffn", "rms_final", "token_embedding",
+                 "wq", "wk", "wv", "wo", "w1", "w2", "w3"]
+    elif model_config["version"] == 0:
+        names = ["token_embedding", "rms_att", "wq", "wk", "wv", "wo",
+                 "rms_ffn", "w1", "w2", "w3", "rms_final"]
+    else:
+        raise ValueError(f"Model version {model_config['version']} is not stored as fp32")
+
+    layout = [(name, shapes[name]) for name in names]
+    if model_config["version"] == 0:
+        head_size = model_config["dim"] // model_config["n_heads"]
+        freq_cis_shape = (model_config["seq_len"], head_size // 2)
+        layout += [("freq_cis_real", freq_cis_shape), ("freq_cis_imag", freq_cis_shape)]
+    if "wcls" in shapes:
+        layout.append(("wcls", shapes["wcls"]))
+    return layout
+
+
+def quantized_layout(model_config):
+    """fp32 and int8 tensors of a version 2 file, in file order.
+
+    The fp32 norm weights come first, then the quantized matrices. Each
+    matrix (each layer's separately for the layer weights) is stored as its
+    int8 values followed by one fp32 scale per group_size values.
+
+    Returns:
+        tuple: (fp32 tensors, quantized tensors), both lists of (name, shape).
+    """
+    shapes = tensor_shapes(model_config)
+    fp32 = [(name, shapes[name]) for name in ("rms_att", "rms_ffn", "rms_final")]
+    quantized = [(name, shapes[name]) for name in ("token_embedding", "wq", "wk", "wv", "wo", "w1", "w2", "w3", "wcls")
+                 if name in shapes]
+    return fp32, quantized
+
+
+def map_weights(path, model_config):
+    """Memory map the weights of a model file (needs NumPy).
+
+    Returns:
+        dict: name -> array. fp32 tensors of version 0/1 files are arrays;
+            quantized tensors of version 2 files are (int8 values, fp32
+            scales) pairs, a list of them per layer for the layer weights.
+    """
+    import numpy as np
+
+    header_size = model_config["header_size"]
+    if model_config["version"] != 2:
+        data = np.memmap(path, dtype=np.float32, mode="r", offset=header_size)
+        weights = {}
+        offset = 0
+        for name, shape in weight_layout(model_config):
+            size = _numel(shape)
+            weights[name] = data[offset:offset + size].reshape(shape)
+            offset += size
+        return weights
+
+    group_size = model_config["group_size"]
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=header_size)
+    fp32, quantized = quantized_layout(model_config)
+    weights = {}
+    offset = 0
+    for name, shape in fp32:
+        size = _numel(shape)
+        weights[name] = data[offset:offset + 4 * size].view(np.float32).reshape(shape)
+        offset += 4 * size
+    for name, shape in quantized:
+        matrices = []
+        for _ in range(shape[0] if len(shape) == 3 else 1):
+            rows, cols = shape[-2:]
+            values = data[offset:offset + rows * cols].view(np.int8).reshape(rows, cols)
+            offset += rows * cols
+            scale_count = rows * cols // group_size
+            scales = data[offset:offset + 4 * scale_count].view(np.float32).reshape(rows, cols // group_size)
+            offset += 4 * scale_count
+            matrices.append((values, scales))
+        weights[name] = matrices if len(shape) == 3 else matrices[0]
+    return weights
+
+
+def _numel(shape):
+    count = 1
+    for size in shape:
+        count *= size
+    return count
+
+
+def param_count(model_config):
+    """Number of parameters of a model."""
+    return sum(_numel(shape) for shape in tensor_shapes(model_config).values())
+
+
+def weight_bytes(model_config):
+    """Bytes of the weights as stored in the file (fp32, int8 + scales for version 2)."""
+    if model_config["version"] == 2:
+        fp32, quantized = quantized_layout(model_config)
+        size = sum(4 * _numel(shape) for _, shape in fp32)
+        return size + sum(_numel(shape) * (model_config["group_size"] + 4) // model_config["group_size"]
+                          for _, shape in quantized)
+
+    size = 4 * param_count(model_config)
+    if model_config["version"] == 0:
+        # freq_cis_real and freq_cis_imag of the legacy format
+        head_size = model_config["dim"] // model_config["n_heads"]
+        size += 4 * model_config["seq_len"] * head_size
+    return size
+
+
+def kv_cache_bytes(model_config, seq_len=None):
+    """Bytes of the fp32 key and value caches for seq_len positions (default the model's)."""
+    seq_len = seq_len or model_config["seq_len"]
+    kv_dim = model_config["dim"] * model_config["n_kv_heads"] // model_config["n_heads"]
+    return 2 * 4 * model_config["n_layers"] * seq_len * kv_dim
+
+
+def flops_per_token(model_config, seq_len=None):
+    """Average FLOPs per generated token over seq_len positions (default the model's).
+
+    Counts 2 FLOPs per multiply-add of the matmuls (all weights but the
+    embedding and norms) plus attention scores and weighted values, which
+    grow with the position.
+    """
+    seq_len = seq_len or model_config["seq_len"]
+    shapes = tensor_shapes(model_config)
+    matmul_params = sum(_numel(shapes[name]) for name in ("wq", "wk", "wv", "wo", "w1", "w2", "w3"))
+    matmul_params += _numel(shapes.get("wcls", shapes["token_embedding"]))
+
+    # q.k and att.v over on average seq_len / 2 positions, for all heads
+    attention = 2 * 2 * model_config["n_layers"] * model_config["dim"] * (seq_len + 1) / 2
+    return 2 * matmul_params + attention
+
+
+def expected_tok_s(model_config, bandwidth=None, flops=None, seq_len=None):
+    """Upper bound of the decode throughput of a model.
+
+    Generating a token reads every weight once, so decoding is bound by
+    memory bandwidth (and by compute on very fast memory).
+
+    Args:
+        bandwidth (float): Memory bandwidth in bytes per second.
+        flops (float): Compute in FLOPs per second.
+    Returns:
+        float or None: tok/s, None if neither bound is given.
+    """
+    bounds = []
+    if bandwidth:
+        bounds.append(bandwidth / (weight_bytes(model_config) + kv_cache_bytes(model_config, seq_len) / 2))
+    if flops:
+        bounds.append(flops / flops_per_token(model_config, seq_len))
+    return min(bounds) if bounds else None
+
+
+def format_count(value, unit=""):
+    """Format a number with a K/M/G/T suffix."""
+    for suffix in ("", "K", "M", "G", "T"):
+        if abs(value) < 1000 or suffix == "T":
+            return f"{value:.1f}{suffix}{unit}" if suffix else f"{value:.0f}{unit}"
+        value /= 1000
+
+
+def format_bytes(size):
+    """Format a size in bytes as MiB or GiB."""
+    if size >= 1024 ** 3:
+        return f"{size / 1024 ** 3:.2f} GiB"
+    return f"{size / 1024 ** 2:.1f} MiB"
+
+
+def model_summary(model_config, seq_len=None):
+    """Table row of the architecture and costs of a model."""
+    seq_len = seq_len or model_config["seq_len"]
+    return {"dim": model_config["dim"],
+            "hidden_dim": model_config["hidden_dim"],
+            "Layers": model_config["n_layers"],
+            "Heads (kv)": f"{model_config['n_heads']} ({model_config['n_kv_heads']})",
+            "Vocab": model_config["vocab_size"],
+            "seq_len": model_config["seq_len"],
+            "Params": format_count(param_count(model_config)),
+            "Weights": format_bytes(weight_bytes(model_config)),
+            f"KV cache @{seq_len}": format_bytes(kv_cache_bytes(model_config, seq_len)),
+            "FLOPs/token": format_count(flops_per_token(model_config, seq_len))}
@@ -0,0 +1,344 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run installed repositories natively, without containers.
+
+An installed repository is selectable in run_img and bench as the
+pseudo-image `native:<name>_<author>`. It is built in place with the host's
+Make, Cargo or Go, using the build settings of build_img (see
+build.build_settings), and its executables are copied with the tokenizer to
+`<resources path>/llamaCache/native/<name>_<author>/<source key>/`, laid out
+like /app in the images. The source key is the checked out commit, plus a
+hash of the uncommitted changes and untracked files if there are any, so
+every version of a repository is built once. An in-place build can leave
+untracked outputs, so a build is filed under the key after it.
+
+A run executes the binary like the cli_run.py of the images: in that
+directory, with a pty, the model and the flags of build_run_flags, so
+native and container runs of the same repository measure the same work.
+The CPU time, page faults and block I/O of a run come from the rusage of
+the process, its peak and average RSS from samples of /proc/<pid>/status
+(on Linux).
+"""
+
+import glob
+import hashlib
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+from .build import build_settings, installed_repos, repo_commit, repo_id
+from .runner import GENERATION_MARKER, build_result, collect_output
+
+NATIVE_PREFIX = "native:"
+
+# Tool each template needs on the host
+TOOLCHAINS = {"make": "make", "cargo": "cargo", "go": "go"}
+
+
+def is_native(tag):
+    """Check if an image tag is a native pseudo-image."""
+    return tag.startswith(NATIVE_PREFIX)
+
+
+def native_tag(repo):
+    """Pseudo-image tag of an installed repository."""
+    return NATIVE_PREFIX + repo_id(repo)
+
+
+def native_available(repo):
+    """Check if a repository has a native template and its toolchain is installed."""
+    try:
+        template = build_settings(repo)["template"]
+    except ValueError:
+        return False
+    return template in TOOLCHAINS and shutil.which(TOOLCHAINS[template]) is not None
+
+
+def find_repo(tag, resources_path):
+    """Installed repository of a native pseudo-image.
+
+    Raises:
+        ValueError: If no installed repository has this tag.
+    """
+    for repo in installed_repos(resources_path):
+        if native_tag(repo) == tag:
+            return repo
+    raise ValueError(f"No installed repository for {tag}, install it with install_repo")
+
+
+def source_key(path):
+    """Version of a repository's sources: its commit, plus a hash of uncommitted changes.
+
+    Uncommitted changes are the diff of the tracked files and the untracked
+    files that are not ignored, with their contents.
+
+    Returns:
+        str or None: The key, None if the repository is not a git repository.
+    """
+    commit = repo_commit(path)
+    if commit is None:
+        return None
+    diff = subprocess.run(["git", "-C", path, "diff", "HEAD", "--binary"],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    untracked = subprocess.run(["git", "-C", path, "ls-files", "--others", "--exclude-standard", "-z"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    if not diff and not untracked:
+        return commit
+
+    digest = hashlib.sha256(diff)
+    for name in sorted(filter(None, untracked.split(b"\0"))):
+        digest.update(b"\0" + name + b"\0")
+        try:
+            with open(os.path.join(os.fsencode(path), name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        except OSError:
+            pass
+    return f"{commit}-{digest.hexdigest()[:12]}"
+
+
+def native_dir(repo, resources_path, key=None):
+    """Directory of the built executables of a version of a repository."""
+    return os.path.join(resources_path, "llamaCache", "native", repo_id(repo), key or "unversioned")
+
+
+def _executables(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                  if os.path.isfile(path) and os.access(path, os.X_OK))
+
+
+def build_native(repo, resources_path, tokenizer_path, rebuild=False):
+    """Build a repository in place, unless its version is already built.
+
+    Repositories that are not git repositories are built every time.
+
+    Args:
+        repo (dict): Installed repository (see build.installed_repos).
+        resources_path (str): Resources directory.
+        tokenizer_path (str): Tokenizer copied next to the executables.
+        rebuild (bool): Build even if this version is already built.
+    Returns:
+        tuple: (directory of the build, whether it was built now).
+    Raises:
+        ValueError: If the repository can't be built natively or the build failed.
+    """
+    settings = build_settings(repo)
+    template = settings["template"]
+    if template not in TOOLCHAINS:
+        raise ValueError(f"{native_tag(repo)}: template {template} can't be built natively")
+    if shutil.which(TOOLCHAINS[template]) is None:
+        raise ValueError(f"{native_tag(repo)} needs {TOOLCHAINS[template]}, it is not installed")
+
+    key = source_key(repo["path"])
+    directory = native_dir(repo, resources_path, key)
+    if key and not rebuild and _executables(os.path.join(directory, "bin")):
+        return directory, False
+
+    tmp_dir = directory + ".part"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    bin_dir = os.path.join(tmp_dir, "bin")
+    os.makedirs(bin_dir)
+    try:
+        log_path = os.path.join(tmp_dir, "build.log")
+        with open(log_path, "w") as log:
+            returncode = subprocess.run(["sh", "-c", settings["command"]], cwd=repo["path"],
+                                        env=dict(os.environ, OUT=bin_dir),
+                                        stdout=log, stderr=subprocess.STDOUT).returncode
+        if returncode != 0:
+            with open(log_path) as f:
+                tail = f.read()[-1000:]
+            raise ValueError(f"{native_tag(repo)}: build failed with exit code {returncode}\n{tail}")
+
+        if template == "make":
+            for pattern in shlex.split(settings["artifacts"]):
+                for path in glob.glob(os.path.join(repo["path"], pattern)):
+                    shutil.copy2(path, bin_dir)
+        elif template == "cargo":
+            target_dir = os.environ.get("CARGO_TARGET_DIR") or os.path.join(repo["path"], "target")
+            for path in _executables(os.path.join(target_dir, "release")):
+                shutil.copy2(path, bin_dir)
+        if not _executables(bin_dir):
+            raise ValueError(f"{native_tag(repo)}: the build made no executable")
+        shutil.copyfile(tokenizer_path, os.path.join(tmp_dir, "tokenizer.bin"))
+
+        # an in-place build may leave untracked outputs, file the build under the version it leaves
+        directory = native_dir(repo, resources_path, source_key(repo["path"]))
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return directory, True
+
+
+def native_command(tag, resources_path, model_path, run_flags):
+    """Command line of a native run and the directory it runs in.
+
+    Raises:
+        ValueError: If the repository's current version is not built.
+    """
+    repo = find_repo(tag, resources_path)
+    directory = native_dir(repo, resources_path, source_key(repo["path"]))
+    bin_dir = os.path.join(directory, "bin")
+    executables = _executables(bin_dir)
+    if not executables:
+        raise ValueError(f"{tag} is not built, build it with build_img --native")
+
+    command = shlex.split(build_settings(repo)["run"])
+    if not command and len(executables) != 1:
+        raise ValueError(f"{tag} has several executables, set the run command of the repository: "
+                         + " ".join(os.path.basename(path) for path in executables))
+    command = command or executables[:1]
+    command[0] = shutil.which(command[0], path=bin_dir) or command[0]
+    return command + [model_path] + shlex.split(run_flags), directory
+
+
+def native_digest(tag, resources_path):
+    """Digest identifying the built version of a native pseudo-image, None if unknown."""
+    try:
+        key = source_key(find_repo(tag, resources_path)["path"])
+    except ValueError:
+        return None
+    return NATIVE_PREFIX + key if key else None
+
+
+def _sample_memory(pid, interval, stopped, samples):
+    # ru_maxrss of a child includes the Python process it was forked from,
+    # VmHWM starts over with the executable
+    while not stopped.is_set():
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+            samples.append((int(fields["VmHWM"].split()[0]) * 1024, int(fields["VmRSS"].split()[0]) * 1024))
+        except (OSError, KeyError, ValueError):
+            # the process exited
+            return
+        stopped.wait(interval)
+
+
+def _read_pty(fd, marker):
+    # cli_run.py of the images echoes the command line before running it
+    yield marker
+    while True:
+        try:
+            data = os.read(fd, 4096)
+        except OSError:
+            # EIO once the process closed the pty
+            return
+        if not data:
+            return
+        yield data
+
+
+def _reap(pid, reap_lock, reaped):
+    """Wait for a process to exit and reap it under reap_lock.
+
+    Returns:
+        tuple: (wait status, resource usage).
+    """
+    # wait for the exit without reaping, then reap where the timer can't kill
+    if hasattr(os, "waitid"):
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+    while True:
+        with reap_lock:
+            reaped_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+            if reaped_pid:
+                reaped.set()
+                return status, rusage
+        # no waitid (macOS before Python 3.13), poll without holding the lock
+        time.sleep(0.01)
+
+
+def run_native(tag, model_path, run_flags, echo=True, timeout=None, telemetry_interval=None,
+               token_counter=None, resources_path=None, cpuset_cpus=None, environment=None, **options):
+    """Run a native pseudo-image.
+
+    Takes the same arguments and returns the same result dict as
+    runner.run_container. Of the container options, cpuset_cpus (as the CPU
+    affinity of the process) and environment are applied.
+
+    Args:
+        resources_path (str): Resources directory of the installed repositories.
+    Raises:
+        ValueError: If the repository's current version is not built.
+    """
+    import pty
+    from .scheduler import parse_cpulist
+
+    command, directory = native_command(tag, resources_path, model_path, run_flags)
+    cpus = parse_cpulist(cpuset_cpus) if cpuset_cpus and hasattr(os, "sched_setaffinity") else None
+    bin_dir = os.path.join(directory, "bin")
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""), **(environment or {}))
+
+    master, slave = pty.openpty()
+    t_begin = time.perf_counter()
+    try:
+        process = subprocess.Popen(command, cwd=directory, env=env, stdin=subprocess.DEVNULL,
+                                   stdout=slave, stderr=slave,
+                                   preexec_fn=(lambda: os.sched_setaffinity(0, cpus)) if cpus else None)
+    finally:
+        os.close(slave)
+    t_started = time.perf_counter()
+    timed_out = threading.Event()
+    reaped = threading.Event()
+    reap_lock = threading.Lock()
+
+    def kill_on_timeout():
+        # the pid is only signalled before it is reaped, so never a reused pid
+        with reap_lock:
+            if not reaped.is_set():
+                timed_out.set()
+                os.kill(process.pid, signal.SIGKILL)
+
+    timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+    stopped = threading.Event()
+    memory = []
+    sampler = threading.Thread(target=_sample_memory, args=(process.pid, telemetry_interval, stopped, memory),
+                               daemon=True)
+    try:
+        if timer:
+            timer.start()
+        if telemetry_interval:
+            sampler.start()
+        marker = f"{GENERATION_MARKER} {' '.join(shlex.quote(arg) for arg in command)}\n".encode()
+        output, token_timer = collect_output(_read_pty(master, marker), echo, token_counter)
+        status, rusage = _reap(process.pid, reap_lock, reaped)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        t_end = time.perf_counter()
+    finally:
+        if timer:
+            timer.cancel()
+        stopped.set()
+        os.close(master)
+
+    result = build_result(tag, model_path, run_flags, process.returncode, output, token_timer,
+                          t_begin, t_started, t_end)
+    result["timed_out"] = timed_out.is_set()
+    if telemetry_interval:
+        run_time = t_end - t_started
+        result.update({"cpu_util": (rusage.ru_utime + rusage.ru_stime) / run_time if run_time > 0 else None,
+                       "peak_memory": max(hwm for hwm, _ in memory) if memory else None,
+                       "avg_memory": int(sum(rss for _, rss in memory) / len(memory)) if memory else None,
+                       "page_faults": rusage.ru_minflt + rusage.ru_majflt,
+                       "major_page_faults": rusage.ru_majflt,
+                       "io_read_bytes": rusage.ru_inblock * 512,
+                       "io_write_bytes": rusage.ru_oublock * 512,
+                       "telemetry": {"source": "native", "interval": telemetry_interval, "samples": len(memory)}})
+    return result
+
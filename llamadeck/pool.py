@@ -0,0 +1,159 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Warm containers: one long-lived container per image/model pair.
+
+Instead of creating a container for every run, cli_run.py is started with
+`docker exec` in a container that keeps running between runs (and between
+llama-deck invocations). Warm containers are found by their labels. Each
+one stops and removes itself when no run has used it for its idle timeout,
+so no background process is needed on the host; `llama-deck stop` stops
+them right away.
+
+A bind mount keeps the model file it was created with, so a container is
+also labeled with the inode, size and mtime of its model, and replaced by
+a new one when the file at the model path changed.
+"""
+
+import os
+import time
+
+from .runner import CLI_COMMAND, MODEL_MOUNT, build_result, collect_output
+
+POOL_LABEL = "org.llamadeck.pool"
+IMAGE_LABEL = "org.llamadeck.image"
+MODEL_LABEL = "org.llamadeck.model"
+MODEL_ID_LABEL = "org.llamadeck.model_id"
+LAST_USED_FILE = "/tmp/.llamadeck_last_used"
+
+# Main process of a warm container: exit when idle, i.e. no cli_run.py is
+# running and the last run finished more than IDLE seconds ago.
+IDLE_LOOP = """
+import os, time
+def busy():
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        if pid == str(os.getpid()):
+            continue
+        try:
+            if b'cli_run.py' in open('/proc/%s/cmdline' % pid, 'rb').read():
+                return True
+        except OSError:
+            pass
+    return False
+open('{last_used}', 'a').close()
+while busy() or time.time() - os.path.getmtime('{last_used}') < {idle}:
+    time.sleep(5)
+"""
+
+
+def list_warm_containers(client, tag=None):
+    """Get running warm containers, optionally only those of one image."""
+    filters = {"label": [POOL_LABEL], "status": "running"}
+    if tag:
+        filters["label"].append(f"{IMAGE_LABEL}={tag}")
+    return client.containers.list(filters=filters)
+
+
+def model_id(model_path):
+    """Identity of the file at a model path: inode, size and mtime."""
+    stat = os.stat(model_path)
+    return f"{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def get_warm_container(client, tag, model_path, idle_timeout):
+    """Get the warm container of an image/model pair, starting it if needed.
+
+    Containers of the pair that mount an older version of the model file
+    are stopped.
+
+    Returns:
+        tuple: (container, True if an existing container was reused).
+    """
+    current_id = model_id(model_path)
+    filters = {"label": [POOL_LABEL, f"{IMAGE_LABEL}={tag}", f"{MODEL_LABEL}={model_path}"],
+               "status": "running"}
+    for container in client.containers.list(filters=filters):
+        if container.labels.get(MODEL_ID_LABEL) == current_id:
+            return container, True
+        container.stop(timeout=5)
+
+    idle_loop = IDLE_LOOP.format(last_used=LAST_USED_FILE, idle=int(idle_timeout))
+    container = client.containers.run(tag,
+                                      command=["python3", "-c", idle_loop],
+                                      volumes={model_path: {"bind": MODEL_MOUNT, "mode": "ro"}},
+                                      labels={POOL_LABEL: "1", IMAGE_LABEL: tag, MODEL_LABEL: model_path,
+                                              MODEL_ID_LABEL: current_id},
+                                      detach=True,
+                                      init=True,
+                                      remove=True)
+    return container, False
+
+
+def run_warm(client, tag, model_path, run_flags, echo=True, idle_timeout=600, telemetry_interval=None,
+             token_counter=None):
+    """Run an image on a model inside its warm container.
+
+    Takes the same arguments and returns the same result dict as
+    runner.run_container, plus "warm": whether the container was reused.
+    Resource metrics cover the whole container, i.e. also its idle loop.
+    """
+    import docker
+    from .telemetry import ContainerSampler
+
+    t_begin = time.perf_counter()
+    container, reused = get_warm_container(client, tag, model_path, idle_timeout)
+
+    command = ["/bin/sh", "-c", f"touch {LAST_USED_FILE}; {CLI_COMMAND}{run_flags}; "
+                                f"status=$?; touch {LAST_USED_FILE}; exit $status"]
+    try:
+        exec_id = client.api.exec_create(container.id, command, tty=True)["Id"]
+    except docker.errors.APIError:
+        # The idle loop exited after the container was found running: wait
+        # until it is gone and start a new one.
+        try:
+            container.wait(timeout=30)
+        except (docker.errors.APIError, OSError):
+            pass
+        container, reused = get_warm_container(client, tag, model_path, idle_timeout)
+        exec_id = client.api.exec_create(container.id, command, tty=True)["Id"]
+    sampler = ContainerSampler(client, container, telemetry_interval, fresh=False) if telemetry_interval else None
+    if sampler:
+        sampler.start()
+    stream = client.api.exec_start(exec_id, tty=True, stream=True)
+    t_started = time.perf_counter()
+
+    output, token_timer = collect_output(stream, echo, token_counter)
+    exit_code = client.api.exec_inspect(exec_id)["ExitCode"]
+    t_end = time.perf_counter()
+    telemetry = sampler.stop() if sampler else {}
+
+    result = build_result(tag, model_path, run_flags, exit_code, output, token_timer,
+                          t_begin, t_started, t_end)
+    result["warm"] = reused
+    result.update(telemetry)
+    return result
+
+
+def stop_warm_containers(client, tag=None):
+    """Stop warm containers (they are removed when stopped).
+
+    Returns:
+        list: Image tags of the stopped containers.
+    """
+    stopped = []
+    for container in list_warm_containers(client, tag):
+        container.stop(timeout=5)
+        stopped.append(container.labels.get(IMAGE_LABEL, container.name))
+    return stopped
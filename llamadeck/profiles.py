@@ -0,0 +1,100 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Named resource profiles that emulate smaller devices.
+
+A profile (config.resource_profiles) limits a container to a number of
+CPUs and an amount of memory. The CPUs are enforced twice: the container
+is pinned to that many CPUs of its slot (cpuset, so the implementation
+sees that many cores) and gets a CFS quota of the same CPU time (so
+fractional profiles such as 0.5 CPUs work). The memory limit has no swap
+on top of it, so an implementation that needs more is OOM-killed, like on
+a device without swap.
+"""
+
+import math
+import re
+
+from . import config
+
+MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def parse_memory(text):
+    """Parse a memory size such as "512m", "1.5g" or "1073741824" into bytes."""
+    match = re.fullmatch(r"\s*([0-9]+(?:\.[0-9]+)?)\s*([bkmg]?)(?:i?b)?\s*", str(text).lower())
+    if not match:
+        raise ValueError(f"Invalid memory size: {text}")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+def get_profile(name):
+    """Get a resource profile by name.
+
+    Returns:
+        dict: cpus (float) and memory (bytes) of the profile.
+    Raises:
+        ValueError: If there is no such profile or it is invalid.
+    """
+    if name not in config.resource_profiles:
+        raise ValueError(f"No resource profile named {name}, available: "
+                         f"{', '.join(config.resource_profiles)}")
+    profile = config.resource_profiles[name]
+    cpus = float(profile["cpus"])
+    if cpus <= 0:
+        raise ValueError(f"Resource profile {name} must have more than 0 cpus")
+    return {"cpus": cpus, "memory": parse_memory(profile["memory"])}
+
+
+def profile_cpus(name):
+    """Number of whole CPUs a profile is pinned to."""
+    return math.ceil(get_profile(name)["cpus"])
+
+
+def container_options(name, slot=None):
+    """Container options that apply a profile.
+
+    Args:
+        name (str): Profile name.
+        slot (dict): Container options of the slot the run takes (see
+            scheduler.make_slots); its first CPUs become the cpuset.
+    Returns:
+        dict: The slot's options with cpuset_cpus, nano_cpus, mem_limit and memswap_limit.
+    """
+    from .scheduler import parse_cpulist, make_slots
+
+    profile = get_profile(name)
+    cpus = math.ceil(profile["cpus"])
+    options = dict(slot or make_slots(1, cpus)[0])
+    slot_cpus = parse_cpulist(options["cpuset_cpus"])
+    if len(slot_cpus) < cpus:
+        raise ValueError(f"Resource profile {name} needs {cpus} CPUs, the slot has {len(slot_cpus)}")
+
+    options.update(cpuset_cpus=",".join(str(cpu) for cpu in slot_cpus[:cpus]),
+                   nano_cpus=int(profile["cpus"] * 1e9),
+                   mem_limit=profile["memory"],
+                   memswap_limit=profile["memory"])
+    return options
+
+
+def profile_rows():
+    """Table rows of the available profiles."""
+    rows = []
+    for name in config.resource_profiles:
+        profile = get_profile(name)
+        rows.append({"Profile": name,
+                     "CPUs": f"{profile['cpus']:g}",
+                     "Memory": f"{profile['memory'] / 1024 ** 2:.0f} MiB"})
+    return rows
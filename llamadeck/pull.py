@@ -0,0 +1,141 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent image pulls through the Docker SDK streaming API.
+
+The JSON progress events of all pulls are merged into one progress line
+that counts layers instead of printing one line per layer and image. Layers
+reported as "Already exists", or pulled by another selected image, are
+counted as reused.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class PullProgress:
+    """Per-layer state of several concurrent pulls."""
+
+    def __init__(self, total_images):
+        self.total_images = total_images
+        self.finished_images = 0
+        # layer id -> {"current", "total", "done"}
+        self.layers = {}
+        # layer id -> tags that reference the layer
+        self.layer_images = {}
+        # (tag, layer id) of layers that already existed locally
+        self.existing_layers = set()
+        self.lock = threading.Lock()
+        self.last_print = 0.0
+
+    def update(self, tag, event):
+        layer = event.get("id")
+        status = event.get("status", "")
+        if not layer or layer == tag.rsplit(":", 1)[-1]:
+            return
+
+        with self.lock:
+            self.layer_images.setdefault(layer, set()).add(tag)
+            state = self.layers.setdefault(layer, {"current": 0, "total": 0, "done": False})
+
+            if status == "Already exists":
+                self.existing_layers.add((tag, layer))
+                state["done"] = True
+            elif status == "Downloading":
+                detail = event.get("progressDetail") or {}
+                state["current"] = detail.get("current", state["current"])
+                state["total"] = detail.get("total", state["total"])
+            elif status in ("Download complete", "Verifying Checksum"):
+                state["current"] = state["total"]
+            elif status == "Pull complete":
+                state["current"] = state["total"]
+                state["done"] = True
+
+            if time.monotonic() - self.last_print >= 0.2:
+                self._print()
+
+    def finish_image(self):
+        with self.lock:
+            self.finished_images += 1
+            self._print()
+
+    def image_stats(self, tag):
+        """Layer counts of one image: (layers, reused layers, downloaded bytes)."""
+        with self.lock:
+            layers = [layer for layer, tags in self.layer_images.items() if tag in tags]
+            reused = [layer for layer in layers
+                      if (tag, layer) in self.existing_layers or len(self.layer_images[layer]) > 1]
+            downloaded = sum(self.layers[layer]["total"] for layer in layers
+                             if (tag, layer) not in self.existing_layers)
+        return len(layers), len(reused), downloaded
+
+    def _print(self):
+        done = sum(1 for state in self.layers.values() if state["done"])
+        current = sum(state["current"] for state in self.layers.values()) / 1024 / 1024
+        total = sum(state["total"] for state in self.layers.values()) / 1024 / 1024
+        shared = sum(1 for tags in self.layer_images.values() if len(tags) > 1)
+        existing = len({layer for _, layer in self.existing_layers})
+        print(f"Pulling images...[{self.finished_images}/{self.total_images}] "
+              f"layers: {done}/{len(self.layers)} done, {existing} already exist, "
+              f"{shared} shared, {current:.1f}/{total:.1f} MB   ", end="\r", flush=True)
+        self.last_print = time.monotonic()
+
+
+def _pull_image(client, tag, progress):
+    repository, image_tag = tag.rsplit(":", 1)
+    for event in client.api.pull(repository, tag=image_tag, stream=True, decode=True):
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        progress.update(tag, event)
+
+
+def pull_images(client, tags, max_workers=3):
+    """Pull several images at the same time.
+
+    Args:
+        client (docker.DockerClient): Docker client to use.
+        tags (list): Full image references, e.g. "bufan0222/ll_implements:llama2.c_karpathy".
+        max_workers (int): Max number of images pulled at the same time.
+    Returns:
+        list: dicts with tag, status, layer counts and downloaded size of each image.
+    """
+    results = {}
+    if not tags:
+        return []
+
+    progress = PullProgress(len(tags))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tags)))) as executor:
+        futures = {executor.submit(_pull_image, client, tag, progress): tag for tag in tags}
+        for future in as_completed(futures):
+            tag = futures[future]
+            try:
+                future.result()
+                results[tag] = "installed"
+            except Exception as e:
+                results[tag] = "failed: " + (str(e) or type(e).__name__)
+            progress.finish_image()
+    print()
+
+    summary = []
+    for tag in tags:
+        layers, reused, downloaded = progress.image_stats(tag)
+        summary.append({"Image": tag,
+                        "Status": results[tag],
+                        "Layers": layers,
+                        "Reused layers": reused,
+                        "Downloaded": f"{downloaded / 1024 / 1024:.1f} MB"})
+    return summary
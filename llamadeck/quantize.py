@@ -0,0 +1,154 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Group-wise int8 (Q8_0) quantization of llama2.c models.
+
+Writes the version 2 format of llama2.c's export.py, which runq.c and
+other int8 implementations read: every matrix is split into groups of
+group_size values, and each group is stored as int8 values plus one fp32
+scale (its max absolute value / 127). The norm weights stay fp32.
+
+The source model is memory mapped and quantized in chunks of rows that are
+written out as they are done, so peak RAM stays around CHUNK_VALUES fp32
+values plus the scales of one matrix, whatever the size of the model.
+"""
+
+import os
+import struct
+
+from .modelinfo import (MAGIC, HEADER_FIELDS, VERSIONED_HEADER_SIZE, read_model_config, map_weights,
+                        quantized_layout)
+
+DEFAULT_GROUP_SIZE = 64
+
+# fp32 values quantized at a time
+CHUNK_VALUES = 4 * 1024 * 1024
+
+
+def choose_group_size(model_config, group_size=DEFAULT_GROUP_SIZE):
+    """Largest group size up to `group_size` that divides the rows of every matrix, like export.py."""
+    while group_size > 1 and (model_config["dim"] % group_size or model_config["hidden_dim"] % group_size):
+        group_size //= 2
+    return group_size
+
+
+def quantize_q80(values, group_size):
+    """Quantize fp32 values (a multiple of group_size of them) to int8 groups.
+
+    Returns:
+        tuple: (int8 values, fp32 scales, dequantized values).
+    """
+    import numpy as np
+
+    groups = values.reshape(-1, group_size).astype(np.float32)
+    scales = np.abs(groups).max(axis=1) / np.float32(127.0)
+    scaled = np.divide(groups, scales[:, None], out=np.zeros_like(groups), where=scales[:, None] > 0)
+    quantized = np.round(scaled).astype(np.int8)
+    dequantized = quantized.astype(np.float32) * scales[:, None]
+    return quantized, scales, dequantized.reshape(values.shape)
+
+
+class TensorError:
+    """Accumulates the reconstruction error of a tensor over its chunks."""
+
+    def __init__(self, name, shape):
+        self.name = name
+        self.shape = shape
+        self.max_error = 0.0
+        self.squared_error = 0.0
+        self.squared_values = 0.0
+        self.count = 0
+
+    def add(self, values, dequantized):
+        import numpy as np
+
+        error = (dequantized - values).astype(np.float64)
+        self.max_error = max(self.max_error, float(np.abs(error).max()))
+        self.squared_error += float(np.square(error).sum())
+        self.squared_values += float(np.square(values, dtype=np.float64).sum())
+        self.count += values.size
+
+    def row(self):
+        rms_error = (self.squared_error / self.count) ** 0.5
+        rms = (self.squared_values / self.count) ** 0.5
+        return {"Tensor": self.name,
+                "Shape": "x".join(str(size) for size in self.shape),
+                "Max abs error": f"{self.max_error:.3g}",
+                "RMS error": f"{rms_error:.3g}",
+                "Relative RMS error": f"{rms_error / rms:.2%}" if rms else "-"}
+
+
+def _write_matrix(f, matrix, group_size, error):
+    """Quantize a 2D matrix chunk by chunk: write its int8 values, then its scales."""
+    import numpy as np
+
+    rows, cols = matrix.shape
+    chunk_rows = max(1, CHUNK_VALUES // cols)
+    scales = []
+    for start in range(0, rows, chunk_rows):
+        values = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        quantized, chunk_scales, dequantized = quantize_q80(values, group_size)
+        error.add(values, dequantized)
+        f.write(quantized.tobytes())
+        scales.append(chunk_scales)
+    f.write(np.concatenate(scales).astype("<f4").tobytes())
+
+
+def quantize_model(model_path, output_path, group_size=DEFAULT_GROUP_SIZE):
+    """Quantize an fp32 llama2.c model to a version 2 int8 model.
+
+    Args:
+        model_path (str): fp32 (legacy or version 1) model.
+        output_path (str): Quantized model to write.
+        group_size (int): Values per scale, reduced until it divides dim and hidden_dim.
+    Returns:
+        list: Reconstruction error of every quantized tensor, as table rows.
+    Raises:
+        ImportError: If NumPy is not installed.
+        ValueError: If the model is not an fp32 llama2.c model.
+    """
+    import numpy as np
+
+    model_config = read_model_config(model_path)
+    if model_config["version"] == 2:
+        raise ValueError(f"{model_path} is already quantized")
+    group_size = choose_group_size(model_config, group_size)
+    if group_size < 2:
+        raise ValueError(f"dim {model_config['dim']} and hidden_dim {model_config['hidden_dim']} "
+                         "can't be split into groups")
+
+    weights = map_weights(model_path, model_config)
+    fp32, quantized = quantized_layout(model_config)
+
+    header = struct.pack("<Ii7iBi", MAGIC, 2, *(model_config[field] for field in HEADER_FIELDS),
+                         int(model_config["shared_classifier"]), group_size)
+    errors = []
+    tmp_path = output_path + ".part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header.ljust(VERSIONED_HEADER_SIZE, b"\0"))
+            for name, _ in fp32:
+                f.write(np.asarray(weights[name], dtype="<f4").tobytes())
+            for name, shape in quantized:
+                error = TensorError(name, shape)
+                matrices = weights[name] if len(shape) == 3 else [weights[name]]
+                for matrix in matrices:
+                    _write_matrix(f, matrix, group_size, error)
+                errors.append(error.row())
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return errors
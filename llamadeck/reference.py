@@ -0,0 +1,318 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Built-in NumPy reference implementation of llama2.c.
+
+The forward pass, sampler (temperature, top-p, xorshift RNG seeded with -s)
+and tokenizer (see tokenizer.py) follow run.c, vectorized with NumPy, and the weights are
+memory mapped from the same .bin models the images run. It is selectable
+as the pseudo-image REFERENCE_IMAGE in run_img and bench: it needs no
+Docker image, gives a CPU baseline to normalize the throughput of
+implementations against, and its text is a correctness oracle for them
+(with the same seed and flags, llama2.c ports should generate the same
+text, up to floating point differences). Int8 (version 2) models run like
+runq.c: activations are quantized to int8 in groups before every matmul.
+
+NumPy is an optional dependency, only needed to run the reference image.
+"""
+
+import codecs
+import os
+import sys
+import time
+import traceback
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .modelinfo import read_model_config, map_weights
+from .runner import GENERATION_MARKER, TokenTimer, build_result, parse_run_flags
+from .tokenizer import BOS, load_tokenizer
+
+REFERENCE_IMAGE = "llamadeck/reference:numpy"
+
+
+def is_reference(tag):
+    """Check if an image tag is the reference pseudo-image."""
+    return tag == REFERENCE_IMAGE
+
+
+def reference_available():
+    """Check if NumPy is installed, so the reference image can run."""
+    return np is not None
+
+
+def reference_digest():
+    """Digest identifying the version of the reference implementation, None without NumPy."""
+    import hashlib
+
+    if np is None:
+        return None
+    with open(__file__, "rb") as f:
+        digest = hashlib.sha256(f.read() + np.__version__.encode())
+    return "sha256:" + digest.hexdigest()
+
+
+class Transformer:
+    """llama2.c transformer with memory mapped weights and a KV cache."""
+
+    def __init__(self, model_path):
+        if np is None:
+            raise ImportError("The reference implementation needs NumPy: pip install llama-deck[reference]")
+
+        self.config = read_model_config(model_path)
+        c = self.config
+        self.dim, self.n_layers = c["dim"], c["n_layers"]
+        self.n_heads, self.n_kv_heads = c["n_heads"], c["n_kv_heads"]
+        self.head_size = self.dim // self.n_heads
+        self.kv_dim = self.head_size * self.n_kv_heads
+        self.seq_len, self.vocab_size = c["seq_len"], c["vocab_size"]
+
+        self.group_size = c["group_size"]
+        self.weights = map_weights(model_path, c)
+        self.weights.setdefault("wcls", self.weights["token_embedding"])
+
+        self.key_cache = np.zeros((self.n_layers, self.seq_len, self.kv_dim), dtype=np.float32)
+        self.value_cache = np.zeros_like(self.key_cache)
+        # query head -> key/value head (grouped-query attention)
+        self.kv_head = np.arange(self.n_heads) // (self.n_heads // self.n_kv_heads)
+        head_dim = np.arange(0, self.dim, 2) % self.head_size
+        self.inv_freq = (1.0 / 10000.0 ** (head_dim / self.head_size)).astype(np.float32)
+
+    @staticmethod
+    def _rmsnorm(x, weight):
+        return weight * (x / np.sqrt(np.mean(x * x) + 1e-5))
+
+    def _quantize(self, x):
+        """Quantize a vector to int8 in groups like runq.c, as (values, scales)."""
+        groups = x.reshape(-1, self.group_size)
+        scales = np.abs(groups).max(axis=1) / np.float32(127.0)
+        scaled = np.divide(groups, scales[:, None], out=np.zeros_like(groups), where=scales[:, None] > 0)
+        # roundf rounds halfway cases away from zero
+        values = np.sign(scaled) * np.floor(np.abs(scaled) + np.float32(0.5))
+        return values.astype(np.int8), scales
+
+    def _matmul(self, w, x):
+        """w @ x, for fp32 arrays and (int8 values, scales) pairs."""
+        if not isinstance(w, tuple):
+            return w @ x
+        values, scales = w
+        x_values, x_scales = self._quantize(x)
+        rows = values.shape[0]
+        # int8 products summed over a group in int32, like runq.c
+        dots = np.einsum("rgk,gk->rg", values.reshape(rows, -1, self.group_size).astype(np.int32),
+                         x_values.astype(np.int32))
+        return (dots.astype(np.float32) * scales * x_scales).sum(axis=1, dtype=np.float32)
+
+    def _embedding(self, token):
+        embedding = self.weights["token_embedding"]
+        if not isinstance(embedding, tuple):
+            return np.array(embedding[token], dtype=np.float32)
+        values, scales = embedding
+        groups = values[token].reshape(-1, self.group_size).astype(np.float32)
+        return (groups * scales[token][:, None]).reshape(self.dim)
+
+    def _rope(self, vector, pos):
+        angle = pos * self.inv_freq[:vector.shape[0] // 2]
+        cos, sin = np.cos(angle), np.sin(angle)
+        pairs = vector.reshape(-1, 2)
+        v0, v1 = pairs[:, 0].copy(), pairs[:, 1].copy()
+        pairs[:, 0] = v0 * cos - v1 * sin
+        pairs[:, 1] = v0 * sin + v1 * cos
+
+    def forward(self, token, pos):
+        """Logits of the next token after `token` at position `pos`."""
+
+        w = self.weights
+        x = self._embedding(token)
+        scale = np.float32(1.0 / np.sqrt(self.head_size))
+
+        for layer in range(self.n_layers):
+            xb = self._rmsnorm(x, w["rms_att"][layer])
+            q = self._matmul(w["wq"][layer], xb)
+            k = self._matmul(w["wk"][layer], xb)
+            v = self._matmul(w["wv"][layer], xb)
+            self._rope(q, pos)
+            self._rope(k, pos)
+            self.key_cache[layer, pos] = k
+            self.value_cache[layer, pos] = v
+
+            keys = self.key_cache[layer, :pos + 1].reshape(pos + 1, self.n_kv_heads, self.head_size)
+            values = self.value_cache[layer, :pos + 1].reshape(pos + 1, self.n_kv_heads, self.head_size)
+            keys, values = keys[:, self.kv_head], values[:, self.kv_head]
+            scores = np.einsum("hd,thd->ht", q.reshape(self.n_heads, self.head_size), keys) * scale
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+            xb = np.einsum("ht,thd->hd", scores, values).reshape(self.dim)
+
+            x = x + self._matmul(w["wo"][layer], xb)
+            xb = self._rmsnorm(x, w["rms_ffn"][layer])
+            hb = self._matmul(w["w1"][layer], xb)
+            hb = hb / (1.0 + np.exp(-hb)) * self._matmul(w["w3"][layer], xb)
+            x = x + self._matmul(w["w2"][layer], hb)
+
+        x = self._rmsnorm(x, w["rms_final"])
+        return self._matmul(w["wcls"], x)
+
+
+class Sampler:
+    """run.c sampler: greedy, multinomial or top-p with its xorshift RNG."""
+
+    def __init__(self, temperature, top_p, seed):
+        self.temperature = temperature
+        self.top_p = top_p
+        self.state = seed & 0xFFFFFFFFFFFFFFFF
+
+    def _random_u32(self):
+        state = self.state
+        state ^= state >> 12
+        state ^= (state << 25) & 0xFFFFFFFFFFFFFFFF
+        state ^= state >> 27
+        self.state = state
+        return ((state * 0x2545F4914F6CDD1D) & 0xFFFFFFFFFFFFFFFF) >> 32
+
+    def _random_f32(self):
+        return (self._random_u32() >> 8) / 16777216.0
+
+    def sample(self, logits):
+        if self.temperature == 0:
+            return int(np.argmax(logits))
+
+        logits = logits / np.float32(self.temperature)
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        coin = self._random_f32()
+
+        if self.top_p <= 0 or self.top_p >= 1:
+            index = int(np.searchsorted(np.cumsum(probs), coin, side="right"))
+            return min(index, len(probs) - 1)
+
+        # top-p: smallest set of most likely tokens whose probability exceeds top_p
+        cutoff = (1.0 - self.top_p) / (len(probs) - 1)
+        candidates = np.nonzero(probs >= cutoff)[0]
+        candidates = candidates[np.argsort(-probs[candidates], kind="stable")]
+        cumulative = np.cumsum(probs[candidates])
+        last = min(int(np.searchsorted(cumulative, self.top_p, side="right")), len(candidates) - 1)
+        index = int(np.searchsorted(cumulative[:last + 1], coin * cumulative[last], side="right"))
+        return int(candidates[min(index, last)])
+
+
+def default_tokenizer_path(model_path, resources_path=None):
+    """tokenizer.bin of the resources directory the model is installed in, else of `resources_path`."""
+    candidates = [os.path.join(os.path.dirname(os.path.dirname(model_path)), "llamaTokenizers", "tokenizer.bin"),
+                  os.path.join(os.path.dirname(model_path), "tokenizer.bin")]
+    if resources_path:
+        candidates.append(os.path.join(resources_path, "llamaTokenizers", "tokenizer.bin"))
+
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return candidates[-1]
+
+
+def generate(model_path, run_flags, write, resources_path=None):
+    """Generate text like run.c, writing the output with `write`.
+
+    Args:
+        resources_path (str): Resources directory of the default tokenizer
+            and the tokenizer cache, None to not use one.
+    Returns:
+        int: Exit code of the run.
+    """
+    flags = parse_run_flags(run_flags)
+    if flags.get("-m", "generate") != "generate":
+        write("The reference implementation only supports generate mode.\n")
+        return 1
+
+    transformer = Transformer(model_path)
+    tokenizer = load_tokenizer(flags.get("-z") or default_tokenizer_path(model_path, resources_path),
+                               transformer.vocab_size,
+                               resources_path and os.path.join(resources_path, "llamaCache", "tokenizers"))
+    temperature = max(float(flags.get("-t", 1.0)), 0.0)
+    top_p = float(flags.get("-p", 0.9))
+    seed = int(flags.get("-s", 0))
+    sampler = Sampler(temperature, top_p if 0.0 <= top_p <= 1.0 else 0.9,
+                      seed if seed > 0 else int(time.time()))
+    steps = int(flags.get("-n", 256))
+    if steps <= 0 or steps > transformer.seq_len:
+        steps = transformer.seq_len
+
+    write(f"{GENERATION_MARKER} numpy reference {run_flags.strip()}\n")
+    prompt_tokens = tokenizer.encode(flags.get("-i", ""), bos=True, eos=False)
+
+    # byte tokens of a multi-byte character are printed once the character is complete
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    token = prompt_tokens[0]
+    pos = 0
+    start = None
+    while pos < steps:
+        logits = transformer.forward(token, pos)
+        if pos < len(prompt_tokens) - 1:
+            next_token = prompt_tokens[pos + 1]
+        else:
+            next_token = sampler.sample(logits)
+        pos += 1
+        if next_token == BOS:
+            break
+
+        piece = tokenizer.decode_piece(token, next_token)
+        if len(piece) != 1 or chr(piece[0]).isprintable() or chr(piece[0]).isspace():
+            text = utf8.decode(piece)
+            if text:
+                write(text)
+        token = next_token
+        if start is None:
+            start = time.perf_counter()
+
+    write(utf8.decode(b"", final=True) + "\n")
+    if pos > 1 and start is not None:
+        elapsed = time.perf_counter() - start
+        write(f"achieved tok/s: {(pos - 1) / elapsed if elapsed > 0 else 0:f}\n")
+    return 0
+
+
+def run_reference(tag, model_path, run_flags, echo=True, resources_path=None, **options):
+    """Run the reference implementation in-process.
+
+    Takes the same arguments and returns the same result dict as
+    runner.run_container; container options (cpuset etc.) are ignored.
+
+    Args:
+        resources_path (str): Resources directory of the default tokenizer
+            and the tokenizer cache.
+    """
+    chunks = []
+    token_timer = TokenTimer()
+
+    def write(text):
+        token_timer.feed(text, time.perf_counter())
+        chunks.append(text)
+        if echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    t_begin = time.perf_counter()
+    t_started = t_begin
+    try:
+        exit_code = generate(model_path, run_flags, write, resources_path)
+    except Exception:
+        write(traceback.format_exc())
+        exit_code = 1
+    t_end = time.perf_counter()
+
+    return build_result(tag, model_path, run_flags, exit_code, "".join(chunks), token_timer,
+                        t_begin, t_started, t_end)
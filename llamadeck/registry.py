@@ -0,0 +1,124 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of the image registry tag list.
+
+The tag list is fetched page by page from the Docker Hub API: the first page
+gives the total count, the remaining pages are fetched concurrently. The
+result is cached in a JSON file. Within the TTL the cache is used as is;
+after it, the first page is revalidated with If-None-Match and the whole
+list is only refetched if it changed. If the registry can't be reached, the
+cached list is used regardless of its age.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PAGE_SIZE = 100
+TIMEOUT = 15
+
+
+def _page_url(url, page):
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}page_size={PAGE_SIZE}&page={page}"
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cache(cache_path, cache):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def _fetch_page(session, url, page):
+    response = session.get(_page_url(url, page), timeout=TIMEOUT)
+    response.raise_for_status()
+    return response.json()["results"]
+
+
+def _fetch_all_pages(session, url, first_page, max_workers):
+    results = list(first_page["results"])
+    count = first_page.get("count", len(results))
+    num_pages = -(-count // PAGE_SIZE)
+
+    if num_pages > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = executor.map(lambda page: _fetch_page(session, url, page), range(2, num_pages + 1))
+            for page_results in pages:
+                results.extend(page_results)
+
+    return results
+
+
+def fetch_image_catalog(url, cache_path, ttl=3600, refresh=False, max_workers=8):
+    """Get every tag of an image repository, from the cache when possible.
+
+    Args:
+        url (str): Docker Hub API URL of the repository tags.
+        cache_path (str): Path of the JSON cache file.
+        ttl (int): Seconds a cached list is used without revalidation.
+        refresh (bool): Ignore the TTL and revalidate the cache now.
+        max_workers (int): Max number of pages fetched at the same time.
+    Returns:
+        list: The "results" entries of all pages.
+    """
+    cache = _load_cache(cache_path)
+    if cache and cache.get("url") == url:
+        if not refresh and time.time() - cache["fetched_at"] < ttl:
+            return cache["results"]
+    else:
+        cache = None
+
+    headers = {}
+    if cache and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+
+    try:
+        with requests.Session() as session:
+            response = session.get(_page_url(url, 1), headers=headers, timeout=TIMEOUT)
+
+            if response.status_code == 304:
+                cache["fetched_at"] = time.time()
+                _save_cache(cache_path, cache)
+                return cache["results"]
+
+            response.raise_for_status()
+            first_page = response.json()
+
+            results = _fetch_all_pages(session, url, first_page, max_workers)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        if cache:
+            print(f"Image registry unreachable ({type(e).__name__}), using cached image list.")
+            return cache["results"]
+        raise
+
+    _save_cache(cache_path, {"url": url,
+                             "fetched_at": time.time(),
+                             "etag": response.headers.get("ETag"),
+                             "results": results})
+    return results
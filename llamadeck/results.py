@@ -0,0 +1,329 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent SQLite database of runs and benchmarks, and regression checks.
+
+Every run_img/bench/batch invocation is a session; each of its runs is
+stored with the image ID (digest), the model SHA-256, the flags, the host
+CPU and all measured metrics. `compare` matches runs of two sessions or two
+image versions by (model, flags) and uses Welch's t-test on their
+throughput to tell real regressions from noise.
+"""
+
+import math
+import os
+import platform
+import sqlite3
+import statistics
+import threading
+import time
+
+from .store import sha256_file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    command TEXT NOT NULL,
+    host_cpu TEXT,
+    host_cores INTEGER,
+    host_platform TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    image TEXT NOT NULL,
+    image_digest TEXT,
+    model TEXT,
+    model_sha256 TEXT,
+    flags TEXT,
+    exit_code INTEGER,
+    tokens INTEGER,
+    tok_s REAL,
+    reported_tok_s REAL,
+    decode_tok_s REAL,
+    ttft REAL,
+    itl_p50 REAL,
+    itl_p95 REAL,
+    itl_p99 REAL,
+    wall_time REAL,
+    start_overhead REAL,
+    peak_memory INTEGER,
+    prompt_tokens INTEGER,
+    generated_tokens INTEGER,
+    avg_memory INTEGER,
+    cpu_util REAL,
+    page_faults INTEGER,
+    major_page_faults INTEGER,
+    io_read_bytes INTEGER,
+    io_write_bytes INTEGER,
+    profile TEXT,
+    oom_killed INTEGER,
+    threads INTEGER
+);
+CREATE TABLE IF NOT EXISTS model_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_session ON runs(session_id);
+CREATE INDEX IF NOT EXISTS runs_image ON runs(image, image_digest);
+"""
+
+RUN_COLUMNS = ["image", "image_digest", "model", "model_sha256", "flags", "exit_code", "tokens",
+               "tok_s", "reported_tok_s", "decode_tok_s", "ttft", "itl_p50", "itl_p95", "itl_p99",
+               "wall_time", "start_overhead", "peak_memory", "prompt_tokens", "generated_tokens",
+               "avg_memory", "cpu_util", "page_faults", "major_page_faults", "io_read_bytes", "io_write_bytes",
+               "profile", "oom_killed", "threads"]
+
+# Columns added after the first version of the database: name -> type
+ADDED_COLUMNS = {"prompt_tokens": "INTEGER", "generated_tokens": "INTEGER",
+                 "avg_memory": "INTEGER", "cpu_util": "REAL", "page_faults": "INTEGER",
+                 "major_page_faults": "INTEGER", "io_read_bytes": "INTEGER", "io_write_bytes": "INTEGER",
+                 "profile": "TEXT", "oom_killed": "INTEGER", "threads": "INTEGER"}
+
+
+def host_cpu():
+    """CPU model name of the host."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+class ResultsDB:
+    """Results database at `<resources_path>/llamaResults/results.db`."""
+
+    def __init__(self, resources_path):
+        self.path = os.path.join(resources_path, "llamaResults", "results.db")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(runs)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE runs ADD COLUMN {column} {column_type}")
+        self.lock = threading.Lock()
+        self.session_id = None
+
+    def start_session(self, command):
+        """Start a session, the runs recorded afterwards belong to it."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO sessions (created_at, command, host_cpu, host_cores, host_platform) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (time.strftime("%Y-%m-%d %H:%M:%S"), command, host_cpu(), os.cpu_count(),
+                 platform.platform()))
+            self.session_id = cursor.lastrowid
+        return self.session_id
+
+    def record(self, result, image_digest=None, model_sha256=None):
+        """Store the result dict of a run in the current session."""
+        row = dict(result, image_digest=image_digest, model_sha256=model_sha256)
+        values = [row.get(column) for column in RUN_COLUMNS]
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO runs (session_id, {', '.join(RUN_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(RUN_COLUMNS))})",
+                [self.session_id] + values)
+
+    def model_sha256(self, path, store=None):
+        """SHA-256 of a model file, None if it does not exist.
+
+        Taken from the model store if the file is one of its entries, else
+        hashed once and cached by path, size and mtime.
+        """
+        path = os.path.abspath(path)
+        if store is not None and store.is_installed(path):
+            return store.index["entries"][path]["sha256"]
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        row = self.conn.execute("SELECT sha256 FROM model_hashes WHERE path = ? AND size = ? AND mtime = ?",
+                                (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row:
+            return row["sha256"]
+
+        print("Hashing model:", path)
+        sha256 = sha256_file(path)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO model_hashes VALUES (?, ?, ?, ?)",
+                              (path, stat.st_size, stat.st_mtime, sha256))
+        return sha256
+
+    def sessions(self, limit=20):
+        """Latest sessions with their number of runs."""
+        return self.conn.execute(
+            "SELECT s.id, s.created_at, s.command, s.host_cpu, COUNT(r.id) AS runs "
+            "FROM sessions s LEFT JOIN runs r ON r.session_id = s.id "
+            "GROUP BY s.id ORDER BY s.id DESC LIMIT ?", (limit,)).fetchall()
+
+    def select_runs(self, selector):
+        """Get the successful runs of a selector.
+
+        Args:
+            selector (str): A session id, or an image as "<tag>" or
+                "<tag>@<image ID prefix>" for one version of an image (the
+                commit prefix for native pseudo-images, see native.py).
+        Returns:
+            list: sqlite3.Row of each run.
+        """
+        query = ("SELECT runs.*, sessions.host_cpu FROM runs "
+                 "JOIN sessions ON sessions.id = runs.session_id WHERE runs.exit_code = 0 AND ")
+        if selector.isdigit():
+            return self.conn.execute(query + "runs.session_id = ?", (int(selector),)).fetchall()
+
+        from .native import NATIVE_PREFIX, is_native
+
+        tag, _, digest = selector.partition("@")
+        if digest:
+            scheme = NATIVE_PREFIX if is_native(tag) else "sha256:"
+            digest = digest if digest.startswith(scheme) else scheme + digest
+            return self.conn.execute(query + "runs.image = ? AND runs.image_digest LIKE ?",
+                                     (tag, digest + "%")).fetchall()
+        return self.conn.execute(query + "runs.image = ?", (tag,)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def _throughput(run):
+    return run["reported_tok_s"] if run["reported_tok_s"] is not None else run["tok_s"]
+
+
+def _betacf(a, b, x):
+    """Continued fraction of the regularized incomplete beta function."""
+    qab, qap, qam = a + b, a + 1, a - 1
+    c, d = 1.0, 1 - qab * x / qap
+    d = 1 / (d if abs(d) > 1e-30 else 1e-30)
+    h = d
+    for m in range(1, 201):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1 + aa * d
+        d = 1 / (d if abs(d) > 1e-30 else 1e-30)
+        c = 1 + aa / c if abs(1 + aa / c) > 1e-30 else 1e-30
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1 + aa * d
+        d = 1 / (d if abs(d) > 1e-30 else 1e-30)
+        c = 1 + aa / c if abs(1 + aa / c) > 1e-30 else 1e-30
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1 - front * _betacf(b, a, 1 - x) / b
+
+
+def welch_t_test(a, b):
+    """Two-sided Welch's t-test.
+
+    Returns:
+        float or None: p-value, None if a sample has fewer than 2 values.
+    """
+    if len(a) < 2 or len(b) < 2:
+        return None
+    var_a, var_b = statistics.variance(a) / len(a), statistics.variance(b) / len(b)
+    if var_a + var_b == 0:
+        return 0.0 if statistics.mean(a) != statistics.mean(b) else 1.0
+
+    t = (statistics.mean(a) - statistics.mean(b)) / math.sqrt(var_a + var_b)
+    df = (var_a + var_b) ** 2 / (var_a ** 2 / (len(a) - 1) + var_b ** 2 / (len(b) - 1))
+    return _betainc(df / 2, 0.5, df / (df + t * t))
+
+
+def compare_runs(runs_a, runs_b, threshold=0.05, alpha=0.05):
+    """Compare the throughput of two sets of runs, matched by model, flags, resource profile and threads.
+
+    When both sides are a single image (e.g. two versions of an image), runs
+    are matched by (model, flags, profile, threads); otherwise by (image,
+    model, flags, profile, threads).
+
+    Args:
+        runs_a (list): Baseline runs.
+        runs_b (list): Runs to compare with the baseline.
+        threshold (float): Relative throughput drop counted as a regression.
+        alpha (float): Significance level of the t-test.
+    Returns:
+        list: One dict per matched group, with means, change, p-value and verdict.
+    """
+    same_image = len({r["image"] for r in runs_a}) == 1 and len({r["image"] for r in runs_b}) == 1
+
+    def group(runs):
+        groups = {}
+        for run in runs:
+            model = run["model_sha256"] or run["model"]
+            key = (model, run["flags"], run["profile"], run["threads"])
+            if not same_image:
+                key = (run["image"],) + key
+            if _throughput(run) is not None:
+                groups.setdefault(key, []).append(_throughput(run))
+        return groups
+
+    groups_a, groups_b = group(runs_a), group(runs_b)
+
+    rows = []
+    for key in groups_a:
+        if key not in groups_b:
+            continue
+        a, b = groups_a[key], groups_b[key]
+        mean_a, mean_b = statistics.mean(a), statistics.mean(b)
+        change = (mean_b - mean_a) / mean_a if mean_a else 0.0
+        p_value = welch_t_test(a, b)
+
+        if p_value is None:
+            verdict = "regression?" if change < -threshold else "need 2+ runs"
+        elif p_value < alpha and change < -threshold:
+            verdict = "REGRESSION"
+        elif p_value < alpha and change > threshold:
+            verdict = "improvement"
+        else:
+            verdict = "no significant change"
+
+        model, flags, profile, threads = key[-4:]
+        if profile:
+            flags += f" [{profile}]"
+        if threads:
+            flags += f" [{threads} threads]"
+        rows.append({"Image": runs_b[0]["image"] if same_image else key[0],
+                     "Model": model[:12] if len(model) == 64 else os.path.basename(model),
+                     "Flags": flags,
+                     "Runs A/B": f"{len(a)}/{len(b)}",
+                     "tok/s A": f"{mean_a:.2f}",
+                     "tok/s B": f"{mean_b:.2f}",
+                     "Change": f"{change * 100:+.1f}%",
+                     "p-value": "-" if p_value is None else f"{p_value:.3g}",
+                     "Verdict": verdict})
+    return rows
@@ -0,0 +1,292 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run images through the Docker SDK and capture what they print.
+
+Unlike `docker run` in a shell, the output of the container is read by
+llama-deck, so each run returns a result dict with its output, exit code
+and timings that benchmarks can compare.
+
+Containers get a pty, so implementations flush their output as they
+generate it. Every chunk printed after the command line that cli_run.py
+echoes ("==> RUN COMMAND: ...") is timestamped as generated text; from
+these timestamps come time-to-first-token, inter-token latency
+percentiles and decode throughput. A chunk may hold several tokens, so
+with a tokenizer (tokenizer.TokenCounter) every chunk is tokenized and
+its delay spread over its tokens; without one, a chunk counts as one
+token.
+"""
+
+import codecs
+import re
+import shlex
+import sys
+import threading
+import time
+
+MODEL_MOUNT = "/models/model.bin"
+CLI_COMMAND = "python3 cli_run.py run " + MODEL_MOUNT + " "
+DEFAULT_STEPS = 256
+
+# "achieved tok/s: 405.75" (llama2.c and most ports), "... 12.3 tokens/s" etc.
+TOK_S_PATTERN = re.compile(r"(?:tok(?:ens)?/s(?:ec)?\s*[:=]\s*([0-9]+(?:\.[0-9]+)?))"
+                           r"|(?:([0-9]+(?:\.[0-9]+)?)\s*tok(?:ens)?/s)", re.IGNORECASE)
+STEPS_PATTERN = re.compile(r"(?:^|\s)-n\s+([0-9]+)")
+GENERATION_MARKER = "==> RUN COMMAND:"
+# Lines printed by runtimes/implementations that are not generated text.
+NOISE_PATTERN = re.compile(r"^\s*(WARNING|INFO|Config\b)", re.IGNORECASE)
+
+
+def percentile(values, q):
+    """Percentile with linear interpolation, None for no values."""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+class TokenTimer:
+    """Timestamps of the generated text chunks in a container output stream.
+
+    Args:
+        token_counter (TokenCounter): Counts the tokens of every generated
+            chunk, None to count a chunk as one token.
+    """
+
+    def __init__(self, token_counter=None):
+        self.token_counter = token_counter
+        self.pending = ""
+        self.generating = False
+        self.finished = False
+        self.token_times = []
+        self.token_counts = []
+        self.generated = []
+        # Fallback if an image does not print GENERATION_MARKER.
+        self.chunk_times = []
+
+    def feed(self, text, timestamp):
+        if text.strip():
+            self.chunk_times.append(timestamp)
+
+        if not self.generating:
+            self.pending += text
+            marker = self.pending.find(GENERATION_MARKER)
+            newline = self.pending.find("\n", marker) if marker >= 0 else -1
+            if newline < 0:
+                return
+            self.generating = True
+            text = self.pending[newline + 1:]
+            self.pending = ""
+
+        if self.finished:
+            return
+        match = TOK_S_PATTERN.search(text)
+        if match:
+            self.finished = True
+            text = text[:text.rfind("\n", 0, match.start()) + 1]
+        if text.strip() and not NOISE_PATTERN.match(text):
+            self.token_times.append(timestamp)
+            self.token_counts.append(self.token_counter.count_text(text) if self.token_counter else 1)
+            self.generated.append(text)
+
+    def metrics(self, t_started):
+        """Latency metrics relative to the container start time.
+
+        The decode window runs from the first to the last generated chunk,
+        so decode_tok_s counts the tokens after the first chunk over it. A
+        chunk of k tokens adds k inter-token latencies of its delay / k.
+
+        Returns:
+            dict: ttft, itl_p50/p95/p99 (seconds), decode_tok_s, tokens
+                (generated) and token_chunks.
+        """
+        if self.generating:
+            times, counts = self.token_times, self.token_counts
+        else:
+            times, counts = self.chunk_times, [1] * len(self.chunk_times)
+        gaps = [(b - a) / k for a, b, k in zip(times, times[1:], counts[1:]) for _ in range(k)]
+        decode_time = times[-1] - times[0] if len(times) > 1 else 0
+
+        return {"ttft": times[0] - t_started if times else None,
+                "itl_p50": percentile(gaps, 50),
+                "itl_p95": percentile(gaps, 95),
+                "itl_p99": percentile(gaps, 99),
+                "decode_tok_s": sum(counts[1:]) / decode_time if decode_time > 0 else None,
+                "tokens": sum(counts),
+                "token_chunks": len(times)}
+
+
+def parse_reported_tok_s(output):
+    """Get the last tokens/sec value an implementation printed, or None."""
+    value = None
+    for match in TOK_S_PATTERN.finditer(output):
+        value = float(match.group(1) or match.group(2))
+    return value
+
+
+def parse_run_flags(run_flags):
+    """Map the inference flags of build_run_flags to their values."""
+    tokens = shlex.split(run_flags)
+    return dict(zip(tokens[::2], tokens[1::2]))
+
+
+def requested_steps(run_flags):
+    """Get the number of steps (-n) of the run flags, default 256."""
+    match = STEPS_PATTERN.search(run_flags)
+    return int(match.group(1)) if match else DEFAULT_STEPS
+
+
+def collect_output(stream, echo=True, token_counter=None):
+    """Read an output stream to the end, timestamping every chunk.
+
+    Args:
+        stream: Iterator of output bytes (attach or exec stream).
+        echo (bool): Also write the output to stdout while it is produced.
+        token_counter (TokenCounter): Counts the tokens of the generated chunks.
+    Returns:
+        tuple: (output text, TokenTimer of the stream).
+    """
+    chunks = []
+    token_timer = TokenTimer(token_counter)
+    # a character may be split across reads, keep its first bytes for the next chunk
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in stream:
+        text = decoder.decode(chunk)
+        if not text:
+            continue
+        token_timer.feed(text, time.perf_counter())
+        chunks.append(text)
+        if echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+    text = decoder.decode(b"", final=True)
+    if text:
+        token_timer.feed(text, time.perf_counter())
+        chunks.append(text)
+
+    return "".join(chunks), token_timer
+
+
+def build_result(tag, model_path, run_flags, exit_code, output, token_timer,
+                 t_begin, t_started, t_end):
+    """Build the result dict of a run from its output and timestamps.
+
+    tokens is the number of generated tokens and tok_s their decode
+    throughput (see TokenTimer.metrics), for successful runs only: the
+    requested -n is not what a run that stops early generates, and the
+    run time also covers loading the model and the prompt.
+    """
+    result = {"image": tag,
+              "model": model_path,
+              "flags": run_flags.strip(),
+              "exit_code": exit_code,
+              "wall_time": t_end - t_begin,
+              "start_overhead": t_started - t_begin,
+              "reported_tok_s": parse_reported_tok_s(output),
+              "timed_out": False,
+              "output": output,
+              "text": "".join(token_timer.generated).strip()}
+    result.update(token_timer.metrics(t_started))
+    result["tok_s"] = result["decode_tok_s"] if exit_code == 0 else None
+    return result
+
+
+def run_container(client, tag, model_path, run_flags, echo=True, timeout=None, telemetry_interval=None,
+                  token_counter=None, **container_options):
+    """Run an image on a model and capture its output.
+
+    The container is created with a pty, attached and then started, so no
+    output is lost, and removed afterwards.
+
+    Args:
+        client (docker.DockerClient): Docker client to use.
+        tag (str): Image to run.
+        model_path (str): Absolute path of the model mounted into the container.
+        run_flags (str): Inference flags, as built by build_run_flags.
+        echo (bool): Also write the output to stdout while it is produced.
+        timeout (float): Kill the container after this many seconds, None for no limit.
+        telemetry_interval (float): Sample the resources of the container every
+            this many seconds (see telemetry.ContainerSampler), None to not sample.
+        token_counter (TokenCounter): Counts the generated tokens, None to
+            count every output chunk as one token.
+        container_options: Extra arguments for client.containers.create.
+    Returns:
+        dict: image, model, flags, exit_code, output, timings (seconds) and
+            latency metrics (see TokenTimer.metrics) of the run, whether it
+            was OOM-killed, and its resource metrics if sampled.
+    """
+    from .telemetry import ContainerSampler
+
+    command = ["/bin/sh", "-c", CLI_COMMAND + run_flags]
+    volumes = {model_path: {"bind": MODEL_MOUNT, "mode": "ro"}}
+
+    t_begin = time.perf_counter()
+    container = client.containers.create(tag, command=command, volumes=volumes, tty=True,
+                                         **container_options)
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        try:
+            container.kill()
+        except Exception:
+            pass
+
+    timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+    sampler = None
+    try:
+        stream = client.api.attach(container.id, stdout=True, stderr=True, stream=True, logs=True)
+        container.start()
+        t_started = time.perf_counter()
+        if timer:
+            timer.start()
+        if telemetry_interval:
+            sampler = ContainerSampler(client, container, telemetry_interval).start()
+
+        output, token_timer = collect_output(stream, echo, token_counter)
+        if sampler:
+            sampler.sample()
+
+        exit_code = container.wait()["StatusCode"]
+        t_end = time.perf_counter()
+        container.reload()
+        oom_killed = container.attrs["State"].get("OOMKilled", False)
+    finally:
+        if timer:
+            timer.cancel()
+        telemetry = sampler.stop() if sampler else {}
+        container.remove(force=True)
+
+    result = build_result(tag, model_path, run_flags, exit_code, output, token_timer,
+                          t_begin, t_started, t_end)
+    result["timed_out"] = timed_out.is_set()
+    result["oom_killed"] = oom_killed
+    result.update(telemetry)
+    return result
+
+
+def format_latency(result):
+    """One-line summary of the latency metrics of a run."""
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+
+    decode = result["decode_tok_s"]
+    return (f"time to first token: {ms(result['ttft'])} | "
+            f"inter-token latency p50/p95/p99: {ms(result['itl_p50'])} / "
+            f"{ms(result['itl_p95'])} / {ms(result['itl_p99'])} | "
+            f"decode: {'-' if decode is None else f'{decode:.1f}'} tok/s")
@@ -0,0 +1,147 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Thread-count scaling of implementations.
+
+Implementations parallelize with OpenMP, Rayon, goroutines, Java threads
+and more, each configured by its own environment variable. A run with a
+thread count sets all of them (config.thread_environment) and pins the
+container to the same number of CPUs, so runtimes that size their pools by
+the visible CPUs follow as well.
+
+scaling_rows turns the runs of a sweep into speedup and parallel efficiency
+relative to the smallest thread count of each image, model and flags.
+"""
+
+import os
+import statistics
+
+from . import config
+
+CURVE_WIDTH = 20
+
+
+def thread_counts(max_threads):
+    """Powers of two up to max_threads, plus max_threads itself: 1, 2, 4, ..., N."""
+    counts = []
+    threads = 1
+    while threads < max_threads:
+        counts.append(threads)
+        threads *= 2
+    return counts + [max_threads]
+
+
+def max_threads():
+    """CPUs of the largest NUMA node, the most threads a run can be pinned to."""
+    from .scheduler import numa_nodes
+
+    return max(len(cpus) for cpus in numa_nodes().values())
+
+
+def thread_environment(threads):
+    """Environment variables that set the thread count of common runtimes."""
+    return {name: value.format(threads=threads) for name, value in config.thread_environment.items()}
+
+
+def container_options(threads, slot=None):
+    """Container options of a run with a thread count.
+
+    Args:
+        threads (int): Number of threads.
+        slot (dict): Container options of the slot the run takes (see
+            scheduler.make_slots); its first CPUs become the cpuset.
+    Returns:
+        dict: The slot's options with cpuset_cpus and environment.
+    """
+    from .scheduler import parse_cpulist, make_slots
+
+    if threads < 1:
+        raise ValueError(f"Invalid thread count: {threads}")
+    options = dict(slot or make_slots(1, threads)[0])
+    slot_cpus = parse_cpulist(options["cpuset_cpus"])
+    if len(slot_cpus) < threads:
+        raise ValueError(f"{threads} threads need {threads} CPUs, the slot has {len(slot_cpus)}")
+
+    options.update(cpuset_cpus=",".join(str(cpu) for cpu in slot_cpus[:threads]),
+                   environment=thread_environment(threads))
+    return options
+
+
+def _throughput(runs):
+    values = [r["reported_tok_s"] or r["tok_s"] for r in runs if r["exit_code"] == 0]
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def scaling_rows(results):
+    """Speedup and parallel efficiency of every thread count of a sweep.
+
+    Runs are grouped by image, model, flags and thread count. The baseline
+    of an image, model and flags is its smallest thread count with a
+    throughput: speedup is tok/s over the baseline's tok/s, and efficiency
+    is speedup over the ideal speedup (threads / baseline threads). The
+    curve shows the speedup against the ideal speedup of the largest count.
+
+    Args:
+        results (list): Result dicts with a "threads" count.
+    Returns:
+        list: One table row (dict) per image, model, flags and thread count.
+    """
+    groups = {}
+    for result in results:
+        if result.get("threads"):
+            key = (result["image"], result["model"], result["flags"])
+            groups.setdefault(key, {}).setdefault(result["threads"], []).append(result)
+
+    show_model = len({model for _, model, _ in groups}) > 1
+    show_flags = len({flags for _, _, flags in groups}) > 1
+
+    rows = []
+    for (image, model, flags), by_threads in groups.items():
+        counts = sorted(by_threads)
+        throughputs = {threads: _throughput(by_threads[threads]) for threads in counts}
+        base = next((threads for threads in counts if throughputs[threads] is not None), None)
+        max_ideal = counts[-1] / base if base else None
+        previous = None
+
+        for threads in counts:
+            row = {"Image": image}
+            if show_model:
+                row["Model"] = os.path.basename(model)
+            if show_flags:
+                row["Flags"] = flags
+            tok_s = throughputs[threads]
+            speedup = tok_s / throughputs[base] if tok_s is not None and base else None
+            efficiency = speedup / (threads / base) if speedup is not None else None
+
+            if speedup is None:
+                note = "failed"
+            elif previous is not None and speedup <= previous:
+                note = "no gain"
+            elif efficiency < config.scaling_min_efficiency:
+                note = f"efficiency < {config.scaling_min_efficiency:.0%}"
+            else:
+                note = ""
+            if speedup is not None:
+                previous = speedup
+
+            rows.append({**row,
+                         "Threads": threads,
+                         "tok/s": "-" if tok_s is None else f"{tok_s:.2f}",
+                         "Speedup": "-" if speedup is None else f"{speedup:.2f}x",
+                         "Efficiency": "-" if efficiency is None else f"{efficiency:.0%}",
+                         "Curve": "" if speedup is None else "#" * round(CURVE_WIDTH * min(speedup / max_ideal, 1)),
+                         "Scaling": note})
+    return rows
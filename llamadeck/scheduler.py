@@ -0,0 +1,179 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run a matrix of images x models x flags concurrently on disjoint CPUs.
+
+The CPUs of the host are split into slots, each a set of CPUs on a single
+NUMA node. A run takes a free slot, and its container is pinned to the
+slot's CPUs (cpuset) and NUMA memory node, so concurrent runs don't compete
+for cores or memory bandwidth of the same node.
+"""
+
+import glob
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .runner import run_container
+from .pool import run_warm
+from .reference import is_reference, run_reference
+from .native import is_native, run_native
+from . import profiles, scaling
+
+
+def parse_cpulist(text):
+    """Parse a Linux CPU list such as "0-3,8,10-11" into CPU ids."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    """CPU ids this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """Map NUMA node id -> available CPU ids of the node.
+
+    Returns:
+        dict: {node id or None: cpus}, a single None node if NUMA
+            information is not available.
+    """
+    allowed = set(available_cpus())
+    nodes = {}
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        node = int(os.path.basename(os.path.dirname(path))[4:])
+        with open(path) as f:
+            cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in allowed]
+        if cpus:
+            nodes[node] = cpus
+
+    return nodes or {None: sorted(allowed)}
+
+
+def make_slots(jobs, cpus_per_run=None):
+    """Split the host CPUs into slots for concurrent runs.
+
+    Args:
+        jobs (int): Number of runs at the same time.
+        cpus_per_run (int): CPUs of each slot, default all CPUs divided by jobs.
+    Returns:
+        list: Container options (cpuset_cpus, cpuset_mems) of each slot.
+    """
+    nodes = numa_nodes()
+    total = sum(len(cpus) for cpus in nodes.values())
+    cpus_per_run = cpus_per_run or max(1, total // jobs)
+
+    slots = []
+    for node, cpus in nodes.items():
+        for start in range(0, len(cpus) - cpus_per_run + 1, cpus_per_run):
+            slot = {"cpuset_cpus": ",".join(str(cpu) for cpu in cpus[start:start + cpus_per_run])}
+            if node is not None:
+                slot["cpuset_mems"] = str(node)
+            slots.append(slot)
+
+    if len(slots) < jobs:
+        raise ValueError(f"{total} CPUs can't hold {jobs} runs of {cpus_per_run} CPUs "
+                         f"on a single NUMA node each")
+    return slots[:jobs]
+
+
+def run_matrix(client, runs, slots, timeout=None, warm_idle_timeout=None, telemetry_interval=None,
+               resources_path=None, token_counter=None):
+    """Run (image, model, flags) combinations, one per free slot at a time.
+
+    Args:
+        client (docker.DockerClient): Docker client to use.
+        runs (list): (image tag, model path, run flags, resource profile name
+            or None, thread count or None) of each run, see profiles.py and
+            scaling.py.
+        slots (list): Container options of each slot, see make_slots. A single
+            empty dict runs everything sequentially without pinning.
+        timeout (float): Max seconds of each run.
+        warm_idle_timeout (int): Run in warm containers (see pool.run_warm) with
+            this idle timeout instead of a new container per run. Slots and
+            timeout are not applied to warm runs.
+        telemetry_interval (float): Sample the resources of each run every this
+            many seconds, None to not sample.
+        resources_path (str): Resources directory of the reference and native
+            pseudo-images (see native.py), which run on the host instead of
+            in containers.
+        token_counter (TokenCounter): Counts the generated tokens of each run
+            (see runner.TokenTimer), None to count output chunks.
+    Returns:
+        list: Result dicts (see runner.run_container) in the order of `runs`.
+    """
+    free_slots = queue.Queue()
+    for slot in slots:
+        free_slots.put(slot)
+
+    def run_one(run):
+        tag, model_path, run_flags, profile, threads = run
+        slot = free_slots.get()
+        options = slot
+        try:
+            if profile:
+                options = profiles.container_options(profile, slot)
+            elif threads:
+                options = scaling.container_options(threads, slot)
+            if is_reference(tag):
+                result = run_reference(tag, model_path, run_flags, echo=False, resources_path=resources_path)
+            elif is_native(tag):
+                if profile:
+                    raise ValueError("Resource profiles need containers, they can't limit native runs")
+                result = run_native(tag, model_path, run_flags, echo=False, timeout=timeout,
+                                    telemetry_interval=telemetry_interval, token_counter=token_counter,
+                                    resources_path=resources_path, **options)
+            elif warm_idle_timeout:
+                result = run_warm(client, tag, model_path, run_flags, echo=False,
+                                  idle_timeout=warm_idle_timeout, telemetry_interval=telemetry_interval,
+                                  token_counter=token_counter)
+            else:
+                result = run_container(client, tag, model_path, run_flags, echo=False,
+                                       timeout=timeout, telemetry_interval=telemetry_interval,
+                                       token_counter=token_counter, **options)
+        except Exception as e:
+            result = {"image": tag, "model": model_path, "flags": run_flags.strip(),
+                      "exit_code": None, "error": str(e) or type(e).__name__}
+        finally:
+            free_slots.put(slot)
+        result["cpuset"] = options.get("cpuset_cpus")
+        result["profile"] = profile
+        result["threads"] = threads
+        return result
+
+    results = [None] * len(runs)
+    finished = 0
+    with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+        futures = {executor.submit(run_one, run): i for i, run in enumerate(runs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            finished += 1
+            print(f"Benchmarking...[{finished}/{len(runs)}] finished: {results[i]['image']}   ", end="\r")
+    print()
+
+    return results
@@ -0,0 +1,99 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup benchmark of the catalog-only commands.
+
+Runs `llama-deck list_repo` and `llama-deck list_model` in fresh
+interpreters and checks that they stay within a startup budget (time on top
+of a bare interpreter start) and don't import the Docker SDK or the HTTP
+stack. Exits with status 1 if a command is over budget:
+
+    python -m llamadeck.startup_bench [--budget MS] [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = ["list_repo", "list_model"]
+
+# Milliseconds a command may take on top of a bare interpreter start
+STARTUP_BUDGET_MS = 120
+
+# Modules the catalog-only commands must not import
+HEAVY_MODULES = ["docker", "requests", "urllib3", "wget", "sqlite3"]
+
+RUN_COMMAND = """
+import sys
+sys.argv = ["llama-deck"] + sys.argv[1:]
+from llamadeck.main import main
+main()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+sys.stderr.write(",".join(heavy))
+"""
+
+
+def _time_run(args):
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, text=True, check=True)
+    return time.perf_counter() - start, process.stderr.strip()
+
+
+def measure(command, runs=10):
+    """Measure a command in fresh interpreters.
+
+    Returns:
+        tuple: (median ms on top of a bare interpreter start, heavy modules imported).
+    """
+    bare, command_times, heavy = [], [], ""
+    for _ in range(runs):
+        bare.append(_time_run(["-c", "pass"])[0])
+        elapsed, heavy = _time_run(["-c", RUN_COMMAND.format(heavy=HEAVY_MODULES), command])
+        command_times.append(elapsed)
+
+    overhead = statistics.median(command_times) - statistics.median(bare)
+    return overhead * 1000, [m for m in heavy.split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark of catalog-only commands")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS,
+                        help=f"Startup budget in ms, default {STARTUP_BUDGET_MS}")
+    parser.add_argument("--runs", type=int, default=10, help="Runs of each command, default 10")
+    args = parser.parse_args()
+
+    # Compile the package first, so the runs don't include byte-compiling it
+    subprocess.run([sys.executable, "-m", "compileall", "-q", os.path.dirname(__file__)], check=False)
+
+    failed = False
+    for command in COMMANDS:
+        overhead, heavy = measure(command, args.runs)
+        status = "ok"
+        if overhead > args.budget:
+            status = f"over budget ({args.budget:.0f} ms)"
+        if heavy:
+            status = f"imports {', '.join(heavy)}"
+        failed = failed or status != "ok"
+        print(f"{command:<12} {overhead:7.1f} ms  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed store for models and tokenizers.
+
+Every downloaded file is kept once as a blob named by its SHA-256 under
+`<resources>/llamaStore/blobs/sha256/`. The files users see (e.g.
+`llamaModels/stories15M.bin` in any resources path) are hardlinks to the
+blob, or reflinks/copies when a hardlink is not possible. `index.json`
+records the blob of every named entry and of every downloaded URL, so
+checking whether a model is installed is a single lookup plus a stat.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    """Compute the SHA-256 hex digest of a file."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _reflink(src, dst):
+    """Copy-on-write clone of src, returns False if the filesystem can't do it."""
+    try:
+        result = subprocess.run(["cp", "--reflink=always", src, dst],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return result.returncode == 0
+    except OSError:
+        return False
+
+
+class ModelStore:
+    """Blob store and index under `<resources_path>/llamaStore`."""
+
+    def __init__(self, resources_path):
+        self.root = os.path.join(resources_path, "llamaStore")
+        self.blob_root = os.path.join(self.root, "blobs", "sha256")
+        self.index_path = os.path.join(self.root, "index.json")
+        self.lock = threading.Lock()
+        self.index = {"blobs": {}, "entries": {}, "urls": {}}
+
+        try:
+            with open(self.index_path) as f:
+                self.index.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        """Write the index atomically."""
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_root, sha256[:2], sha256)
+
+    def lookup_url(self, url):
+        """Get the SHA-256 of a previously downloaded URL whose blob is still present."""
+        sha256 = self.index["urls"].get(url)
+        if sha256 and os.path.exists(self.blob_path(sha256)):
+            return sha256
+        return None
+
+    def is_installed(self, path, sha256=None):
+        """Check that a named entry exists and still matches its blob.
+
+        Args:
+            path (str): Path of the named entry.
+            sha256 (str): Expected blob, None to accept any indexed blob.
+        """
+        entry = self.index["entries"].get(os.path.abspath(path))
+        if not entry or (sha256 and entry["sha256"] != sha256):
+            return False
+        return self._check_entry(os.path.abspath(path), entry) == "ok"
+
+    def add(self, path, sha256, url=None):
+        """Move a downloaded file into the store and link it back to its path.
+
+        If the blob already exists, the file is replaced by a link to it.
+
+        Args:
+            path (str): Path of the downloaded file.
+            sha256 (str): SHA-256 of the file.
+            url (str): URL the file was downloaded from.
+        """
+        path = os.path.abspath(path)
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+        if os.path.exists(blob):
+            os.remove(path)
+        else:
+            try:
+                os.replace(path, blob)
+            except OSError:
+                shutil.move(path, blob)
+            os.chmod(blob, 0o444)
+
+        with self.lock:
+            self.index["blobs"][sha256] = {"size": os.path.getsize(blob)}
+            if url:
+                self.index["urls"][url] = sha256
+        self.link(sha256, path)
+
+    def link(self, sha256, path):
+        """Create a named entry for an existing blob.
+
+        Returns:
+            str: "hardlink", "reflink" or "copy".
+        """
+        path = os.path.abspath(path)
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".link"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+        try:
+            os.link(blob, tmp_path)
+            kind = "hardlink"
+        except OSError:
+            if _reflink(blob, tmp_path):
+                kind = "reflink"
+            else:
+                shutil.copyfile(blob, tmp_path)
+                kind = "copy"
+        os.replace(tmp_path, path)
+
+        stat = os.stat(path)
+        with self.lock:
+            self.index["entries"][path] = {"sha256": sha256, "kind": kind,
+                                           "size": stat.st_size, "mtime": stat.st_mtime}
+        return kind
+
+    def adopt(self, path, url=None):
+        """Add a file that was installed without the store (e.g. by an older version).
+
+        Returns:
+            str: SHA-256 of the file.
+        """
+        sha256 = sha256_file(path)
+        self.add(path, sha256, url)
+        return sha256
+
+    def _check_entry(self, path, entry, full=False):
+        blob = self.blob_path(entry["sha256"])
+        if not os.path.exists(blob):
+            return "blob missing"
+        if not os.path.exists(path):
+            return "missing"
+
+        stat = os.stat(path)
+        if entry["kind"] == "hardlink":
+            if not os.path.samefile(path, blob):
+                return "modified"
+        elif stat.st_size != entry["size"] or stat.st_mtime != entry["mtime"]:
+            return "modified"
+
+        if full and sha256_file(path) != entry["sha256"]:
+            return "corrupt"
+        return "ok"
+
+    def verify(self, full=False):
+        """Check every named entry against its blob.
+
+        Args:
+            full (bool): Also re-hash every file instead of only checking links and sizes.
+        Returns:
+            list: dicts with path, digest, link kind and status of each entry.
+        """
+        results = []
+        for path, entry in sorted(self.index["entries"].items()):
+            results.append({"Entry": path,
+                            "SHA-256": entry["sha256"][:16],
+                            "Link": entry["kind"],
+                            "Status": self._check_entry(path, entry, full)})
+        return results
@@ -0,0 +1,140 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Random-weight llama2.c models of any shape, for scale testing.
+
+Models are written in the legacy llama2.c format, one chunk of values at a
+time, so their size is not limited by RAM. Weights are drawn from a normal
+distribution (std 0.02, like the initialization of llama2.c's model.py)
+and norm weights are 1. Each tensor has its own generator seeded with
+(seed, tensor index), so a model is the same for the same shape and seed.
+"""
+
+import itertools
+import os
+import struct
+
+from .modelinfo import HEADER_FIELDS, weight_layout
+
+# values generated at a time
+CHUNK_VALUES = 4 * 1024 * 1024
+WEIGHT_STD = 0.02
+
+
+def default_hidden_dim(dim, multiple_of=32):
+    """hidden_dim of llama2.c's model.py: 2/3 of 4 * dim, rounded up to multiple_of."""
+    hidden_dim = int(2 * 4 * dim / 3)
+    return multiple_of * ((hidden_dim + multiple_of - 1) // multiple_of)
+
+
+def default_n_heads(dim):
+    """Heads of 64 values (or 48, like stories15M) each."""
+    for head_size in (64, 48):
+        if dim % head_size == 0:
+            return dim // head_size
+    raise ValueError(f"Can't choose n_heads for dim {dim}, set it")
+
+
+def model_configs(dims, n_layers, n_heads=None, n_kv_heads=None, hidden_dims=None, vocab_sizes=(32000,),
+                  seq_lens=(256,)):
+    """Model configs of every combination of the given shape values.
+
+    None or empty n_heads / n_kv_heads / hidden_dims derive them from dim
+    (n_kv_heads defaults to n_heads).
+
+    Raises:
+        ValueError: If a combination is not a valid model.
+    """
+    configs = []
+    for dim, layers, heads, kv_heads, hidden_dim, vocab_size, seq_len in itertools.product(
+            dims, n_layers, n_heads or [None], n_kv_heads or [None], hidden_dims or [None], vocab_sizes, seq_lens):
+        heads = heads or default_n_heads(dim)
+        model_config = {"dim": dim,
+                        "hidden_dim": hidden_dim or default_hidden_dim(dim),
+                        "n_layers": layers,
+                        "n_heads": heads,
+                        "n_kv_heads": kv_heads or heads,
+                        "vocab_size": vocab_size,
+                        "seq_len": seq_len,
+                        "version": 0,
+                        "shared_classifier": True,
+                        "group_size": None,
+                        "header_size": 4 * len(HEADER_FIELDS)}
+        _check_shape(model_config)
+        configs.append(model_config)
+    return configs
+
+
+def _check_shape(model_config):
+    if any(model_config[field] <= 0 for field in HEADER_FIELDS):
+        raise ValueError(f"Invalid model shape: {model_config}")
+    if model_config["dim"] % model_config["n_heads"] or model_config["n_heads"] % model_config["n_kv_heads"]:
+        raise ValueError(f"dim {model_config['dim']} must be a multiple of n_heads {model_config['n_heads']}, "
+                         f"which must be a multiple of n_kv_heads {model_config['n_kv_heads']}")
+    if (model_config["dim"] // model_config["n_heads"]) % 2:
+        raise ValueError(f"Head size dim / n_heads = {model_config['dim'] // model_config['n_heads']} must be even")
+
+
+def model_name(model_config, seed):
+    """File name of a generated model, e.g. gen_d288_l6_h6_kv6_v32000_s256_seed0.bin."""
+    return ("gen_d{dim}_l{n_layers}_h{n_heads}_kv{n_kv_heads}_v{vocab_size}_s{seq_len}".format(**model_config)
+            + f"_seed{seed}.bin")
+
+
+def generate_model(model_config, output_path, seed=0):
+    """Write a random-weight legacy llama2.c model.
+
+    Args:
+        model_config (dict): Shape of the model (see model_configs).
+        output_path (str): Model file to write.
+        seed (int): Seed of the weights.
+    Raises:
+        ImportError: If NumPy is not installed.
+        ValueError: If the shape is not a valid model.
+    """
+    import numpy as np
+    from .convert import freq_cis
+
+    _check_shape(model_config)
+    layout = weight_layout(model_config)
+
+    tmp_path = output_path + ".part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<7i", *(model_config[field] for field in HEADER_FIELDS)))
+            head_size = model_config["dim"] // model_config["n_heads"]
+            cos, sin = freq_cis(head_size, model_config["seq_len"])
+
+            for index, (name, shape) in enumerate(layout):
+                if name == "freq_cis_real":
+                    f.write(cos.astype("<f4").tobytes())
+                    continue
+                if name == "freq_cis_imag":
+                    f.write(sin.astype("<f4").tobytes())
+                    continue
+
+                size = int(np.prod(shape))
+                if name.startswith("rms_"):
+                    f.write(np.ones(size, dtype="<f4").tobytes())
+                    continue
+                rng = np.random.default_rng([seed, index])
+                for start in range(0, size, CHUNK_VALUES):
+                    chunk = rng.standard_normal(min(CHUNK_VALUES, size - start), dtype=np.float32)
+                    chunk *= np.float32(WEIGHT_STD)
+                    f.write(chunk.tobytes())
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,250 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resource telemetry of containers while they run.
+
+A ContainerSampler samples a container's counters in a background thread:
+CPU time, resident memory (anonymous + file-mapped pages, i.e. the RSS of
+its processes, including a memory mapped model), page faults and block
+I/O. On Linux hosts with cgroup v2, the container's cgroup files are read
+directly at the requested interval. Otherwise (cgroup v1, Docker Desktop)
+the Docker stats stream is used, which Docker updates about once a second.
+
+stop() summarizes the samples into the metrics stored with each run (see
+ContainerSampler.stop) plus a compact time series of CPU and RSS. The
+cgroup of a container is removed as soon as it exits, so runners call
+sample() when the output of a run ends, to keep the counters of its last
+moments.
+"""
+
+import os
+import threading
+import time
+
+from . import config
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+COUNTERS = ["cpu", "rss", "pgfault", "pgmajfault", "io_read", "io_write"]
+
+
+def cgroup_dir(pid):
+    """cgroup v2 directory of a process, None if it is not on cgroup v2 or not visible."""
+    try:
+        with open(f"/proc/{pid}/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    path = os.path.join(CGROUP_ROOT, line[3:].strip().lstrip("/"))
+                    return path if os.path.exists(os.path.join(path, "cpu.stat")) else None
+    except OSError:
+        pass
+    return None
+
+
+def _read_keyed(path):
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(" ")
+            if value.strip().isdigit():
+                values[key] = int(value)
+    return values
+
+
+def read_cgroup(path):
+    """Counters of a cgroup v2 directory (see COUNTERS), cpu in seconds."""
+    cpu = _read_keyed(os.path.join(path, "cpu.stat"))
+    memory = _read_keyed(os.path.join(path, "memory.stat"))
+    io_read = io_write = 0
+    try:
+        with open(os.path.join(path, "io.stat")) as f:
+            for line in f:
+                fields = dict(field.split("=", 1) for field in line.split()[1:] if "=" in field)
+                io_read += int(fields.get("rbytes", 0))
+                io_write += int(fields.get("wbytes", 0))
+    except OSError:
+        pass
+    return {"cpu": cpu.get("usage_usec", 0) / 1e6,
+            "rss": memory.get("anon", 0) + memory.get("file_mapped", 0),
+            "pgfault": memory.get("pgfault", 0),
+            "pgmajfault": memory.get("pgmajfault", 0),
+            "io_read": io_read,
+            "io_write": io_write}
+
+
+def parse_docker_stats(stats):
+    """Counters (see COUNTERS) of a Docker stats entry, None if the container is not running."""
+    memory = (stats.get("memory_stats") or {}).get("stats")
+    if not memory:
+        return None
+    io_read = io_write = 0
+    for entry in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        if entry.get("op", "").lower() == "read":
+            io_read += entry.get("value", 0)
+        elif entry.get("op", "").lower() == "write":
+            io_write += entry.get("value", 0)
+    # cgroup v2 keys, else cgroup v1 keys
+    return {"cpu": stats["cpu_stats"]["cpu_usage"]["total_usage"] / 1e9,
+            "rss": memory.get("anon", memory.get("rss", 0)) + memory.get("file_mapped", memory.get("mapped_file", 0)),
+            "pgfault": memory.get("pgfault", memory.get("total_pgfault", 0)),
+            "pgmajfault": memory.get("pgmajfault", memory.get("total_pgmajfault", 0)),
+            "io_read": io_read,
+            "io_write": io_write}
+
+
+class ContainerSampler:
+    """Sample the resource counters of a running container in a background thread."""
+
+    def __init__(self, client, container, interval=None, fresh=True, source=None):
+        """
+        Args:
+            client (docker.DockerClient): Docker client to use.
+            container (docker.models.containers.Container): Started container.
+            interval (float): Seconds between samples, default config.telemetry_interval.
+            fresh (bool): The container was just started, so its counters start
+                at 0. Otherwise (warm containers) the counters are measured
+                from a first sample taken by start().
+            source (str): "cgroup", "docker" or "auto" (cgroup v2 if possible),
+                default config.telemetry_source.
+        """
+        self.client = client
+        self.container = container
+        self.interval = interval or config.telemetry_interval
+        self.fresh = fresh
+        self.source = source or config.telemetry_source
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = None
+        self.t_start = None
+        self.path = None
+
+    def _cgroup_path(self):
+        self.container.reload()
+        return cgroup_dir(self.container.attrs["State"]["Pid"])
+
+    def start(self):
+        """Start sampling, call right after the container (or the exec in it) started."""
+        self.t_start = time.perf_counter()
+        self.path = self._cgroup_path() if self.source in ("auto", "cgroup") else None
+        if self.path:
+            self.source = "cgroup"
+            if not self.fresh:
+                self._add(read_cgroup(self.path))
+            self.thread = threading.Thread(target=self._sample_cgroup, args=(self.path,), daemon=True)
+        else:
+            self.source = "docker"
+            self.thread = threading.Thread(target=self._sample_docker, daemon=True)
+        if self.fresh:
+            self.samples.append(dict(dict.fromkeys(COUNTERS, 0), t=0.0))
+        self.thread.start()
+        return self
+
+    def _add(self, counters):
+        if counters:
+            self.samples.append(dict(counters, t=time.perf_counter() - self.t_start))
+
+    def _sample_cgroup(self, path):
+        while not self.stopped.is_set():
+            try:
+                self._add(read_cgroup(path))
+            except OSError:
+                # the cgroup is removed when the container exits
+                return
+            self.stopped.wait(self.interval)
+
+    def sample(self):
+        """Take a sample right away, if the cgroup of the container still exists.
+
+        Call it as soon as the run's output ends: the counters of the last
+        interval are lost once the container exits and its cgroup is removed.
+        The Docker stats stream has no such reading, it is left as is.
+        """
+        if self.source == "cgroup" and self.path:
+            try:
+                self._add(read_cgroup(self.path))
+            except OSError:
+                pass
+
+    def _sample_docker(self):
+        try:
+            for stats in self.client.api.stats(self.container.id, stream=True, decode=True):
+                if self.stopped.is_set():
+                    return
+                counters = parse_docker_stats(stats)
+                if counters is None and self.fresh and len(self.samples) > 1:
+                    return
+                self._add(counters)
+        except Exception:
+            return
+
+    def stop(self):
+        """Stop sampling and summarize the samples.
+
+        Returns:
+            dict: cpu_util (average CPUs used), peak_memory and avg_memory
+                (RSS bytes), page_faults, major_page_faults, io_read_bytes,
+                io_write_bytes, and "telemetry": source, interval and the
+                series of [seconds, CPUs used, RSS MiB]. Empty if no sample
+                was taken.
+        """
+        self.stopped.set()
+        if self.source == "cgroup" and self.thread:
+            self.thread.join()
+            # warm containers keep running, their cgroup is still there
+            self.sample()
+        else:
+            # the Docker stats stream only returns with its next entry
+            self.thread.join(timeout=0.1)
+        return summarize_samples(sorted(self.samples, key=lambda sample: sample["t"]), self.source, self.interval)
+
+
+def summarize_samples(samples, source, interval, max_points=None):
+    """Summarize counter samples (see ContainerSampler.stop)."""
+    max_points = max_points or config.telemetry_max_points
+    measured = [sample for sample in samples if sample["rss"]]
+    if len(samples) < 2 or not measured:
+        return {}
+
+    first, last = samples[0], samples[-1]
+    duration = last["t"] - first["t"]
+    series = []
+    for previous, sample in zip(samples, samples[1:]):
+        elapsed = sample["t"] - previous["t"]
+        cpus = (sample["cpu"] - previous["cpu"]) / elapsed if elapsed > 0 else 0.0
+        series.append([round(sample["t"], 2), round(cpus, 2), round(sample["rss"] / 1024 ** 2, 1)])
+    step = -(-len(series) // max_points)
+
+    return {"cpu_util": (last["cpu"] - first["cpu"]) / duration if duration > 0 else None,
+            "peak_memory": max(sample["rss"] for sample in measured),
+            "avg_memory": int(sum(sample["rss"] for sample in measured) / len(measured)),
+            "page_faults": last["pgfault"] - first["pgfault"],
+            "major_page_faults": last["pgmajfault"] - first["pgmajfault"],
+            "io_read_bytes": last["io_read"] - first["io_read"],
+            "io_write_bytes": last["io_write"] - first["io_write"],
+            "telemetry": {"source": source,
+                          "interval": interval,
+                          "samples": len(samples),
+                          "series": series[::step]}}
+
+
+def format_telemetry(result):
+    """One-line summary of the resource metrics of a run, None if it has none."""
+    if result.get("peak_memory") is None:
+        return None
+    cpu = result.get("cpu_util")
+    return (f"CPU: {'-' if cpu is None else f'{cpu:.2f}'} cores avg | "
+            f"RSS peak/avg: {result['peak_memory'] / 1024 ** 2:.1f} / {result['avg_memory'] / 1024 ** 2:.1f} MiB | "
+            f"page faults: {result['page_faults']} ({result['major_page_faults']} major) | "
+            f"block I/O read/write: {result['io_read_bytes'] / 1024 ** 2:.1f} / "
+            f"{result['io_write_bytes'] / 1024 ** 2:.1f} MiB")
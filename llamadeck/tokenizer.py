@@ -0,0 +1,275 @@
+# Copyright (c) 2024, APT Group, Department of Computer Science,
+# The University of Manchester.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""llama2.c tokenizer.bin loader with a compiled cache and fast BPE.
+
+tokenizer.bin holds the max token length (int32), then for every token its
+score (float32), length (int32) and bytes. Loading it compiles a lookup
+from bytes to token id and a merge table from every (left id, right id)
+pair that forms a token to the merged id and its score. The compiled form
+is cached as a pickle named after the SHA-256 of the tokenizer file, so it
+is parsed only once.
+
+Encoding gives the same tokens as run.c, which repeatedly merges the
+highest scoring adjacent pair (leftmost first on ties), but uses a heap
+over the pairs of a linked list, so it runs in O(n log n) instead of
+O(n^2) per prompt.
+"""
+
+import hashlib
+import heapq
+import os
+import pickle
+import struct
+import threading
+
+BOS = 1
+EOS = 2
+CACHE_VERSION = 1
+# Prompts whose token counts a TokenCounter remembers
+PROMPT_CACHE_SIZE = 4096
+
+
+class Tokenizer:
+    """Compiled llama2.c tokenizer."""
+
+    def __init__(self, vocab, scores, max_token_length):
+        self.vocab = vocab
+        self.scores = scores
+        self.max_token_length = max_token_length
+        self.lookup = {}
+        for token_id, piece in enumerate(vocab):
+            self.lookup.setdefault(piece, token_id)
+
+        # (left id, right id) -> (merged id, score) of every token that is a concatenation of two tokens
+        self.merges = {}
+        for token_id, piece in enumerate(vocab):
+            for split in range(1, len(piece)):
+                left = self.lookup.get(piece[:split])
+                right = self.lookup.get(piece[split:])
+                if left is not None and right is not None and self.lookup[piece] == token_id:
+                    self.merges[(left, right)] = (token_id, scores[token_id])
+
+    @property
+    def vocab_size(self):
+        return len(self.vocab)
+
+    def encode(self, text, bos=True, eos=False, dummy_prefix=True):
+        """BPE-encode text like run.c.
+
+        Args:
+            text (str): Text to encode.
+            bos (bool): Start with the BOS token.
+            eos (bool): End with the EOS token.
+            dummy_prefix (bool): Add a " " before the text if it is not empty.
+        Returns:
+            list: Token ids.
+        """
+        tokens = [BOS] if bos else []
+        if text and dummy_prefix:
+            tokens.append(self.lookup[b" "])
+        for char in text:
+            piece = char.encode("utf-8")
+            token_id = self.lookup.get(piece)
+            if token_id is not None:
+                tokens.append(token_id)
+            else:
+                # byte fallback: <0x00>..<0xFF> are tokens 3..258
+                tokens.extend(byte + 3 for byte in piece)
+
+        tokens = self._merge(tokens)
+        if eos:
+            tokens.append(EOS)
+        return tokens
+
+    def _merge(self, tokens):
+        n = len(tokens)
+        if n < 2:
+            return tokens
+        next_index = list(range(1, n)) + [-1]
+        prev_index = list(range(-1, n - 1))
+        alive = [True] * n
+
+        # (-score, left position, left id, right id); stale entries are skipped when popped
+        heap = []
+        for i in range(n - 1):
+            merge = self.merges.get((tokens[i], tokens[i + 1]))
+            if merge:
+                heap.append((-merge[1], i, tokens[i], tokens[i + 1]))
+        heapq.heapify(heap)
+
+        while heap:
+            _, i, left, right = heapq.heappop(heap)
+            j = next_index[i]
+            if not alive[i] or j < 0 or tokens[i] != left or tokens[j] != right:
+                continue
+
+            tokens[i] = self.merges[(left, right)][0]
+            alive[j] = False
+            next_index[i] = next_index[j]
+            if next_index[j] >= 0:
+                prev_index[next_index[j]] = i
+
+            for a in (prev_index[i], i):
+                b = next_index[a] if a >= 0 else -1
+                if a >= 0 and b >= 0:
+                    merge = self.merges.get((tokens[a], tokens[b]))
+                    if merge:
+                        heapq.heappush(heap, (-merge[1], a, tokens[a], tokens[b]))
+
+        return [token for token, keep in zip(tokens, alive) if keep]
+
+    def decode_piece(self, prev_token, token):
+        """Bytes of a token, as run.c prints it after prev_token."""
+        piece = self.vocab[token]
+        if prev_token == BOS and piece.startswith(b" "):
+            piece = piece[1:]
+        if len(piece) == 6 and piece.startswith(b"<0x") and piece.endswith(b">"):
+            piece = bytes([int(piece[3:5], 16)])
+        return piece
+
+    def decode(self, tokens):
+        """Decode token ids to text."""
+        pieces = []
+        prev_token = BOS
+        for token in tokens:
+            if token not in (BOS, EOS):
+                pieces.append(self.decode_piece(prev_token, token))
+            prev_token = token
+        return b"".join(pieces).decode("utf-8", errors="replace")
+
+
+def parse_tokenizer(path, vocab_size=None):
+    """Parse a tokenizer.bin file.
+
+    Args:
+        vocab_size (int): Number of tokens to read, default all tokens in the file.
+    Returns:
+        tuple: (vocab as bytes, scores, max token length).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    max_token_length = struct.unpack_from("<i", data, 0)[0]
+    vocab, scores = [], []
+    offset = 4
+    while offset < len(data) and (vocab_size is None or len(vocab) < vocab_size):
+        score, length = struct.unpack_from("<fi", data, offset)
+        offset += 8
+        vocab.append(data[offset:offset + length])
+        scores.append(score)
+        offset += length
+
+    if vocab_size is not None and len(vocab) < vocab_size:
+        raise ValueError(f"{path} has {len(vocab)} tokens, {vocab_size} expected")
+    return vocab, scores, max_token_length
+
+
+def load_tokenizer(path, vocab_size=None, cache_dir=None):
+    """Load a tokenizer, from the compiled cache if possible.
+
+    Args:
+        path (str): tokenizer.bin file.
+        vocab_size (int): Number of tokens (vocab_size of the model), default all.
+        cache_dir (str): Directory of the compiled tokenizers, None to not cache.
+    Returns:
+        Tokenizer: The compiled tokenizer.
+    """
+    cache_path = None
+    if cache_dir:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{digest}-{vocab_size or 'all'}.pickle")
+        try:
+            with open(cache_path, "rb") as f:
+                version, tokenizer = pickle.load(f)
+            if version == CACHE_VERSION:
+                return tokenizer
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            pass
+
+    tokenizer = Tokenizer(*parse_tokenizer(path, vocab_size))
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((CACHE_VERSION, tokenizer), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return tokenizer
+
+
+class TokenCounter:
+    """Count prompt and generated tokens of runs.
+
+    Like run.c, the prompt (with BOS) is forced through the first steps and
+    generation stops after min(steps, seq_len) positions, which bounds -n.
+    The generated tokens are counted from the text a run printed. Counters
+    are shared by the worker threads of batches and sweeps.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.prompt_tokens = {}
+        self.prompt_lock = threading.Lock()
+        self.seq_lens = {}
+
+    def count_prompt(self, prompt):
+        """Number of tokens (with BOS) of a prompt, memoized for the last PROMPT_CACHE_SIZE prompts."""
+        prompt = prompt or ""
+        with self.prompt_lock:
+            count = self.prompt_tokens.get(prompt)
+        if count is None:
+            count = len(self.tokenizer.encode(prompt, bos=True, eos=False))
+            with self.prompt_lock:
+                if len(self.prompt_tokens) >= PROMPT_CACHE_SIZE:
+                    # batches count prompts in file order, forget the oldest one
+                    self.prompt_tokens.pop(next(iter(self.prompt_tokens)), None)
+                self.prompt_tokens[prompt] = count
+        return count
+
+    def count_text(self, text):
+        """Number of tokens of generated text as it is printed (no BOS or dummy prefix)."""
+        return len(self.tokenizer.encode(text, bos=False, eos=False, dummy_prefix=False))
+
+    def seq_len(self, model_path):
+        """seq_len of a model, None if it is not a llama2.c model."""
+        if model_path not in self.seq_lens:
+            from .modelinfo import read_model_config
+            try:
+                self.seq_lens[model_path] = read_model_config(model_path)["seq_len"]
+            except (OSError, ValueError):
+                self.seq_lens[model_path] = None
+        return self.seq_lens[model_path]
+
+    def positions(self, model_path, steps):
+        """Number of positions a run computes for -n steps (0 means seq_len)."""
+        seq_len = self.seq_len(model_path)
+        if seq_len and (steps <= 0 or steps > seq_len):
+            return seq_len
+        return steps
+
+    def count(self, result, prompt):
+        """Add prompt_tokens and generated_tokens to a result dict.
+
+        generated_tokens encodes the text the run printed (the first token
+        is printed without its leading space, the dummy prefix adds it back),
+        or is None if the result has no text, e.g. a run that failed to start.
+        """
+        text = result.get("text")
+        result["prompt_tokens"] = self.count_prompt(prompt)
+        result["generated_tokens"] = (len(self.tokenizer.encode(text, bos=False, eos=False))
+                                      if text is not None else None)
+        return result
@@ -29,6 +29,10 @@ setup(
     url="https://github.com/xxxbf0222/LlamaDeck",
     keywords=["python","llama","llama2","LLM","llama2.c","llama2.java","docker","llama-deck"],
     packages=find_packages(),
+    extras_require={
+        "reference": ["numpy"],
+        "models": ["numpy"],
+    },
     entry_points={
         'console_scripts': [
             'llama-deck = llamadeck.main:main',
@@ -0,0 +1,160 @@
+import collections
+import io
+import json
+import pickle
+import sys
+import types
+import zipfile
+
+import pytest
+
+from llamadeck import convert, modelinfo
+
+np = pytest.importorskip("numpy")
+
+DIM, HIDDEN_DIM, N_LAYERS, N_HEADS, VOCAB_SIZE = 8, 16, 2, 2, 12
+STORAGES = {np.float32: "FloatStorage", np.float16: "HalfStorage"}
+
+
+@pytest.fixture
+def torch_names(monkeypatch):
+    """Stand-ins for the torch globals a torch.save pickle refers to, to write checkpoints without torch."""
+    torch = types.ModuleType("torch")
+    utils = types.ModuleType("torch._utils")
+
+    def _rebuild_tensor_v2(*args):
+        raise AssertionError("only pickled, never called")
+
+    _rebuild_tensor_v2.__module__ = "torch._utils"
+    _rebuild_tensor_v2.__qualname__ = "_rebuild_tensor_v2"
+    utils._rebuild_tensor_v2 = _rebuild_tensor_v2
+    for name in STORAGES.values():
+        setattr(torch, name, type(name, (), {"__module__": "torch"}))
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    monkeypatch.setitem(sys.modules, "torch._utils", utils)
+    return torch, utils
+
+
+def full_tensors(output=True, seed=0):
+    rng = np.random.default_rng(seed)
+    shapes = {"tok_embeddings.weight": (VOCAB_SIZE, DIM), "norm.weight": (DIM,)}
+    for layer in range(N_LAYERS):
+        shapes.update({f"layers.{layer}.attention_norm.weight": (DIM,),
+                       f"layers.{layer}.ffn_norm.weight": (DIM,),
+                       f"layers.{layer}.feed_forward.w1.weight": (HIDDEN_DIM, DIM),
+                       f"layers.{layer}.feed_forward.w2.weight": (DIM, HIDDEN_DIM),
+                       f"layers.{layer}.feed_forward.w3.weight": (HIDDEN_DIM, DIM)})
+        for name in ("wq", "wk", "wv", "wo"):
+            shapes[f"layers.{layer}.attention.{name}.weight"] = (DIM, DIM)
+    if output:
+        shapes["output.weight"] = (VOCAB_SIZE, DIM)
+    return {name: rng.standard_normal(shape).astype(np.float32) for name, shape in shapes.items()}
+
+
+def write_shard(path, tensors, dtype, torch_names):
+    """Write a state dict like torch.save: data.pkl with persistent storage ids and raw storages."""
+    torch, utils = torch_names
+    storages = {}
+
+    class Tensor:
+        def __init__(self, key, array):
+            self.key, self.array = key, array
+
+        def __reduce__(self):
+            storage = ("storage", getattr(torch, STORAGES[dtype]), self.key, "cpu", self.array.size)
+            stride = [int(np.prod(self.array.shape[i + 1:])) for i in range(self.array.ndim)]
+            return utils._rebuild_tensor_v2, (storage, 0, self.array.shape, stride, False,
+                                              collections.OrderedDict())
+
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, obj):
+            return obj if isinstance(obj, tuple) and obj[:1] == ("storage",) else None
+
+    state = collections.OrderedDict()
+    for key, (name, array) in enumerate(tensors.items()):
+        storages[str(key)] = np.ascontiguousarray(array.astype(dtype))
+        state[name] = Tensor(str(key), storages[str(key)])
+    data = io.BytesIO()
+    Pickler(data, protocol=2).dump(state)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("consolidated/data.pkl", data.getvalue())
+        for key, array in storages.items():
+            archive.writestr(f"consolidated/data/{key}", array.tobytes())
+
+
+def write_checkpoint(directory, tensors, shards, dtype, torch_names):
+    """Split the tensors into model-parallel shards like Meta's checkpoints."""
+    with open(directory / "params.json", "w") as f:
+        json.dump({"dim": DIM, "n_layers": N_LAYERS, "n_heads": N_HEADS, "norm_eps": 1e-5}, f)
+    for shard in range(shards):
+        parts = {}
+        for name, array in tensors.items():
+            if array.ndim == 1:
+                parts[name] = array
+            else:
+                parts[name] = np.array_split(array, shards, axis=convert._split_axis(name))[shard]
+        write_shard(directory / f"consolidated.{shard:02d}.pth", parts, dtype, torch_names)
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+@pytest.mark.parametrize("dtype", [np.float32, np.float16])
+def test_convert_round_trip(tmp_path, torch_names, shards, dtype):
+    tensors = full_tensors()
+    write_checkpoint(tmp_path, tensors, shards, dtype, torch_names)
+    output_path = str(tmp_path / "model.bin")
+
+    convert.convert_meta_checkpoint(str(tmp_path), output_path, seq_len=32, jobs=2)
+
+    model_config = modelinfo.read_model_config(output_path)
+    assert {key: model_config[key] for key in modelinfo.HEADER_FIELDS} == {
+        "dim": DIM, "hidden_dim": HIDDEN_DIM, "n_layers": N_LAYERS, "n_heads": N_HEADS,
+        "n_kv_heads": N_HEADS, "vocab_size": VOCAB_SIZE, "seq_len": 32}
+    assert model_config["version"] == 0 and not model_config["shared_classifier"]
+
+    weights = modelinfo.map_weights(output_path, model_config)
+
+    def expected(name):
+        return tensors[name].astype(dtype).astype(np.float32)
+
+    np.testing.assert_array_equal(weights["token_embedding"], expected("tok_embeddings.weight"))
+    np.testing.assert_array_equal(weights["wcls"], expected("output.weight"))
+    np.testing.assert_array_equal(weights["rms_final"], expected("norm.weight"))
+    for layer in range(N_LAYERS):
+        np.testing.assert_array_equal(weights["wo"][layer], expected(f"layers.{layer}.attention.wo.weight"))
+        np.testing.assert_array_equal(weights["w2"][layer], expected(f"layers.{layer}.feed_forward.w2.weight"))
+        np.testing.assert_array_equal(weights["w3"][layer], expected(f"layers.{layer}.feed_forward.w3.weight"))
+        np.testing.assert_array_equal(weights["rms_ffn"][layer], expected(f"layers.{layer}.ffn_norm.weight"))
+    cos, sin = convert.freq_cis(DIM // N_HEADS, 32)
+    np.testing.assert_array_equal(weights["freq_cis_real"], cos)
+    np.testing.assert_array_equal(weights["freq_cis_imag"], sin)
+
+
+def test_convert_shared_classifier(tmp_path, torch_names):
+    write_checkpoint(tmp_path, full_tensors(output=False), 1, np.float32, torch_names)
+    output_path = str(tmp_path / "model.bin")
+
+    convert.convert_meta_checkpoint(str(tmp_path), output_path, seq_len=16)
+
+    model_config = modelinfo.read_model_config(output_path)
+    assert model_config["shared_classifier"] and model_config["vocab_size"] == VOCAB_SIZE
+
+
+def test_missing_storage(tmp_path, torch_names):
+    write_checkpoint(tmp_path, full_tensors(), 1, np.float32, torch_names)
+    shard = tmp_path / "consolidated.00.pth"
+    with zipfile.ZipFile(shard) as archive:
+        entries = {name: archive.read(name) for name in archive.namelist() if name != "consolidated/data/3"}
+    with zipfile.ZipFile(shard, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+
+    with pytest.raises(ValueError, match="storage 3 is missing"):
+        convert.convert_meta_checkpoint(str(tmp_path), str(tmp_path / "model.bin"))
+    assert not (tmp_path / "model.bin").exists()
+
+
+def test_no_shards(tmp_path):
+    (tmp_path / "params.json").write_text(json.dumps({"dim": DIM, "n_layers": N_LAYERS, "n_heads": N_HEADS}))
+    with pytest.raises(ValueError, match="No consolidated"):
+        convert.convert_meta_checkpoint(str(tmp_path), str(tmp_path / "model.bin"))
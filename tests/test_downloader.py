@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from llamadeck import downloader
+
+DATA = os.urandom(64 * 1024)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+def make_handler(data=DATA, ranges=True, advertise=True, fail_after=None, requested=None):
+    """Handler serving `data`, optionally ignoring Range or dropping the connection after `fail_after` bytes."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _headers(self, status, length, content_range=None):
+            self.send_response(status)
+            self.send_header("Content-Length", str(length))
+            self.send_header("ETag", '"v1"')
+            if advertise:
+                self.send_header("Accept-Ranges", "bytes")
+            if content_range:
+                self.send_header("Content-Range", content_range)
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._headers(200, len(data))
+
+        def do_GET(self):
+            match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+            if requested is not None:
+                requested.append(self.headers.get("Range"))
+            if match and ranges:
+                start, end = int(match.group(1)), int(match.group(2))
+                body = data[start:end + 1]
+                self._headers(206, len(body), f"bytes {start}-{end}/{len(data)}")
+            else:
+                body = data
+                self._headers(200, len(body))
+            self.wfile.write(body[:fail_after] if fail_after is not None else body)
+
+    return Handler
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(downloader, "CHUNK_SIZE", 1024)
+    monkeypatch.setattr(downloader, "MIN_SEGMENT_SIZE", 8 * 1024)
+
+
+def test_parallel_download(serve, tmp_path):
+    url = serve(make_handler()) + "/model.bin"
+    destination = str(tmp_path / "model.bin")
+
+    assert downloader.download_file(url, destination, connections=4) == SHA256
+    with open(destination, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(destination + ".part")
+    assert not os.path.exists(destination + ".part.json")
+
+
+def test_interrupted_download_resumes(serve, tmp_path):
+    destination = str(tmp_path / "model.bin")
+    url = serve(make_handler(fail_after=5000)) + "/model.bin"
+    with pytest.raises((IOError, requests.RequestException)):
+        downloader.download_file(url, destination, connections=2)
+
+    # every byte the sidecar records is on disk
+    with open(destination + ".part.json") as f:
+        state = json.load(f)
+    with open(destination + ".part", "rb") as f:
+        part = f.read()
+    assert any(done for _, _, done in state["segments"])
+    for start, end, done in state["segments"]:
+        assert done <= end - start + 1
+        assert part[start:start + done] == DATA[start:start + done]
+
+    requested = []
+    resume_url = serve(make_handler(requested=requested)) + "/model.bin"
+    state["url"] = resume_url
+    with open(destination + ".part.json", "w") as f:
+        json.dump(state, f)
+
+    assert downloader.download_file(resume_url, destination, connections=2) == SHA256
+    assert sorted(requested) == sorted(f"bytes={start + done}-{end}" for start, end, done in state["segments"]
+                                       if start + done <= end)
+
+
+def test_server_ignoring_range(serve, tmp_path):
+    url = serve(make_handler(ranges=False)) + "/model.bin"
+    destination = str(tmp_path / "model.bin")
+
+    with pytest.raises(IOError, match="ignored range"):
+        downloader.download_file(url, destination, connections=2)
+    assert not os.path.exists(destination)
+
+
+def test_server_without_ranges(serve, tmp_path):
+    requested = []
+    url = serve(make_handler(advertise=False, requested=requested)) + "/model.bin"
+    destination = str(tmp_path / "model.bin")
+
+    assert downloader.download_file(url, destination, connections=4) == SHA256
+    assert requested == [None]
+    with open(destination, "rb") as f:
+        assert f.read() == DATA
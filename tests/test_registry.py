@@ -0,0 +1,122 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+import requests
+
+from llamadeck import registry
+
+TAGS = [{"name": f"tag{i}"} for i in range(5)]
+
+
+def make_handler(tags, etag, requests_seen):
+    """Docker Hub-like tag list with PAGE_SIZE tags per page, answering If-None-Match with 304."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            page = int(parse_qs(urlparse(self.path).query)["page"][0])
+            requests_seen.append((page, self.headers.get("If-None-Match")))
+            if page == 1 and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            start = (page - 1) * registry.PAGE_SIZE
+            body = json.dumps({"count": len(tags), "results": tags[start:start + registry.PAGE_SIZE]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(registry, "PAGE_SIZE", 2)
+
+
+def write_cache(cache_path, url, age, etag, results):
+    with open(cache_path, "w") as f:
+        json.dump({"url": url, "fetched_at": time.time() - age, "etag": etag, "results": results}, f)
+
+
+def test_fetches_all_pages_and_caches(serve, tmp_path):
+    seen = []
+    url = serve(make_handler(TAGS, '"v1"', seen)) + "/tags"
+    cache_path = str(tmp_path / "cache" / "images.json")
+
+    assert registry.fetch_image_catalog(url, cache_path) == TAGS
+    assert sorted(page for page, _ in seen) == [1, 2, 3]
+    with open(cache_path) as f:
+        cache = json.load(f)
+    assert cache["etag"] == '"v1"' and cache["results"] == TAGS
+
+
+def test_fresh_cache_is_used_without_request(serve, tmp_path):
+    seen = []
+    url = serve(make_handler(TAGS, '"v1"', seen)) + "/tags"
+    cache_path = str(tmp_path / "images.json")
+    write_cache(cache_path, url, 10, '"v1"', TAGS[:1])
+
+    assert registry.fetch_image_catalog(url, cache_path, ttl=3600) == TAGS[:1]
+    assert seen == []
+
+
+def test_stale_cache_revalidated_with_304(serve, tmp_path):
+    seen = []
+    url = serve(make_handler(TAGS, '"v1"', seen)) + "/tags"
+    cache_path = str(tmp_path / "images.json")
+    write_cache(cache_path, url, 7200, '"v1"', TAGS[:1])
+
+    assert registry.fetch_image_catalog(url, cache_path, ttl=3600) == TAGS[:1]
+    assert seen == [(1, '"v1"')]
+    with open(cache_path) as f:
+        assert time.time() - json.load(f)["fetched_at"] < 60
+
+
+def test_stale_cache_refetched_when_changed(serve, tmp_path):
+    seen = []
+    url = serve(make_handler(TAGS, '"v2"', seen)) + "/tags"
+    cache_path = str(tmp_path / "images.json")
+    write_cache(cache_path, url, 7200, '"v1"', TAGS[:1])
+
+    assert registry.fetch_image_catalog(url, cache_path, ttl=3600) == TAGS
+    with open(cache_path) as f:
+        assert json.load(f)["etag"] == '"v2"'
+
+
+def test_refresh_ignores_ttl(serve, tmp_path):
+    seen = []
+    url = serve(make_handler(TAGS, '"v1"', seen)) + "/tags"
+    cache_path = str(tmp_path / "images.json")
+    write_cache(cache_path, url, 10, '"v1"', TAGS)
+
+    assert registry.fetch_image_catalog(url, cache_path, refresh=True) == TAGS
+    assert seen == [(1, '"v1"')]
+
+
+def test_cache_of_another_url_is_ignored(serve, tmp_path):
+    seen = []
+    url = serve(make_handler(TAGS, '"v1"', seen)) + "/tags"
+    cache_path = str(tmp_path / "images.json")
+    write_cache(cache_path, url + "/other", 10, '"v1"', TAGS[:1])
+
+    assert registry.fetch_image_catalog(url, cache_path) == TAGS
+    assert seen[0] == (1, None)
+
+
+def test_unreachable_registry_uses_stale_cache(tmp_path):
+    url = "http://127.0.0.1:1/tags"
+    cache_path = str(tmp_path / "images.json")
+    write_cache(cache_path, url, 7200, '"v1"', TAGS[:1])
+
+    assert registry.fetch_image_catalog(url, cache_path, ttl=3600) == TAGS[:1]
+    with pytest.raises(requests.RequestException):
+        registry.fetch_image_catalog(url, str(tmp_path / "none.json"))